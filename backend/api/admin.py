@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import UploadHistory
+from django.db import transaction
+
+from .aggregation import add_to_rollups
+from .models import UploadHistory, UploadJob
 
 # This tells the Admin panel: "Please show the UploadHistory table!"
 @admin.register(UploadHistory)
@@ -7,3 +10,21 @@ class UploadHistoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'upload_time', 'total_count', 'avg_pressure') # Columns to show in the list
     list_filter = ('upload_time',) # Add a filter sidebar
     ordering = ('-upload_time',) # Newest first
+
+    # Keep the rollups behind history/aggregate/ in step with deletions.
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            add_to_rollups([obj], sign=-1)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            add_to_rollups(queryset.only(*UploadHistory.SUMMARY_FIELDS, 'column_stats'), sign=-1)
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'file_name', 'rows_done', 'created_time')
+    list_filter = ('status',)
+    ordering = ('-created_time',)
@@ -0,0 +1,245 @@
+"""Trends across a user's uploads, bucketed by upload time, and summaries
+of several uploads combined.
+
+Each bucket (an hour, day or week) adds up the uploads in it: the number
+of uploads and rows, each field's average over the values it had and the
+merged type distribution. Buckets are computed either live, with one GROUP BY over
+the summary columns (found through the summary index), or -- with
+``HISTORY_ROLLUPS`` on -- read from ``HistoryRollup`` rows that are
+updated whenever an upload is stored or appended to.
+
+:func:`combine_histories` merges the stored aggregates of any set of
+uploads (see :class:`api.ingest.RunningSummary`) without reading rows.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, F, FloatField, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+
+from .ingest import RunningSummary
+from .models import HistoryRollup, UploadHistory
+
+BUCKETS = {
+    HistoryRollup.HOUR: (TruncHour, timedelta(hours=1)),
+    HistoryRollup.DAY: (TruncDay, timedelta(days=1)),
+    HistoryRollup.WEEK: (TruncWeek, timedelta(weeks=1)),
+}
+AVERAGES = ('flowrate', 'pressure', 'temperature')
+TOTALS = (('uploads', 'total_count') + tuple(f'{field}_sum' for field in AVERAGES)
+          + tuple(f'{field}_count' for field in AVERAGES))
+
+
+def bucket_start(moment, bucket):
+    """Start of the ``bucket`` holding ``moment``, as the database truncates it."""
+    local = timezone.localtime(moment).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    if bucket != HistoryRollup.HOUR:
+        local = local.replace(hour=0)
+    if bucket == HistoryRollup.WEEK:
+        local -= timedelta(days=local.weekday())
+    return timezone.make_aware(local)
+
+
+def bucket_bounds(bucket, start=None, end=None):
+    """First and past-the-end bucket starts of the buckets that overlap
+    ``start`` to ``end``; whole buckets are always counted."""
+    if start is not None:
+        start = bucket_start(start, bucket)
+    if end is not None and bucket_start(end, bucket) != end:
+        end = shift(bucket_start(end, bucket), bucket, -1)
+    return start, end
+
+
+def shift(period, bucket, count):
+    """The start of the bucket ``count`` buckets before ``period`` (after it
+    when ``count`` is negative)."""
+    local = timezone.localtime(period).replace(tzinfo=None)
+    return timezone.make_aware(local - count * BUCKETS[bucket][1])
+
+
+def value_count(history, field):
+    """How many values ``history``'s average of ``field`` is over: the rows
+    that had one, or every row for uploads stored before that was counted."""
+    stats = (history.column_stats or {}).get(field)
+    return stats['count'] if stats else history.total_count
+
+
+def contribution(history, sign=1):
+    """What ``history`` adds to its buckets (``sign=-1`` to take it out)."""
+    totals = {
+        'uploads': sign,
+        'total_count': sign * history.total_count,
+        'type_distribution': {key: sign * count for key, count in history.type_distribution.items()},
+    }
+    for field in AVERAGES:
+        count = value_count(history, field)
+        totals[f'{field}_sum'] = sign * getattr(history, f'avg_{field}') * count
+        totals[f'{field}_count'] = sign * count
+    return totals
+
+
+def add_totals(totals, other):
+    for name in TOTALS:
+        totals[name] += other[name]
+    types = totals['type_distribution']
+    for key, count in other['type_distribution'].items():
+        types[key] = types.get(key, 0) + count
+        if not types[key]:
+            del types[key]
+
+
+def live_buckets(queryset, bucket, by_user=False):
+    """``{(user_id, period) or period: totals}`` grouped in the database."""
+    trunc = BUCKETS[bucket][0]
+    keys = ('user', 'period') if by_user else ('period',)
+    # Each field's value count, as value_count() reads it.
+    counts = {field: Coalesce(Cast(KT(f'column_stats__{field}__count'), BigIntegerField()),
+                              F('total_count'))
+              for field in AVERAGES}
+    sums = {f'{field}_sum': Sum(F(f'avg_{field}') * counts[field], output_field=FloatField())
+            for field in AVERAGES}
+    sums.update({f'{field}_count': Sum(counts[field]) for field in AVERAGES})
+    grouped = (queryset.order_by().annotate(period=trunc('upload_time')).values(*keys)
+               .annotate(uploads=Count('id'), rows=Sum('total_count'), **sums))
+    buckets = {}
+    for row in grouped:
+        key = tuple(row[k] for k in keys) if by_user else row['period']
+        buckets[key] = {**{name: row[name] for name in TOTALS if name != 'total_count'},
+                        'total_count': row['rows'], 'type_distribution': {}}
+    # JSON objects can't be summed portably in SQL; merge them on the way out.
+    distributions = queryset.order_by().annotate(period=trunc('upload_time')).values_list(
+        *keys, 'type_distribution')
+    for *key, types in distributions.iterator():
+        merged = buckets[tuple(key) if by_user else key[0]]['type_distribution']
+        for name, count in (types or {}).items():
+            merged[name] = merged.get(name, 0) + count
+    return buckets
+
+
+def update_rollups(user_id, upload_time, totals):
+    """Add ``totals`` (see :func:`contribution`) to every bucket of ``upload_time``."""
+    if not settings.HISTORY_ROLLUPS:
+        return
+    with transaction.atomic():
+        for bucket in BUCKETS:
+            rollup, _ = HistoryRollup.objects.select_for_update().get_or_create(
+                user_id=user_id, bucket=bucket, period=bucket_start(upload_time, bucket))
+            state = {name: getattr(rollup, name) for name in TOTALS}
+            state['type_distribution'] = dict(rollup.type_distribution)
+            add_totals(state, totals)
+            if state['uploads'] > 0:
+                for name, value in state.items():
+                    setattr(rollup, name, value)
+                rollup.save()
+            else:
+                rollup.delete()
+
+
+def add_to_rollups(histories, sign=1):
+    """Count newly stored ``histories`` in their users' rollups
+    (``sign=-1`` for histories about to be deleted)."""
+    pending = {}
+    for history in histories:
+        if history.user_id is None:
+            continue
+        key = (history.user_id, history.upload_time)
+        if key in pending:
+            add_totals(pending[key], contribution(history, sign))
+        else:
+            pending[key] = contribution(history, sign)
+    for (user_id, upload_time), totals in pending.items():
+        update_rollups(user_id, upload_time, totals)
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the uploads."""
+    with transaction.atomic():
+        HistoryRollup.objects.all().delete()
+        for bucket in BUCKETS:
+            buckets = live_buckets(UploadHistory.objects.exclude(user=None), bucket, by_user=True)
+            HistoryRollup.objects.bulk_create(
+                HistoryRollup(user_id=user_id, bucket=bucket, period=period, **totals)
+                for (user_id, period), totals in buckets.items())
+
+
+def history_buckets(user, bucket, start=None, end=None, window=1):
+    """``user``'s uploads per ``bucket``, for the buckets from ``start`` to ``end``.
+
+    Each bucket carries its averages and the rolling averages over the
+    last ``window`` buckets of time, itself included.
+    """
+    start, end = bucket_bounds(bucket, start, end)
+    if settings.HISTORY_ROLLUPS:
+        rollups = HistoryRollup.objects.filter(user=user, bucket=bucket)
+        if start is not None:
+            rollups = rollups.filter(period__gte=start)
+        if end is not None:
+            rollups = rollups.filter(period__lt=end)
+        buckets = {row['period']: row for row in rollups.values('period', 'type_distribution', *TOTALS)}
+    else:
+        histories = UploadHistory.objects.filter(user=user)
+        if start is not None:
+            histories = histories.filter(upload_time__gte=start)
+        if end is not None:
+            histories = histories.filter(upload_time__lt=end)
+        buckets = live_buckets(histories, bucket)
+
+    periods = sorted(buckets)
+    # The window is counted in wall-clock buckets, like the truncation.
+    tz = timezone.get_current_timezone()
+    local = [period.astimezone(tz).replace(tzinfo=None) for period in periods]
+    span = (window - 1) * BUCKETS[bucket][1]
+    results, first = [], 0
+    rolling = dict.fromkeys(TOTALS, 0)
+    for i, period in enumerate(periods):
+        totals = buckets[period]
+        for name in TOTALS:
+            rolling[name] += totals[name]
+        while local[first] < local[i] - span:
+            for name in TOTALS:
+                rolling[name] -= buckets[periods[first]][name]
+            first += 1
+        results.append({
+            'period': period,
+            'uploads': totals['uploads'],
+            'total_count': totals['total_count'],
+            **averages(totals, 'avg_'),
+            **averages(rolling, 'rolling_avg_'),
+            'type_distribution': totals['type_distribution'],
+        })
+    return results
+
+
+def averages(totals, prefix):
+    return {f'{prefix}{field}': totals[f'{field}_sum'] / count if (count := totals[f'{field}_count']) else 0
+            for field in AVERAGES}
+
+
+def combine_histories(histories):
+    """The summary of the rows of all of ``histories`` together.
+
+    Only the stored aggregates are read. Averages are weighted by each
+    field's value count; ``statistics`` are merged from the stored moments
+    and sketches, and are ``None`` if any upload predates them.
+    """
+    summaries, complete = [], True
+    for history in histories:
+        summary = history.running_summary()
+        if summary is None:
+            complete = False
+            summary = RunningSummary.from_averages(
+                history.total_count,
+                {field: getattr(history, f'avg_{field}') for field in AVERAGES},
+                history.type_distribution)
+        summaries.append(summary)
+    combined = RunningSummary.combine(summaries)
+    return {
+        'total_count': combined.total_count,
+        **{f'avg_{field}': combined.mean(field) for field in AVERAGES},
+        'type_distribution': combined.type_counts,
+        'statistics': combined.statistics() if complete else None,
+        'type_statistics': combined.type_statistics() if complete else None,
+    }
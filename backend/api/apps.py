@@ -2,3 +2,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from .jobs import STARTUP_UID, fail_stale_jobs_on_startup
+        request_started.connect(fail_stale_jobs_on_startup, dispatch_uid=STARTUP_UID)
@@ -0,0 +1,149 @@
+"""Parquet and Arrow IPC uploads and exports.
+
+Typed files skip CSV parsing altogether: record batches are read straight
+into DataFrames (numeric columns without copying where Arrow allows it)
+and folded into the same summary and columnar storage as CSV batches.
+Exports go the other way: stored float columns become Arrow arrays over
+the same memory, and dictionary-encoded columns become Arrow dictionary
+arrays over the stored codes.
+
+pyarrow is pinned in requirements.txt but stays optional here: without
+it typed uploads and exports are refused with
+:class:`ArrowUnavailableError`; CSV uploads don't need it. Like
+:mod:`api.ingest`, this module doesn't touch Django.
+"""
+import io
+import json
+import os
+
+from .parsing import BATCH_ROWS
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: typed uploads and exports are unavailable
+    pa = None
+
+PARQUET = 'parquet'
+ARROW = 'arrow'
+ARROW_STREAM = 'arrows'
+
+CONTENT_TYPES = {
+    PARQUET: 'application/vnd.apache.parquet',
+    ARROW: 'application/vnd.apache.arrow.file',
+    ARROW_STREAM: 'application/vnd.apache.arrow.stream',
+}
+EXTENSIONS = {PARQUET: '.parquet', ARROW: '.arrow', ARROW_STREAM: '.arrows'}
+# File names accepted inside ZIP batches besides ``.csv``.
+UPLOAD_EXTENSIONS = ('.parquet', '.arrow', '.arrows', '.feather', '.ipc')
+
+# Arrow IPC streams start with a continuation marker, then a message length.
+STREAM_MARKER = b'\xff\xff\xff\xff'
+
+
+class ArrowUnavailableError(ValueError):
+    """A Parquet or Arrow file was sent (or asked for) but pyarrow isn't installed."""
+
+    def __init__(self, kind):
+        super().__init__(f'{kind.capitalize()} files need pyarrow, which is not installed on the server')
+
+
+def sniff_format(source):
+    """``PARQUET``, ``ARROW`` or ``ARROW_STREAM`` from a file's first bytes,
+    or ``None`` for anything else (taken to be CSV)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            head = f.read(8)
+    elif isinstance(source, bytes):
+        head = source[:8]
+    else:
+        position = source.tell()
+        head = source.read(8)
+        source.seek(position)
+    if head.startswith(b'PAR1'):
+        return PARQUET
+    if head.startswith(b'ARROW1'):
+        return ARROW
+    if head.startswith(STREAM_MARKER) and len(head) == 8:
+        return ARROW_STREAM
+    return None
+
+
+def _input(source):
+    """An Arrow input over ``source`` that doesn't copy it where possible."""
+    if isinstance(source, (str, os.PathLike)):
+        return pa.memory_map(os.fspath(source))
+    if isinstance(source, bytes):
+        return pa.BufferReader(source)
+    if hasattr(source, 'temporary_file_path'):
+        return pa.memory_map(source.temporary_file_path())
+    return pa.BufferReader(source.read())
+
+
+def _record_batches(source, kind):
+    if kind == PARQUET:
+        yield from pq.ParquetFile(_input(source)).iter_batches(batch_size=BATCH_ROWS)
+    elif kind == ARROW:
+        reader = ipc.open_file(_input(source))
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    else:
+        yield from ipc.open_stream(_input(source))
+
+
+def read_frames(source, kind, batch_rows=BATCH_ROWS):
+    """Yield a Parquet or Arrow file as DataFrames of at most ``batch_rows`` rows.
+
+    Numeric columns keep their dtype; dictionary (categorical) columns are
+    decoded, so the frames look like parsed CSV batches with typed numbers.
+    """
+    if pa is None:
+        raise ArrowUnavailableError(kind)
+    for batch in _record_batches(source, kind):
+        for start in range(0, batch.num_rows, batch_rows):
+            part = batch.slice(start, batch_rows)
+            columns = [column.dictionary_decode() if pa.types.is_dictionary(column.type) else column
+                       for column in part.columns]
+            # Slices share the batch's buffers; split blocks keep numeric
+            # columns from being copied into one consolidated block.
+            yield pa.RecordBatch.from_arrays(columns, names=part.schema.names).to_pandas(
+                split_blocks=True)
+
+
+def dataset_table(dataset, metadata=None):
+    """A ``pyarrow.Table`` of a ``StoredDataset``.
+
+    Numeric columns are float64, every other column a dictionary array
+    over the stored codes (missing cells are null). ``metadata`` is stored
+    as JSON under the ``summary`` key of the schema metadata.
+    """
+    if pa is None:
+        raise ArrowUnavailableError(ARROW)
+    arrays = []
+    for name in dataset.columns:
+        values = dataset.values(name)
+        if dataset.is_numeric(name):
+            arrays.append(pa.array(values))
+        else:
+            missing = values < 0
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(values, mask=missing if missing.any() else None),
+                pa.array(dataset.dictionary(name).tolist(), type=pa.string())))
+    schema_metadata = {'summary': json.dumps(metadata)} if metadata is not None else None
+    return pa.Table.from_arrays(arrays, names=list(dataset.columns), metadata=schema_metadata)
+
+
+def export_dataset(dataset, kind, metadata=None):
+    """The stored rows as a Parquet file or an Arrow IPC file or stream (bytes)."""
+    if pa is None:
+        raise ArrowUnavailableError(kind)
+    table = dataset_table(dataset, metadata)
+    sink = io.BytesIO()
+    if kind == PARQUET:
+        pq.write_table(table, sink)
+    else:
+        new_writer = ipc.new_file if kind == ARROW else ipc.new_stream
+        with new_writer(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=BATCH_ROWS)
+    return sink.getvalue()
@@ -0,0 +1,132 @@
+"""HTTP and server-side caching for the history endpoints.
+
+ETags and Last-Modified dates come from small summary queries, so a
+client holding a current copy gets a 304 without the stored rows ever
+being read or serialized. Rendered responses are also kept in the
+``history`` cache, keyed by that same ETag, so repeated dashboard
+refreshes skip SQLite and the serializer as well.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import UploadHistory
+
+
+def history_list_state(request, *args, **kwargs):
+    # The ETag and Last-Modified functions share one query per request.
+    if not hasattr(request, '_history_list_state'):
+        request._history_list_state = UploadHistory.objects.filter(user=request.user).aggregate(
+            count=Count('id'), last_id=Max('id'), latest=Max('last_modified'))
+    return request._history_list_state
+
+
+def history_list_etag(request, *args, **kwargs):
+    state = history_list_state(request)
+    latest = state['latest'].timestamp() if state['latest'] else 0
+    return f'"list-{request.user.pk}-{state["count"]}-{state["last_id"] or 0}-{latest}"'
+
+
+def history_list_last_modified(request, *args, **kwargs):
+    return history_list_state(request)['latest']
+
+
+def history_detail_time(request, pk, *args, **kwargs):
+    if not request.user.is_authenticated:
+        # Signed chart URLs are checked per object, after this runs.
+        return None
+    if not hasattr(request, '_history_detail_time'):
+        request._history_detail_time = (UploadHistory.objects.filter(user=request.user, pk=pk)
+                                        .values_list('last_modified', flat=True).first())
+    return request._history_detail_time
+
+
+def history_detail_etag(request, pk, *args, **kwargs):
+    last_modified = history_detail_time(request, pk)
+    if last_modified is None:
+        return None
+    return f'"history-{pk}-{last_modified.timestamp()}"'
+
+
+history_list_condition = method_decorator(
+    condition(etag_func=history_list_etag, last_modified_func=history_list_last_modified), name='get')
+
+history_detail_condition = method_decorator(
+    condition(etag_func=history_detail_etag, last_modified_func=history_detail_time), name='get')
+
+
+class CacheControlMixin:
+    """Adds ``Cache-Control`` and ``Vary: Authorization`` to successful GETs.
+
+    Responses are per user, so they are always marked private.
+    """
+    cache_control = {'no_cache': True}
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            patch_cache_control(response, private=True, **self.cache_control)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+def history_cache():
+    return caches[settings.HISTORY_RESPONSE_CACHE]
+
+
+def _generation_key(user_id):
+    return f'history-generation:{user_id}'
+
+
+def invalidate_history_cache(user):
+    """Drop every cached history response of ``user`` (call after writes)."""
+    cache = history_cache()
+    try:
+        cache.incr(_generation_key(user.pk))
+    except ValueError:
+        cache.set(_generation_key(user.pk), 1, None)
+
+
+class ResponseCacheMixin:
+    """Serves rendered GET responses from the per-user history cache.
+
+    ``etag_func`` identifies the current state of the data, so an entry can
+    never outlive the rows it was built from; bumping the user's generation
+    with :func:`invalidate_history_cache` drops everything at once.
+    Responses larger than ``HISTORY_RESPONSE_CACHE_MAX_BYTES`` aren't kept.
+    Keys include the scheme and host, which absolute URLs in the body
+    (``thumbnail_url``) are built from.
+    """
+    etag_func = None
+
+    def response_cache_key(self, request, *args, **kwargs):
+        etag = type(self).etag_func(request, *args, **kwargs)
+        if etag is None:
+            return None
+        generation = history_cache().get(_generation_key(request.user.pk), 0)
+        raw = f'{request.user.pk}:{generation}:{etag}:{request.accepted_media_type}:{request.build_absolute_uri()}'
+        return f'history-response:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get(self, request, *args, **kwargs):
+        self._response_cache_key = self.response_cache_key(request, *args, **kwargs)
+        cached = history_cache().get(self._response_cache_key) if self._response_cache_key else None
+        if cached is not None:
+            self._response_cache_key = None
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key and response.status_code == 200 and hasattr(response, 'render'):
+            response.render()
+            if len(response.content) <= settings.HISTORY_RESPONSE_CACHE_MAX_BYTES:
+                history_cache().set(key, (response.content, response['Content-Type']))
+        return response
@@ -0,0 +1,83 @@
+"""Charts of an upload's summary as PNG or SVG images.
+
+Figures are drawn with matplotlib's object API on the Agg canvas, never
+through pyplot, so no global figure state is shared between renders.
+Inputs are plain data (see :func:`chart_data`), which lets the renders run
+in worker processes; like :mod:`api.ingest`, this module doesn't touch
+Django.
+"""
+import io
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+TYPES = 'types'
+HISTOGRAM = 'histogram'
+CHARTS = (TYPES, HISTOGRAM)
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# Fixed sizes (pixels) keep the number of cached images per chart small.
+SIZES = {'thumb': (160, 160), 'medium': (400, 400), 'large': (640, 640)}
+DPI = 100
+
+# The palette of the web client's EquipmentChart.
+COLORS = ('#ff6384', '#36a2eb', '#ffce56', '#4bc0c0', '#9966ff', '#ff9f40')
+TITLES = {
+    TYPES: 'Equipment Type Distribution',
+    'flowrate': 'Flowrate',
+    'pressure': 'Pressure',
+    'temperature': 'Temperature',
+}
+
+
+def chart_data(chart, summary, field=None):
+    """What :func:`render_chart` needs from an upload's summary.
+
+    ``summary`` has the upload's ``type_distribution`` or ``statistics``
+    (as serialized); returns ``None`` when there is nothing to draw.
+    """
+    if chart == TYPES:
+        return {'counts': summary['type_distribution']} if summary.get('type_distribution') else None
+    statistics = (summary.get('statistics') or {}).get(field)
+    if not statistics or statistics.get('histogram') is None:
+        return None
+    return {'field': field, **statistics['histogram']}
+
+
+def render_chart(chart, data, image_format='png', size='large'):
+    """Draw ``chart`` from :func:`chart_data` output; returns the image bytes.
+
+    Thumbnails leave out titles, labels and axes.
+    """
+    width, height = SIZES[size]
+    thumbnail = size == 'thumb'
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    if chart == TYPES:
+        labels, values = list(data['counts']), list(data['counts'].values())
+        total = sum(values)
+        axes.pie(values, labels=None if thumbnail else labels, startangle=90,
+                 colors=[COLORS[i % len(COLORS)] for i in range(len(values))],
+                 wedgeprops={'linewidth': 1, 'edgecolor': 'white'},
+                 # Exact counts rather than percentages, as the desktop client shows.
+                 autopct=None if thumbnail else (lambda pct: f'{round(pct / 100 * total)}'))
+        axes.set_aspect('equal')
+    else:
+        edges, counts = data['edges'], data['counts']
+        axes.stairs(counts, edges, fill=True, color=COLORS[1])
+        if not thumbnail:
+            axes.set_xlabel(TITLES[data['field']])
+            axes.set_ylabel('Rows')
+    if thumbnail:
+        axes.set_axis_off()
+        figure.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98)
+    else:
+        axes.set_title(TITLES[TYPES] if chart == TYPES else f"{TITLES[data['field']]} Distribution")
+        figure.tight_layout()
+    buffer = io.BytesIO()
+    # A fixed salt keeps SVG element ids, and so the bytes, stable across renders.
+    with matplotlib.rc_context({'svg.hashsalt': 'chart'}):
+        figure.savefig(buffer, format=image_format,
+                       metadata={'Software': None} if image_format == 'png' else {'Date': None, 'Creator': None})
+    return buffer.getvalue()
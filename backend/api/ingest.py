@@ -0,0 +1,269 @@
+"""Streaming CSV ingestion for equipment uploads.
+
+Uploaded files are parsed in bounded batches of rows and folded into
+running aggregates in a single pass, so the parser never holds more than
+one batch of the file in memory at a time. How a file is read -- its
+encoding, delimiter, column names and units -- is worked out once per file
+by :mod:`api.parsing`; each batch is then reduced with vectorized helpers.
+Parquet and Arrow files (:mod:`api.arrow`) arrive as typed batches and
+take the same path from there.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from .arrow import read_frames, sniff_format
+from .parsing import BATCH_ROWS, TYPE_FIELD, ParseReport, Schema, read_csv
+from .sketches import QUANTILES, Moments, TDigest, grouped_moments
+from .storage import ColumnarWriter
+
+
+def count_types(column):
+    """Count equipment types, preserving the order of first appearance."""
+    counts = pd.Series(column).value_counts(sort=False)
+    return {str(key): int(value) for key, value in counts.items()}
+
+
+class RunningSummary:
+    """Aggregates that can be updated one batch of rows at a time.
+
+    Besides the averages it keeps, per summary field, the moments and a
+    t-digest of the values, and the moments of each equipment type's
+    values; all of them merge, so appended rows update them exactly (the
+    quantiles approximately).
+    """
+
+    FIELDS = ('flowrate', 'pressure', 'temperature')
+
+    def __init__(self):
+        self.total_count = 0
+        self.moments = {field: Moments() for field in self.FIELDS}
+        self.digests = {field: TDigest() for field in self.FIELDS}
+        self.type_counts = {}
+        self.type_moments = {}
+
+    def add_frame(self, frame, schema=None, report=None):
+        """Fold in a DataFrame of rows with the cells as uploaded.
+
+        ``schema`` (a resolved :class:`api.parsing.Schema`) says which
+        columns to read; cells that aren't numbers are left out and counted
+        in ``report``.
+        """
+        if schema is None:
+            schema = Schema.for_columns(frame.columns)
+        self.total_count += len(frame)
+        type_column = schema.columns.get(TYPE_FIELD)
+        types = frame[type_column] if type_column is not None else None
+        groups = pd.factorize(types) if types is not None else None
+        for field in self.FIELDS:
+            if field in schema.columns:
+                self.add_values(field, schema.numbers(frame, field, report), groups)
+        if types is not None:
+            self.add_types(count_types(types))
+
+    def add_values(self, field, values, groups=None):
+        """Fold in a field's values; ``groups`` is the factorized type column.
+
+        NaNs (missing or unreadable cells) and infinities are skipped.
+        """
+        present = np.isfinite(values)
+        if not present.all():
+            values = values[present]
+            if groups is not None:
+                groups = (groups[0][present], groups[1])
+        self.moments[field].add(values)
+        self.digests[field].add(values)
+        if groups is not None and len(values):
+            self.add_type_moments({equip_type: {field: moments}
+                                   for equip_type, moments in grouped_moments(values, *groups).items()})
+
+    def add_types(self, counts):
+        for equip_type, count in counts.items():
+            self.type_counts[equip_type] = self.type_counts.get(equip_type, 0) + count
+
+    def add_type_moments(self, type_moments):
+        for equip_type, fields in type_moments.items():
+            merged = self.type_moments.setdefault(equip_type, {})
+            for field, moments in fields.items():
+                merged.setdefault(field, Moments()).merge(moments)
+
+    def merge(self, other):
+        """Fold in the aggregates of another ``RunningSummary``."""
+        self.total_count += other.total_count
+        for field in self.FIELDS:
+            self.moments[field].merge(other.moments[field])
+            self.digests[field].merge(other.digests[field])
+        self.add_types(other.type_counts)
+        self.add_type_moments(other.type_moments)
+
+    @classmethod
+    def combine(cls, summaries):
+        """One summary of all of ``summaries``; each digest is compressed once."""
+        summaries = list(summaries)
+        combined = cls()
+        for summary in summaries:
+            combined.total_count += summary.total_count
+            for field in cls.FIELDS:
+                combined.moments[field].merge(summary.moments[field])
+            combined.add_types(summary.type_counts)
+            combined.add_type_moments(summary.type_moments)
+        for field in cls.FIELDS:
+            combined.digests[field] = TDigest.combine(summary.digests[field] for summary in summaries)
+        return combined
+
+    def mean(self, field):
+        return self.moments[field].mean
+
+    def statistics(self):
+        """Per-field statistics for the fields the rows had, for clients."""
+        statistics = {}
+        for field in self.FIELDS:
+            moments, digest = self.moments[field], self.digests[field]
+            if moments.count:
+                statistics[field] = {
+                    **moments.describe(),
+                    'quantiles': {f'p{round(q * 100)}': digest.quantile(q) for q in QUANTILES},
+                    'histogram': digest.histogram(),
+                }
+        return statistics
+
+    def type_statistics(self):
+        """Per-type statistics of each field, for clients."""
+        return {equip_type: {field: moments.describe() for field, moments in fields.items()}
+                for equip_type, fields in self.type_moments.items()}
+
+    @staticmethod
+    def has_sketches(column_stats):
+        """Whether ``column_stats`` was stored with more than count and sum."""
+        return bool(column_stats) and all('digest' in stats for stats in column_stats.values())
+
+    @classmethod
+    def from_averages(cls, total_count, averages, type_distribution):
+        """What the summary fields alone tell: each field's average over
+        ``total_count`` rows, without spread, extremes or sketches."""
+        summary = cls()
+        summary.total_count = total_count
+        for field, average in averages.items():
+            summary.moments[field] = Moments(total_count, average * total_count)
+        summary.add_types(type_distribution)
+        return summary
+
+    @classmethod
+    def from_model(cls, total_count, column_stats, type_distribution, type_stats):
+        """Rebuild the summary stored on an ``UploadHistory``."""
+        summary = cls()
+        summary.total_count = total_count
+        for field, stats in column_stats.items():
+            moments = summary.moments[field] = Moments.from_dict(stats)
+            if 'digest' in stats:
+                summary.digests[field] = TDigest.from_dict(stats['digest'], moments.minimum,
+                                                           moments.maximum)
+        summary.add_types(type_distribution)
+        summary.type_moments = {
+            equip_type: {field: Moments.from_dict(stats) for field, stats in fields.items()}
+            for equip_type, fields in type_stats.items()
+        }
+        return summary
+
+    def as_model_fields(self):
+        """Keyword arguments for creating an ``UploadHistory`` row."""
+        return {
+            'total_count': self.total_count,
+            'avg_flowrate': self.mean('flowrate'),
+            'avg_pressure': self.mean('pressure'),
+            'avg_temperature': self.mean('temperature'),
+            'type_distribution': self.type_counts,
+            # Mergeable state behind the averages and statistics, so appends
+            # can update them without reading the stored rows.
+            'column_stats': {
+                field: {**self.moments[field].to_dict(), 'digest': self.digests[field].to_dict()}
+                for field in self.FIELDS
+            },
+            'type_stats': {
+                equip_type: {field: moments.to_dict() for field, moments in fields.items()}
+                for equip_type, fields in self.type_moments.items()
+            },
+        }
+
+
+def ingest_csv(file_obj, on_batch=None, schema=None, report=None, batch_rows=BATCH_ROWS):
+    """Parse ``file_obj`` in one streaming pass and return a ``RunningSummary``.
+
+    ``on_batch`` is called with every parsed batch (a DataFrame of the
+    cells as uploaded), which lets the caller decide what, if anything, to
+    keep. ``schema`` fixes any part of how the file is read; the rest is
+    inferred. What couldn't be read is counted in ``report`` (a
+    :class:`api.parsing.ParseReport`).
+    """
+    report = report if report is not None else ParseReport()
+    summary = RunningSummary()
+    for batch in read_csv(file_obj, schema, report, batch_rows=batch_rows):
+        summary.add_frame(batch, report.schema, report)
+        if on_batch is not None:
+            on_batch(batch)
+    return summary
+
+
+def ingest_frames(frames, on_batch=None, schema=None, report=None):
+    """Like :func:`ingest_csv`, for DataFrames that are already split into
+    (possibly typed) columns; only the column mapping and units of
+    ``schema`` apply."""
+    report = report if report is not None else ParseReport()
+    summary = RunningSummary()
+    for frame in frames:
+        if report.schema is None:
+            report.schema = (schema or Schema()).resolve_columns(frame.columns)
+        summary.add_frame(frame, report.schema, report)
+        if on_batch is not None:
+            on_batch(frame)
+    return summary
+
+
+def summarize_dataset(dataset, schema=None):
+    """A ``RunningSummary`` of rows that are already stored (a ``StoredDataset``).
+
+    ``schema`` is the :class:`api.parsing.Schema` the rows were uploaded
+    with, if known.
+    """
+    summary = RunningSummary()
+    schema = (schema or Schema(encoding='utf-8', delimiter=',')).resolve_columns(dataset.columns)
+    wanted = set(schema.columns.values())
+    summary.add_frame(pd.DataFrame({column: dataset.strings(column)
+                                    for column in dataset.columns if column in wanted},
+                                   index=pd.RangeIndex(dataset.row_count)), schema)
+    return summary
+
+
+def parse_upload(source, on_batch=None, schema=None):
+    """Ingest and encode a whole file; returns ``(summary, raw_columns, diagnostics)``.
+
+    The file is a CSV unless it starts like a Parquet or Arrow IPC file.
+    ``source`` is a file object, a path or the file's bytes, and ``schema``
+    a dict for :meth:`api.parsing.Schema.from_dict`. ``diagnostics`` is the
+    schema used and what couldn't be read. This module doesn't touch
+    Django, so the function can run in worker processes.
+    """
+    kind = sniff_format(source)
+    if isinstance(source, bytes) and kind is None:
+        source = io.BytesIO(source)
+    if schema is not None:
+        schema = Schema.from_dict(schema)
+    report = ParseReport()
+    writer = ColumnarWriter()
+
+    def collect(batch):
+        writer.add_batch(batch)
+        if on_batch is not None:
+            on_batch(batch)
+
+    if kind is None:
+        summary = ingest_csv(source, on_batch=collect, schema=schema, report=report)
+    else:
+        report.format = kind
+        summary = ingest_frames(read_frames(source, kind), on_batch=collect, schema=schema,
+                                report=report)
+    # The summary columns, under whatever name they were uploaded, get a
+    # stored sort order for the rows endpoint.
+    index_columns = report.schema.field_columns() if report.schema is not None else ()
+    return summary, writer.to_bytes(index_columns), report.as_dict()
@@ -0,0 +1,153 @@
+"""Background processing for uploads (``POST upload/?async=1``).
+
+The request only spools the file to disk and records an ``UploadJob``;
+parsing and storage run on a small in-process thread pool, so a large
+upload never holds a web worker for longer than the copy takes. Clients
+poll ``jobs/<id>/`` for progress and the resulting ``history_id``.
+
+Queued jobs only live in the memory of the process that queued them. The
+first request a process serves marks the jobs that a stopped process
+left behind as failed (see :func:`fail_stale_jobs`).
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import UploadJob
+from .uploads import find_duplicate, record_upload
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_JOB_WORKERS,
+                                           thread_name_prefix='upload-job')
+        return _executor
+
+
+def submit_upload(user, uploaded_file, content_hash='', schema=None):
+    """Spool ``uploaded_file`` to disk and queue it; returns the new ``UploadJob``.
+
+    A file ``user`` already uploaded gets a job that is done from the start
+    and points at the earlier upload.
+    """
+    duplicate = find_duplicate(user, content_hash)
+    if duplicate is not None:
+        return UploadJob.objects.create(
+            user=user,
+            status=UploadJob.DONE,
+            file_name=(uploaded_file.name or '')[:255],
+            bytes_total=uploaded_file.size or 0,
+            bytes_done=uploaded_file.size or 0,
+            rows_done=duplicate.total_count,
+            history=duplicate,
+        )
+
+    # The suffix is kept for anyone looking at the spool directory; the
+    # format itself is sniffed from the content.
+    suffix = os.path.splitext(uploaded_file.name or '')[1]
+    spool = tempfile.NamedTemporaryFile(prefix='upload-', suffix=suffix, delete=False,
+                                        dir=settings.UPLOAD_SPOOL_DIR)
+    with spool:
+        for chunk in uploaded_file.chunks():
+            spool.write(chunk)
+
+    job = UploadJob.objects.create(
+        user=user,
+        file_name=(uploaded_file.name or '')[:255],
+        bytes_total=uploaded_file.size or 0,
+    )
+    # Don't let the worker look for a job the request hasn't committed yet.
+    transaction.on_commit(
+        lambda: get_executor().submit(run_upload_job, job.pk, spool.name, content_hash, schema))
+    return job
+
+
+def run_upload_job(job_id, path, content_hash='', schema=None):
+    """Parse a spooled upload and record the outcome on its job.
+
+    Whatever goes wrong, the job ends up failed rather than running forever.
+    """
+    close_old_connections()
+    try:
+        job = UploadJob.objects.select_related('user').get(pk=job_id)
+        job.status = UploadJob.RUNNING
+        job.save(update_fields=['status', 'updated_time'])
+        with open(path, 'rb') as f:
+            def progress(batch):
+                job.rows_done += len(batch)
+                job.bytes_done = min(f.tell(), job.bytes_total)
+                job.save(update_fields=['rows_done', 'bytes_done', 'updated_time'])
+
+            job.history = record_upload(job.user, f, on_batch=progress,
+                                        content_hash=content_hash, schema=schema)
+        job.status = UploadJob.DONE
+        job.bytes_done = job.bytes_total
+        job.save()
+    except ValueError as e:
+        # The file itself can't be used (empty, unreadable, bad schema).
+        logger.info('Upload job %s failed: %s', job_id, e)
+        mark_failed(job_id, e)
+    except Exception as e:
+        logger.exception('Upload job %s failed', job_id)
+        mark_failed(job_id, e)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        connection.close()
+
+
+def mark_failed(job_id, error):
+    try:
+        UploadJob.objects.filter(pk=job_id).update(
+            status=UploadJob.FAILED, error=str(error) or type(error).__name__, updated_time=timezone.now())
+    except DatabaseError:
+        logger.exception('Could not mark upload job %s as failed', job_id)
+
+
+def fail_stale_jobs():
+    """Mark pending or running jobs that nothing is working on as failed.
+
+    A job is stale once it has gone ``UPLOAD_JOB_STALE_AFTER`` seconds
+    without an update; a running job saves its progress with every parsed
+    batch, so the jobs of other processes that are still up are left alone.
+    Returns how many jobs were marked.
+    """
+    now = timezone.now()
+    count = UploadJob.objects.filter(
+        status__in=(UploadJob.PENDING, UploadJob.RUNNING),
+        updated_time__lt=now - timedelta(seconds=settings.UPLOAD_JOB_STALE_AFTER),
+    ).update(status=UploadJob.FAILED, error='The server stopped before the upload was processed',
+             updated_time=now)
+    if count:
+        logger.warning('Marked %d stale upload jobs as failed', count)
+    return count
+
+
+STARTUP_UID = 'api.jobs.fail_stale_jobs_on_startup'
+
+
+def fail_stale_jobs_on_startup(sender, **kwargs):
+    """``request_started`` receiver that runs :func:`fail_stale_jobs` once per process."""
+    request_started.disconnect(dispatch_uid=STARTUP_UID)
+    try:
+        fail_stale_jobs()
+    except DatabaseError:
+        logger.exception('Could not check for stale upload jobs')
+
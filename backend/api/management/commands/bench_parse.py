@@ -0,0 +1,117 @@
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from api.ingest import ingest_csv
+from api.parsing import ParseReport
+
+from .bench_summary import write_sample_csv
+
+COLUMNS = {'flowrate': 'Flowrate', 'pressure': 'Pressure', 'temperature': 'Temperature'}
+EUROPEAN_COLUMNS = {'flowrate': 'Flowrate (m3/h)', 'pressure': 'Pressure (bar)', 'temperature': 'Temperature (°C)'}
+
+
+def per_row_parse(path, encoding, delimiter, decimal, columns):
+    """DictReader with the dialect and columns known up front, float() per
+    cell and a try/except to collect the bad ones."""
+    sums = dict.fromkeys(columns, 0.0)
+    counts = dict.fromkeys(columns, 0)
+    bad = []
+    rows = 0
+    with open(path, encoding=encoding, newline='') as f:
+        for number, row in enumerate(csv.DictReader(f, delimiter=delimiter), 1):
+            rows += 1
+            for field, column in columns.items():
+                cell = row[column]
+                try:
+                    value = float(cell.replace(',', '.') if decimal == ',' else cell)
+                except ValueError:
+                    if cell.strip():
+                        bad.append((number, column, cell))
+                    continue
+                sums[field] += value
+                counts[field] += 1
+    averages = {field: sums[field] / counts[field] if counts[field] else 0 for field in columns}
+    return rows, averages, len(bad)
+
+
+def parser_parse(path):
+    report = ParseReport()
+    with open(path, 'rb') as f:
+        summary = ingest_csv(f, report=report)
+    averages = {field: summary.mean(field) for field in COLUMNS}
+    return summary.total_count, averages, sum(report.bad_values.values())
+
+
+def damage_sample_csv(path, fraction, european, seed=0):
+    """Replace ``fraction`` of the numeric cells with junk, optionally
+    rewriting the file as Latin-1, ``;``-separated and with decimal commas."""
+    frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+    rng = np.random.default_rng(seed)
+    for column in COLUMNS.values():
+        frame.loc[rng.random(len(frame)) < fraction, column] = 'n/a'
+    if european:
+        for column in COLUMNS.values():
+            frame[column] = frame[column].str.replace('.', ',', regex=False)
+        frame = frame.rename(columns={'Equipment Name': 'Équipement',
+                                      **{COLUMNS[field]: name for field, name in EUROPEAN_COLUMNS.items()}})
+        frame.to_csv(path, index=False, sep=';', encoding='latin-1')
+    else:
+        frame.to_csv(path, index=False)
+
+
+class Command(BaseCommand):
+    help = "Benchmark csv.DictReader with per-cell float() against the typed CSV parser."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--csv', help="Use an existing comma-separated UTF-8 CSV instead of generating one.")
+        parser.add_argument('--bad', type=float, default=0.001,
+                            help="Fraction of numeric cells to replace with junk.")
+        parser.add_argument('--european', action='store_true',
+                            help="Write the sample as Latin-1 with ';' and decimal commas.")
+
+    def handle(self, *args, **options):
+        path = options['csv']
+        tmp = None
+        if not path:
+            tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+            tmp.close()
+            path = tmp.name
+            self.stdout.write(f"Writing {options['rows']:,} rows to {path} ...")
+            write_sample_csv(path, options['rows'])
+            damage_sample_csv(path, options['bad'], options['european'])
+
+        if options['european'] and tmp is not None:
+            dialect = ('latin-1', ';', ',', EUROPEAN_COLUMNS)
+        else:
+            dialect = ('utf-8', ',', '.', COLUMNS)
+        try:
+            self.stdout.write(f"CSV size: {os.path.getsize(path) / 1e6:.1f} MB")
+            results = {}
+            for name, func in (('DictReader + float()', lambda: per_row_parse(path, *dialect)),
+                               ('typed parser (inferred schema)', lambda: parser_parse(path))):
+                start = time.perf_counter()
+                results[name] = func()
+                elapsed = time.perf_counter() - start
+                rows, _, bad = results[name]
+                self.stdout.write(f"{name:32s} {elapsed:8.3f} s  {rows / elapsed:12,.0f} rows/s  "
+                                  f"{bad:,} bad cells")
+
+            baseline = next(iter(results.values()))
+            for name, (rows, averages, bad) in results.items():
+                if (rows, bad) != (baseline[0], baseline[2]):
+                    self.stderr.write(f"{name}: {rows} rows, {bad} bad cells "
+                                      f"(vs {baseline[0]}, {baseline[2]})")
+                for field, average in averages.items():
+                    if not np.isclose(average, baseline[1][field]):
+                        self.stderr.write(f"{name}: {field} average differs "
+                                          f"({average} vs {baseline[1][field]})")
+        finally:
+            if tmp is not None:
+                os.unlink(path)
@@ -0,0 +1,76 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.ingest import parse_upload
+from api.renderers import FastJSONRenderer, orjson
+from api.storage import StoredDataset
+
+from .bench_summary import write_sample_csv
+
+
+def timed(func, repeat):
+    """Median wall time of ``func()`` in seconds, and its last result."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+class Command(BaseCommand):
+    help = ("Benchmark rendering an upload's raw_data with DRF's JSONRenderer "
+            "against FastJSONRenderer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000)
+        parser.add_argument('--csv', help="Use an existing CSV instead of generating one.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        path = options['csv']
+        tmp = None
+        if not path:
+            tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+            tmp.close()
+            path = tmp.name
+            write_sample_csv(path, options['rows'])
+
+        try:
+            summary, blob, _ = parse_upload(path)
+        finally:
+            if tmp is not None:
+                os.unlink(path)
+
+        rows = summary.total_count
+        repeat = options['repeat']
+        self.stdout.write(f"{rows:,} rows, orjson {'available' if orjson else 'not installed'}")
+
+        # Each run starts from the stored blob, as a request would.
+        cases = (
+            ('JSONRenderer (list of dicts)',
+             lambda: JSONRenderer().render({'raw_data': StoredDataset(blob).to_rows()})),
+            ('FastJSONRenderer (columnar)',
+             lambda: FastJSONRenderer().render({'raw_data': StoredDataset(blob).window()})),
+        )
+        outputs = {}
+        for name, func in cases:
+            elapsed, outputs[name] = timed(func, repeat)
+            size_mb = len(outputs[name]) / 1e6
+            tracemalloc.start()
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            self.stdout.write(f"{name:30s} {elapsed:8.3f} s  {rows / elapsed:12,.0f} rows/s  "
+                              f"{size_mb / elapsed:8.1f} MB/s, peak {peak_mb:8.1f} MB")
+
+        expected, *others = (json.loads(content) for content in outputs.values())
+        if any(other != expected for other in others):
+            self.stderr.write("Renderers produced different JSON")
@@ -0,0 +1,108 @@
+import csv
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from api.ingest import ingest_csv
+
+
+def per_row_summary(path):
+    """The original upload path: DictReader, float() per cell and statistics.mean."""
+    with open(path, 'rb') as f:
+        reader = csv.DictReader(io.StringIO(f.read().decode('utf-8')))
+        data = []
+        pressures, temperatures, flowrates = [], [], []
+        for row in reader:
+            data.append(row)
+            if 'Pressure' in row:
+                pressures.append(float(row['Pressure']))
+            if 'Temperature' in row:
+                temperatures.append(float(row['Temperature']))
+            if 'Flowrate' in row:
+                flowrates.append(float(row['Flowrate']))
+            elif 'Concentration' in row:
+                flowrates.append(float(row['Concentration']))
+    type_counts = {}
+    for row in data:
+        if 'Type' in row:
+            type_counts[row['Type']] = type_counts.get(row['Type'], 0) + 1
+    return {
+        'total_count': len(data),
+        'avg_flowrate': statistics.mean(flowrates) if flowrates else 0,
+        'avg_pressure': statistics.mean(pressures) if pressures else 0,
+        'avg_temperature': statistics.mean(temperatures) if temperatures else 0,
+        'type_distribution': type_counts,
+    }
+
+
+def streaming_summary(path):
+    with open(path, 'rb') as f:
+        return ingest_csv(f).as_model_fields()
+
+
+def write_sample_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    types = np.array(['Pump', 'Valve', 'Compressor', 'HeatExchanger', 'Reactor', 'Condenser'])
+    pd.DataFrame({
+        'Equipment Name': np.char.add('EQ-', np.arange(rows).astype(str)),
+        'Type': types[rng.integers(0, len(types), rows)],
+        'Flowrate': rng.uniform(50, 250, rows).round(1),
+        'Pressure': rng.uniform(2, 15, rows).round(2),
+        'Temperature': rng.uniform(80, 200, rows).round(1),
+    }).to_csv(path, index=False)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the per-row summary path against the streaming engine on a synthetic CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--csv', help="Use an existing CSV instead of generating one.")
+        parser.add_argument('--no-memory', action='store_true',
+                            help="Skip tracemalloc, which slows down the per-row path.")
+
+    def handle(self, *args, **options):
+        path = options['csv']
+        tmp = None
+        if not path:
+            tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+            tmp.close()
+            path = tmp.name
+            self.stdout.write(f"Writing {options['rows']:,} rows to {path} ...")
+            write_sample_csv(path, options['rows'])
+
+        try:
+            size_mb = os.path.getsize(path) / 1e6
+            self.stdout.write(f"CSV size: {size_mb:.1f} MB")
+            results = {}
+            for name, func in (('per-row (DictReader + statistics)', per_row_summary),
+                               ('vectorized (streaming batches)', streaming_summary)):
+                if not options['no_memory']:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                results[name] = func(path)
+                elapsed = time.perf_counter() - start
+                peak = ''
+                if not options['no_memory']:
+                    peak = f", peak {tracemalloc.get_traced_memory()[1] / 1e6:8.1f} MB"
+                    tracemalloc.stop()
+                rows = results[name]['total_count']
+                self.stdout.write(f"{name:36s} {elapsed:8.3f} s  {rows / elapsed:12,.0f} rows/s{peak}")
+
+            baseline = next(iter(results.values()))
+            for name, summary in results.items():
+                for key in ('avg_flowrate', 'avg_pressure', 'avg_temperature'):
+                    if not np.isclose(summary[key], baseline[key]):
+                        self.stderr.write(f"{name}: {key} differs ({summary[key]} vs {baseline[key]})")
+                if summary['type_distribution'] != baseline['type_distribution']:
+                    self.stderr.write(f"{name}: type_distribution differs")
+        finally:
+            if tmp is not None:
+                os.unlink(path)
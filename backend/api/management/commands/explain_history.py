@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import UploadHistory
+
+
+def timed(func, repeat):
+    """Median wall time of ``func()`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = ("Build a throwaway database with a synthetic history table and print "
+            "EXPLAIN output and timings for the history list and detail queries.")
+    BATCH_SIZE = 10_000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # Never touch the real database: work in a fresh test database.
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.populate(options['rows'], options['users'])
+            self.report(options, "with indexes")
+            self.drop_indexes()
+            self.report(options, "without indexes")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, rows, users):
+        self.stdout.write(f"Inserting {rows:,} uploads for {users} users ...")
+        start = time.perf_counter()
+        user_ids = [User.objects.create(username=f'bench{i}').id for i in range(users)]
+        rng = random.Random(0)
+        epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        def generate():
+            for i in range(rows):
+                upload_time = epoch + timedelta(seconds=i * 30)
+                yield UploadHistory(
+                    user_id=rng.choice(user_ids),
+                    upload_time=upload_time,
+                    last_modified=upload_time,
+                    total_count=rng.randint(10, 1000),
+                    avg_flowrate=rng.uniform(50, 250),
+                    avg_pressure=rng.uniform(2, 15),
+                    avg_temperature=rng.uniform(80, 200),
+                    type_distribution={"Pump": 4, "Valve": 3, "Reactor": 1},
+                )
+
+        # Model instances pick up the defaults of columns added later; the
+        # timestamps would otherwise all be stamped with the current time.
+        timestamps = [UploadHistory._meta.get_field(name) for name in ('upload_time', 'last_modified')]
+        saved = [(field.auto_now, field.auto_now_add) for field in timestamps]
+        for field in timestamps:
+            field.auto_now = field.auto_now_add = False
+        try:
+            objects = generate()
+            while batch := list(islice(objects, self.BATCH_SIZE)):
+                UploadHistory.objects.bulk_create(batch)
+        finally:
+            for field, (auto_now, auto_now_add) in zip(timestamps, saved):
+                field.auto_now, field.auto_now_add = auto_now, auto_now_add
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(f"  done in {time.perf_counter() - start:.1f} s")
+        self.user = User.objects.get(id=user_ids[0])
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for index in UploadHistory._meta.indexes:
+                editor.remove_index(UploadHistory, index)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def report(self, options, label):
+        repeat, page_size = options['repeat'], options['page_size']
+        history = UploadHistory.objects.filter(user=self.user)
+        latest_id = history.summaries().values_list('id', flat=True).first()
+        queries = (
+            ("list (all rows)", history.summaries()),
+            (f"list (first {page_size})", history.summaries()[:page_size]),
+            ("detail", history.filter(pk=latest_id)),
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {label} ==="))
+        for name, queryset in queries:
+            elapsed = timed(lambda: list(queryset.all()), repeat)
+            self.stdout.write(self.style.SUCCESS(f"{name}: {elapsed:.2f} ms (median of {repeat})"))
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.aggregation import rebuild_rollups
+from api.models import HistoryRollup
+
+
+class Command(BaseCommand):
+    help = ("Recompute the hourly, daily and weekly upload rollups behind "
+            "history/aggregate/ from the stored uploads.")
+
+    def handle(self, *args, **options):
+        rebuild_rollups()
+        self.stdout.write(f"{HistoryRollup.objects.count():,} rollup rows")
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0003_uploadhistory_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="raw_columns",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
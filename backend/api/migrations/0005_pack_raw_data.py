@@ -0,0 +1,101 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from django.db import migrations
+
+# A frozen copy of the columnar format (version 1) from api.storage: numeric
+# columns as float64 arrays that format back to the uploaded strings, every
+# other column as int32 codes (-1 for a missing cell) into a string table.
+FORMAT_VERSION = 1
+NUMERIC_KINDS = ("compact", "float")
+
+
+def format_numbers(values, kind):
+    text = values.astype(str)
+    if kind == "compact":
+        with np.errstate(invalid="ignore"):
+            integral = (values == np.trunc(values)) & (np.abs(values) < 1e16)
+            text = np.where(integral, values.astype(np.int64).astype(str), text)
+    return text
+
+
+def encode_column(strings):
+    try:
+        values = np.asarray(strings, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    else:
+        for kind in NUMERIC_KINDS:
+            if np.array_equal(format_numbers(values, kind), strings.astype(str)):
+                return kind, values, None
+    codes, uniques = pd.factorize(strings)
+    return "str", codes.astype(np.int32), np.array(list(uniques), dtype=str)
+
+
+def encode_rows(rows):
+    """Rows that share one set of string keys and hold strings (or nulls),
+    or ``None`` if they can't be rebuilt exactly."""
+    names = list(rows[0]) if rows else []
+    for row in rows:
+        if list(row) != names or not all(isinstance(name, str) for name in names):
+            return None
+        if not all(value is None or isinstance(value, str) for value in row.values()):
+            return None
+    arrays = {}
+    meta = {"version": FORMAT_VERSION, "rows": len(rows), "columns": []}
+    for index, name in enumerate(names):
+        strings = np.array([row[name] for row in rows], dtype=object)
+        kind, data, dictionary = encode_column(strings)
+        meta["columns"].append({"name": name, "kind": kind})
+        arrays[f"c{index}"] = data
+        if dictionary is not None:
+            arrays[f"d{index}"] = dictionary
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, meta=np.array(json.dumps(meta)), **arrays)
+    return buffer.getvalue()
+
+
+def decode_rows(blob):
+    archive = np.load(io.BytesIO(bytes(blob)), allow_pickle=False)
+    meta = json.loads(archive["meta"].item())
+    columns = []
+    for index, column in enumerate(meta["columns"]):
+        data = archive[f"c{index}"]
+        if column["kind"] != "str":
+            columns.append(format_numbers(data, column["kind"]).tolist())
+        else:
+            # Code -1 (a missing cell) picks the trailing None.
+            strings = np.append(archive[f"d{index}"].astype(object), None)
+            columns.append(strings[data].tolist())
+    names = [column["name"] for column in meta["columns"]]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def pack_raw_data(apps, schema_editor):
+    UploadHistory = apps.get_model("api", "UploadHistory")
+    queryset = UploadHistory.objects.filter(raw_data__isnull=False, raw_columns__isnull=True)
+    for history in queryset.only("id", "raw_data").iterator(chunk_size=100):
+        # Rows that cannot be rebuilt exactly stay in raw_data.
+        packed = encode_rows(history.raw_data) if isinstance(history.raw_data, list) else None
+        if packed is not None:
+            UploadHistory.objects.filter(pk=history.pk).update(raw_columns=packed, raw_data=None)
+
+
+def unpack_raw_data(apps, schema_editor):
+    UploadHistory = apps.get_model("api", "UploadHistory")
+    queryset = UploadHistory.objects.filter(raw_columns__isnull=False)
+    for history in queryset.only("id", "raw_columns").iterator(chunk_size=100):
+        rows = decode_rows(history.raw_columns)
+        UploadHistory.objects.filter(pk=history.pk).update(raw_data=rows, raw_columns=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0004_uploadhistory_raw_columns"),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_raw_data, unpack_raw_data),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0005_pack_raw_data"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="uploadhistory",
+            index=models.Index(
+                fields=["user", "-upload_time"], name="history_user_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadhistory",
+            index=models.Index(
+                fields=[
+                    "user",
+                    "-upload_time",
+                    "-id",
+                    "total_count",
+                    "avg_flowrate",
+                    "avg_pressure",
+                    "avg_temperature",
+                ],
+                name="history_user_summary_idx",
+            ),
+        ),
+    ]
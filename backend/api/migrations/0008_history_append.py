@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_upload_time(apps, schema_editor):
+    # Existing uploads were last modified when they were uploaded.
+    UploadHistory = apps.get_model("api", "UploadHistory")
+    UploadHistory.objects.update(last_modified=F("upload_time"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_upload_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("raw_columns", models.BinaryField()),
+                ("row_count", models.IntegerField()),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="uploadhistory",
+            name="history_user_summary_idx",
+        ),
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="column_stats",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="last_modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_upload_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="uploadhistory",
+            index=models.Index(
+                fields=[
+                    "user",
+                    "-upload_time",
+                    "-id",
+                    "last_modified",
+                    "total_count",
+                    "avg_flowrate",
+                    "avg_pressure",
+                    "avg_temperature",
+                ],
+                name="history_user_summary_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadsegment",
+            name="history",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="segments",
+                to="api.uploadhistory",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_history_append"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="uploadhistory",
+            index=models.Index(
+                fields=["user", "content_hash"], name="history_user_hash_idx"
+            ),
+        ),
+    ]
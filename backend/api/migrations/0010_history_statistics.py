@@ -0,0 +1,154 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+# Frozen copies of what api.ingest.summarize_dataset stored when this was
+# written: per-field moments and t-digests (api.sketches) and per-type
+# moments, read from the columnar blobs (api.storage, format version 1).
+FIELDS = ("flowrate", "pressure", "temperature")
+COLUMNS = {
+    "flowrate": ("Flowrate", "Concentration"),
+    "pressure": ("Pressure",),
+    "temperature": ("Temperature",),
+}
+TYPE_COLUMN = "Type"
+COMPRESSION = 100
+
+
+def format_numbers(values, kind):
+    text = values.astype(str)
+    if kind == "compact":
+        with np.errstate(invalid="ignore"):
+            integral = (values == np.trunc(values)) & (np.abs(values) < 1e16)
+            text = np.where(integral, values.astype(np.int64).astype(str), text)
+    return text
+
+
+def stored_frame(blobs):
+    """The cells of the summary columns of ``blobs`` (in order) as a DataFrame."""
+    wanted = {name for names in COLUMNS.values() for name in names} | {TYPE_COLUMN}
+    cells = {}
+    for blob in blobs:
+        archive = np.load(io.BytesIO(bytes(blob)), allow_pickle=False)
+        meta = json.loads(archive["meta"].item())
+        for index, column in enumerate(meta["columns"]):
+            if column["name"] not in wanted:
+                continue
+            data = archive[f"c{index}"]
+            if column["kind"] != "str":
+                strings = format_numbers(data, column["kind"]).astype(object)
+            else:
+                strings = np.append(archive[f"d{index}"].astype(object), None)[data]
+            cells.setdefault(column["name"], []).append(strings)
+    return pd.DataFrame({name: np.concatenate(parts) for name, parts in cells.items()})
+
+
+def to_floats(cells):
+    try:
+        return np.asarray(cells, dtype=np.float64)
+    except (TypeError, ValueError):
+        values = np.empty(len(cells))
+        for i, cell in enumerate(cells):
+            try:
+                values[i] = float(cell)
+            except (TypeError, ValueError):
+                values[i] = np.nan
+        return values
+
+
+def moments(values):
+    if not len(values):
+        return {"count": 0, "sum": 0.0, "min": None, "max": None, "m2": 0.0}
+    mean = float(values.mean())
+    return {
+        "count": len(values),
+        "sum": float(values.sum()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "m2": float(((values - mean) ** 2).sum()),
+    }
+
+
+def buckets(q):
+    k = np.floor(COMPRESSION * (np.arcsin(2 * q - 1) / np.pi + 0.5))
+    return np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+
+
+def digest(values):
+    """A t-digest of ``values``: one batch, merged into an empty digest."""
+    if not len(values):
+        return {"means": [], "weights": []}
+    values = np.sort(values)
+    starts = buckets((np.arange(len(values)) + 0.5) / len(values))
+    weights = np.diff(np.r_[starts, len(values)]).astype(np.float64)
+    means = np.add.reduceat(values, starts) / weights
+    cumulative = np.cumsum(weights)
+    starts = buckets((cumulative - weights / 2) / cumulative[-1])
+    merged = np.add.reduceat(weights, starts)
+    means = np.add.reduceat(means * weights, starts) / merged
+    return {"means": means.tolist(), "weights": merged.tolist()}
+
+
+def summarize(frame):
+    """``(column_stats, type_stats)`` of a frame of uploaded cells."""
+    types = frame[TYPE_COLUMN] if TYPE_COLUMN in frame.columns else None
+    column_stats, type_stats = {}, {}
+    for field, names in COLUMNS.items():
+        name = next((name for name in names if name in frame.columns), None)
+        values = to_floats(frame[name].to_numpy()) if name else np.empty(0)
+        present = ~np.isnan(values)
+        values = values[present]
+        column_stats[field] = {**moments(values), "digest": digest(values)}
+        if name and types is not None:
+            grouped = pd.Series(values).groupby(types[present].to_numpy(), sort=False)
+            for equip_type, group in grouped:
+                type_stats.setdefault(str(equip_type), {})[field] = moments(
+                    group.to_numpy()
+                )
+    return column_stats, type_stats
+
+
+def compute_statistics(apps, schema_editor):
+    UploadHistory = apps.get_model("api", "UploadHistory")
+    UploadSegment = apps.get_model("api", "UploadSegment")
+    queryset = UploadHistory.objects.only("id", "raw_data", "raw_columns")
+    for history in queryset.iterator(chunk_size=100):
+        if history.raw_columns is not None:
+            segments = UploadSegment.objects.filter(history_id=history.pk).order_by("id")
+            frame = stored_frame(
+                [history.raw_columns]
+                + list(segments.values_list("raw_columns", flat=True))
+            )
+        elif isinstance(history.raw_data, list) and all(
+            isinstance(row, dict) for row in history.raw_data
+        ):
+            frame = pd.DataFrame.from_records(history.raw_data)
+        else:
+            # Rows that cannot be read back; their statistics stay empty.
+            continue
+        column_stats, type_stats = summarize(frame)
+        # The detail representation changes, so cached copies must not validate.
+        UploadHistory.objects.filter(pk=history.pk).update(
+            column_stats=column_stats,
+            type_stats=type_stats,
+            last_modified=Now(),
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_history_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="type_stats",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(compute_statistics, migrations.RunPython.noop),
+    ]
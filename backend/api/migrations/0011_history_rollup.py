@@ -0,0 +1,128 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:05
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+FIELDS = ("flowrate", "pressure", "temperature")
+BUCKETS = ("hour", "day", "week")
+
+
+def bucket_start(moment, bucket):
+    local = timezone.localtime(moment).replace(
+        tzinfo=None, minute=0, second=0, microsecond=0
+    )
+    if bucket != "hour":
+        local = local.replace(hour=0)
+    if bucket == "week":
+        local -= timedelta(days=local.weekday())
+    return timezone.make_aware(local)
+
+
+def build_rollups(apps, schema_editor):
+    """Add up the existing uploads per user and hour, day and week, with
+    each field weighted by its value count."""
+    UploadHistory = apps.get_model("api", "UploadHistory")
+    HistoryRollup = apps.get_model("api", "HistoryRollup")
+    histories = UploadHistory.objects.exclude(user=None).only(
+        "user",
+        "upload_time",
+        "total_count",
+        "avg_flowrate",
+        "avg_pressure",
+        "avg_temperature",
+        "type_distribution",
+        "column_stats",
+    )
+    rollups = {}
+    for history in histories.iterator(chunk_size=500):
+        for bucket in BUCKETS:
+            period = bucket_start(history.upload_time, bucket)
+            rollup = rollups.get((history.user_id, bucket, period))
+            if rollup is None:
+                rollup = rollups[(history.user_id, bucket, period)] = HistoryRollup(
+                    user_id=history.user_id,
+                    bucket=bucket,
+                    period=period,
+                    type_distribution={},
+                )
+            rollup.uploads += 1
+            rollup.total_count += history.total_count
+            for field in FIELDS:
+                # Uploads stored before values were counted: every row.
+                stats = (history.column_stats or {}).get(field)
+                count = stats["count"] if stats else history.total_count
+                average = getattr(history, f"avg_{field}")
+                setattr(
+                    rollup, f"{field}_count", getattr(rollup, f"{field}_count") + count
+                )
+                setattr(
+                    rollup,
+                    f"{field}_sum",
+                    getattr(rollup, f"{field}_sum") + average * count,
+                )
+            types = rollup.type_distribution
+            for name, count in (history.type_distribution or {}).items():
+                types[name] = types.get(name, 0) + count
+    HistoryRollup.objects.bulk_create(rollups.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_history_statistics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistoryRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day"), ("week", "Week")],
+                        max_length=4,
+                    ),
+                ),
+                ("period", models.DateTimeField()),
+                ("uploads", models.IntegerField(default=0)),
+                ("total_count", models.BigIntegerField(default=0)),
+                ("flowrate_sum", models.FloatField(default=0)),
+                ("pressure_sum", models.FloatField(default=0)),
+                ("temperature_sum", models.FloatField(default=0)),
+                ("flowrate_count", models.BigIntegerField(default=0)),
+                ("pressure_count", models.BigIntegerField(default=0)),
+                ("temperature_count", models.BigIntegerField(default=0)),
+                ("type_distribution", models.JSONField(default=dict)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["period"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "bucket", "period"),
+                        name="rollup_user_bucket_period",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0011_history_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadhistory",
+            name="diagnostics",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
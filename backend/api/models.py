@@ -1,21 +1,191 @@
 # api/models.py
+from itertools import chain
+
 from django.db import models
 from django.contrib.auth.models import User
 
+from .ingest import RunningSummary
+from .storage import RowStream, StoredDataset, encode_rows
+
+class UploadHistoryQuerySet(models.QuerySet):
+    def summaries(self):
+        """Summary columns only, newest first (ordered by the summary index)."""
+        return self.only(*UploadHistory.SUMMARY_FIELDS).order_by('-upload_time', '-id')
+
+
 class UploadHistory(models.Model):
+    # Everything except the stored rows; cheap to load for listings.
+    SUMMARY_FIELDS = ('id', 'user', 'upload_time', 'last_modified', 'total_count', 'avg_flowrate',
+                      'avg_pressure', 'avg_temperature', 'type_distribution')
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     upload_time = models.DateTimeField(auto_now_add=True)
+    # Changes when rows are appended; drives ETags and Last-Modified.
+    last_modified = models.DateTimeField(auto_now=True)
     total_count = models.IntegerField()
     avg_flowrate = models.FloatField()
     avg_pressure = models.FloatField()
     avg_temperature = models.FloatField()
     type_distribution = models.JSONField()
+    # Per-field moments and quantile sketch behind the averages and
+    # statistics, and the moments per equipment type (see RunningSummary).
+    column_stats = models.JSONField(default=dict, blank=True)
+    type_stats = models.JSONField(default=dict, blank=True)
+    # Legacy row dicts; new uploads are kept in raw_columns instead.
     raw_data = models.JSONField(null=True, blank=True)
+    # Compressed columnar copy of the uploaded rows (see api.storage).
+    raw_columns = models.BinaryField(null=True, blank=True)
+    # SHA-256 of the uploaded file (and the schema it was sent with), to
+    # answer re-uploads with this row. Cleared when rows are appended.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # The schema the file was read with and the cells or lines that
+    # couldn't be read (see api.parsing.ParseReport).
+    diagnostics = models.JSONField(default=dict, blank=True)
+
+    objects = UploadHistoryQuerySet.as_manager()
 
     class Meta:
         ordering = ['-upload_time']
+        indexes = [
+            # Every history query filters by user and orders by upload time.
+            models.Index(fields=['user', '-upload_time'], name='history_user_time_idx'),
+            # Covering variant for the list: SQLite has no INCLUDE, so the
+            # scalar summary columns are trailing key columns instead. The
+            # type_distribution JSON stays out of the key; it is read from
+            # the table for the rows of the page only.
+            models.Index(
+                fields=['user', '-upload_time', '-id', 'last_modified', 'total_count',
+                        'avg_flowrate', 'avg_pressure', 'avg_temperature'],
+                name='history_user_summary_idx',
+            ),
+            models.Index(fields=['user', 'content_hash'], name='history_user_hash_idx'),
+        ]
+
+    def running_summary(self):
+        """The stored statistics as a ``RunningSummary``, or ``None`` for
+        uploads stored before they were kept."""
+        if not RunningSummary.has_sketches(self.column_stats):
+            return None
+        return RunningSummary.from_model(self.total_count, self.column_stats,
+                                         self.type_distribution, self.type_stats)
+
+    def load_rows(self):
+        """Rebuild the uploaded rows as a list of dicts."""
+        if self.raw_columns is not None:
+            return self.stored_dataset().to_rows()
+        return self.raw_data
+
+    def row_window(self):
+        """The rows as a lazily decoded ``RowWindow`` (legacy rows as their list)."""
+        if self.raw_columns is not None:
+            return self.stored_dataset().window()
+        return self.raw_data
+
+    def row_stream(self):
+        """The rows as a ``RowStream``, which reads the upload and then each
+        appended segment as it is sent (legacy rows as their list)."""
+        if self.raw_columns is None:
+            return self.raw_data
+        segments = self.segments.values_list('raw_columns', flat=True).iterator()
+        return RowStream(chain([self.raw_columns], segments))
+
+    def stored_dataset(self):
+        """The rows, appended segments included, as a ``StoredDataset``.
+
+        Legacy ``raw_data`` is packed on the fly; returns ``None`` for legacy
+        rows that cannot be packed losslessly.
+        """
+        blob = self.raw_columns
+        if blob is None:
+            blob = encode_rows(self.raw_data or [])
+            return StoredDataset(blob) if blob is not None else None
+        segments = self.segments.values_list('raw_columns', flat=True) if self.pk else []
+        return StoredDataset.concat([StoredDataset(blob)] + [StoredDataset(b) for b in segments])
 
     def __str__(self):
         if self.user:
             return f"Upload at {self.upload_time.strftime('%Y-%m-%d %H:%M')} by {self.user.username}"
-        return f"Upload at {self.upload_time.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Upload at {self.upload_time.strftime('%Y-%m-%d %H:%M')}"
+
+
+class UploadSegment(models.Model):
+    """Rows appended to an upload, stored as their own columnar blob so the
+    original ``raw_columns`` is never rewritten."""
+    history = models.ForeignKey(UploadHistory, on_delete=models.CASCADE, related_name='segments')
+    raw_columns = models.BinaryField()
+    row_count = models.IntegerField()
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.row_count} rows appended to upload {self.history_id}"
+
+
+class HistoryRollup(models.Model):
+    """A user's upload summaries added up over one time bucket (see
+    api.aggregation); kept current as uploads are stored."""
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+    BUCKET_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    bucket = models.CharField(max_length=4, choices=BUCKET_CHOICES)
+    period = models.DateTimeField()
+    uploads = models.IntegerField(default=0)
+    total_count = models.BigIntegerField(default=0)
+    # Sums of the uploads' averages weighted by how many values each was
+    # over (avg_* times the field's count in column_stats), and those counts.
+    flowrate_sum = models.FloatField(default=0)
+    pressure_sum = models.FloatField(default=0)
+    temperature_sum = models.FloatField(default=0)
+    flowrate_count = models.BigIntegerField(default=0)
+    pressure_count = models.BigIntegerField(default=0)
+    temperature_count = models.BigIntegerField(default=0)
+    type_distribution = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['period']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'bucket', 'period'], name='rollup_user_bucket_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_bucket_display()} of {self.period:%Y-%m-%d %H:%M}: {self.uploads} uploads"
+
+
+class UploadJob(models.Model):
+    """An upload being processed in the background (see api.jobs)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file_name = models.CharField(max_length=255, blank=True)
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_done = models.BigIntegerField(default=0)
+    rows_done = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    history = models.ForeignKey(UploadHistory, on_delete=models.SET_NULL, null=True, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_time']
+
+    def __str__(self):
+        return f"Upload job {self.pk} ({self.status})"
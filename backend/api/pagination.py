@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class HistoryCursorPagination(CursorPagination):
+    """Keyset pagination over a user's uploads, newest first.
+
+    Pages are only returned when the client asks for them with ``cursor``
+    or ``page_size``; otherwise the list is returned unpaginated, as
+    existing clients expect.
+    """
+    ordering = ('-upload_time', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class HistoryRowsPagination(LimitOffsetPagination):
+    """Offset/limit windows over the rows of one upload."""
+    default_limit = 100
+    max_limit = 5000
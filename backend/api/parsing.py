@@ -0,0 +1,440 @@
+"""Reading uploaded CSV files.
+
+A :class:`Schema` says how to read one file: its encoding, delimiter and
+decimal mark, and which columns -- under whatever name, and in which
+unit -- feed the summary. Whatever the client doesn't specify is inferred
+once per file, from its first bytes and first batch of rows. Batches are
+then parsed by pandas' C reader and numeric columns converted in bulk;
+cells that aren't numbers and lines with too many fields are counted in a
+:class:`ParseReport` instead of failing the upload.
+
+Like :mod:`api.ingest`, this module doesn't touch Django.
+"""
+import codecs
+import csv
+import io
+import os
+import re
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ('flowrate', 'pressure', 'temperature')
+TYPE_FIELD = 'type'
+
+# Normalized header names for each field, most preferred first.
+ALIASES = {
+    'flowrate': ('flowrate', 'flow', 'volumetricflowrate', 'volumeflow', 'flowratem3h', 'concentration'),
+    'pressure': ('pressure', 'press', 'pressurebar'),
+    'temperature': ('temperature', 'temp', 'temperaturec'),
+    TYPE_FIELD: ('type', 'equipmenttype', 'category', 'kind'),
+}
+
+# Canonical units (m3/h, bar, degC) as value * scale + offset.
+UNITS = {
+    'flowrate': {
+        'm3/h': (1, 0), 'm3/hr': (1, 0), 'm3/min': (60, 0), 'm3/s': (3600, 0),
+        'l/h': (0.001, 0), 'l/min': (0.06, 0), 'l/s': (3.6, 0), 'gpm': (0.227124707, 0),
+    },
+    'pressure': {
+        'bar': (1, 0), 'mbar': (0.001, 0), 'pa': (1e-5, 0), 'kpa': (0.01, 0), 'mpa': (10, 0),
+        'psi': (0.0689475729, 0), 'atm': (1.01325, 0),
+    },
+    'temperature': {
+        'c': (1, 0), 'degc': (1, 0), 'f': (5 / 9, -160 / 9), 'degf': (5 / 9, -160 / 9), 'k': (1, -273.15),
+    },
+}
+
+DELIMITERS = ',;\t|'
+# Rows per batch: each batch is parsed, summarised and encoded in one go.
+BATCH_ROWS = 50_000
+SNIFF_BYTES = 64 * 1024
+CONVERT_BLOCK = 256
+UNIT_SUFFIX = re.compile(r'\s*[(\[]([^)\]]*)[)\]]\s*$')
+DECIMAL_COMMA = re.compile(r'^\s*[-+]?\d+,\d+\s*$')
+
+
+def normalize_name(name):
+    """``'Flow Rate (m3/h)'`` -> ``'flowrate'``."""
+    return re.sub(r'[^0-9a-z]', '', UNIT_SUFFIX.sub('', str(name)).lower())
+
+
+def normalize_unit(unit):
+    return unit.lower().replace(' ', '').replace('°', '').replace('³', '3')
+
+
+def header_unit(name):
+    """The unit in a header such as ``'Pressure (kPa)'``, or ``None``."""
+    match = UNIT_SUFFIX.search(str(name))
+    return normalize_unit(match.group(1)) if match else None
+
+
+class Schema:
+    """How to read one CSV; ``None`` anywhere means "infer it".
+
+    ``columns`` maps summary fields (and ``'type'``) to CSV column names;
+    ``units`` maps summary fields to the unit their column is in.
+    """
+
+    def __init__(self, encoding=None, delimiter=None, decimal=None, columns=None, units=None):
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.decimal = decimal
+        self.columns = dict(columns or {})
+        self.units = dict(units or {})
+
+    @classmethod
+    def from_dict(cls, data):
+        """A client-supplied schema; raises ``ValueError`` when it is invalid."""
+        if not isinstance(data, dict):
+            raise ValueError('Invalid schema: expected an object')
+        unknown = set(data) - {'encoding', 'delimiter', 'decimal', 'columns', 'units'}
+        if unknown:
+            raise ValueError(f"Invalid schema: unknown keys {', '.join(sorted(unknown))}")
+        fields = set(FIELDS) | {TYPE_FIELD}
+        columns = data['columns'] if data.get('columns') is not None else {}
+        units = data['units'] if data.get('units') is not None else {}
+        if (not isinstance(columns, dict) or set(columns) - fields
+                or not all(isinstance(name, str) for name in columns.values())):
+            raise ValueError(f"Invalid schema: columns must map {', '.join(sorted(fields))} to column names")
+        if not isinstance(units, dict) or set(units) - set(FIELDS):
+            raise ValueError(f"Invalid schema: units must map {', '.join(FIELDS)} to units")
+        schema = cls(**data)
+        if schema.encoding is not None:
+            try:
+                codecs.lookup(schema.encoding)
+            except (LookupError, TypeError):
+                raise ValueError(f'Invalid schema: unknown encoding {schema.encoding!r}') from None
+        if schema.delimiter is not None and (not isinstance(schema.delimiter, str)
+                                             or len(schema.delimiter) != 1):
+            raise ValueError('Invalid schema: delimiter must be a single character')
+        if schema.decimal not in (None, '.', ','):
+            raise ValueError("Invalid schema: decimal must be '.' or ','")
+        for field, unit in schema.units.items():
+            if not isinstance(unit, str) or normalize_unit(unit) not in UNITS[field]:
+                raise ValueError(f"Invalid schema: unknown {field} unit {unit!r}, "
+                                 f"expected one of {', '.join(UNITS[field])}")
+        return schema
+
+    def to_dict(self):
+        return {'encoding': self.encoding, 'delimiter': self.delimiter, 'decimal': self.decimal,
+                'columns': self.columns, 'units': self.units}
+
+    def field_columns(self):
+        """The columns that feed the summary fields."""
+        return [self.columns[field] for field in FIELDS if field in self.columns]
+
+    @classmethod
+    def for_columns(cls, columns):
+        """The schema of rows that are already split into ``columns``."""
+        return cls(encoding='utf-8', delimiter=',', decimal='.').resolve_columns(columns)
+
+    def sniff(self, head):
+        """Fill in the encoding and delimiter from the first bytes of a file."""
+        encoding = self.encoding
+        if encoding is None:
+            try:
+                # A multi-byte character may be cut off at the end of the head.
+                codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+                encoding = 'utf-8'
+            except UnicodeDecodeError:
+                encoding = 'latin-1'
+        delimiter = self.delimiter
+        if delimiter is None:
+            text = head.decode(encoding, errors='replace').lstrip('\ufeff')
+            sample = '\n'.join(text.splitlines()[:20])
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+            except csv.Error:
+                delimiter = ','
+        return Schema(encoding, delimiter, self.decimal, self.columns, self.units)
+
+    def resolve_columns(self, columns, sample=None):
+        """Fill in the column mapping, units and decimal mark from the header
+        (and a first batch of rows, ``sample``)."""
+        columns = list(columns)
+        missing = [name for name in self.columns.values() if name not in columns]
+        if missing:
+            raise ValueError(f"Column {missing[0]!r} is not in the CSV header")
+        mapping = dict(self.columns)
+        by_name = {}
+        for column in columns:
+            by_name.setdefault(normalize_name(column), column)
+        for field, aliases in ALIASES.items():
+            if field not in mapping:
+                found = next((by_name[alias] for alias in aliases if alias in by_name), None)
+                if found is not None:
+                    mapping[field] = found
+
+        units = dict(self.units)
+        for field in FIELDS:
+            if field in mapping and field not in units:
+                unit = header_unit(mapping[field])
+                if unit in UNITS[field]:
+                    units[field] = unit
+
+        decimal = self.decimal
+        if decimal is None:
+            decimal = '.'
+            if self.delimiter != ',' and sample is not None:
+                cells = [sample[mapping[f]] for f in FIELDS if f in mapping]
+                if any(column.str.match(DECIMAL_COMMA).any() for column in cells):
+                    decimal = ','
+        return Schema(self.encoding, self.delimiter, decimal, mapping, units)
+
+    def numbers(self, frame, field, report=None):
+        """``field``'s column of ``frame`` as floats in the canonical unit.
+
+        Cells that aren't (finite) numbers become NaN and are counted in
+        ``report``.
+        """
+        name = self.columns[field]
+        column = frame[name]
+        if column.dtype.kind in 'iuf':
+            # Typed already (a Parquet or Arrow upload): only nulls and
+            # infinities to count.
+            values = column.to_numpy(dtype=np.float64)
+            if report is not None:
+                report.add_missing_values(name, int(np.isnan(values).sum()))
+        else:
+            if column.dtype != object:
+                column = column.astype(str)
+            cells = column
+            if self.decimal == ',':
+                column = column.str.replace(',', '.', regex=False)
+            try:
+                values = np.asarray(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                values = to_floats(column.to_numpy(dtype=object))
+                if report is not None:
+                    report.add_bad_values(name, cells, values)
+        unit = self.units.get(field)
+        if unit is not None:
+            scale, offset = UNITS[field][normalize_unit(unit)]
+            if (scale, offset) != (1, 0):
+                values = values * scale + offset
+        # 'inf' and literals too large for a float (or for the unit
+        # conversion) would poison the statistics.
+        infinite = np.isinf(values)
+        if infinite.any():
+            values = np.where(infinite, np.nan, values)
+            if report is not None:
+                report.add_non_finite_values(name, frame[name], infinite)
+        return values
+
+
+def to_floats(cells):
+    """Like ``np.asarray(cells, dtype=float)``, with NaN for the cells that
+    aren't numbers.
+
+    Cells are converted a block at a time, so only the blocks that hold a
+    bad cell are converted one cell at a time.
+    """
+    values = np.empty(len(cells))
+    for start in range(0, len(cells), CONVERT_BLOCK):
+        block = cells[start:start + CONVERT_BLOCK]
+        try:
+            values[start:start + len(block)] = np.asarray(block, dtype=np.float64)
+        except (TypeError, ValueError):
+            for i, cell in enumerate(block, start):
+                try:
+                    values[i] = float(cell)
+                except (TypeError, ValueError):
+                    values[i] = np.nan
+    return values
+
+
+class ParseReport:
+    """What couldn't be read from a file, with a few examples."""
+
+    MAX_SAMPLES = 20
+
+    def __init__(self):
+        self.format = 'csv'
+        self.schema = None
+        self.bad_values = {}
+        self.missing_values = {}
+        self.skipped_lines = 0
+        self.samples = []
+        # Data rows read before the current batch, for row numbers.
+        self.row_offset = 0
+
+    def add_bad_values(self, name, cells, values):
+        cells = cells.to_numpy(dtype=object)
+        failed = np.isnan(values)
+        stripped = np.array([cell.strip() if isinstance(cell, str) else '' for cell in cells[failed]],
+                            dtype=object)
+        missing = (stripped == '') | np.isin(stripped, ('nan', 'NaN'))
+        self.add_missing_values(name, int(missing.sum()))
+        self.add_samples(name, cells, np.flatnonzero(failed)[~missing])
+
+    def add_non_finite_values(self, name, cells, infinite):
+        self.add_samples(name, cells.to_numpy(dtype=object), np.flatnonzero(infinite))
+
+    def add_samples(self, name, cells, positions):
+        """Count the bad cells at ``positions`` and keep a few of them."""
+        if len(positions):
+            self.bad_values[name] = self.bad_values.get(name, 0) + len(positions)
+        room = max(self.MAX_SAMPLES - len(self.samples), 0)
+        for position in positions[:room]:
+            self.samples.append({'row': self.row_offset + int(position) + 1, 'column': name,
+                                 'value': str(cells[position])})
+
+    def add_missing_values(self, name, count):
+        if count:
+            self.missing_values[name] = self.missing_values.get(name, 0) + count
+
+    def add_skipped_line(self, message):
+        self.skipped_lines += 1
+        if len(self.samples) < self.MAX_SAMPLES:
+            self.samples.append({'message': message.strip()})
+
+    def as_dict(self):
+        return {
+            'format': self.format,
+            'schema': self.schema.to_dict() if self.schema is not None else None,
+            'bad_values': self.bad_values,
+            'missing_values': self.missing_values,
+            'skipped_lines': self.skipped_lines,
+            'samples': self.samples,
+        }
+
+
+# Over-long lines are reported through warnings, whose handler is
+# process-wide. One handler, installed when the first CSV is read, hands
+# the ParserWarnings of a thread that is reading to that thread's list, so
+# readers on different threads never wait for each other.
+_capture = threading.local()
+_install_lock = threading.Lock()
+_showwarning = None
+
+
+def _show_warning(message, category, filename, lineno, file=None, line=None):
+    lines = getattr(_capture, 'lines', None)
+    if lines is not None and issubclass(category, pd.errors.ParserWarning):
+        lines.extend(str(message).splitlines())
+    else:
+        _showwarning(message, category, filename, lineno, file, line)
+
+
+def _install_warning_capture():
+    global _showwarning
+    if warnings.showwarning is _show_warning:
+        return
+    with _install_lock:
+        if warnings.showwarning is not _show_warning:
+            _showwarning = warnings.showwarning
+            warnings.showwarning = _show_warning
+            # Every skipped line, not just the first with a given message.
+            warnings.filterwarnings('always', category=pd.errors.ParserWarning)
+
+# A column past the header's last, which only over-long lines fill. pandas
+# doesn't check the first line of each block it reads against the header,
+# and cuts such a line short instead of skipping it; this column shows it.
+OVERFLOW = '\0overflow'
+EXPECTED_FIELDS = re.compile(r'expected \d+ fields')
+
+
+def _head(source):
+    """The first bytes of ``source``, which is left where it was."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read(SNIFF_BYTES)
+    position = source.tell()
+    head = source.read(SNIFF_BYTES)
+    source.seek(position)
+    return head
+
+
+def read_csv(source, schema=None, report=None, batch_rows=BATCH_ROWS):
+    """Yield the CSV as DataFrames of at most ``batch_rows`` string columns.
+
+    ``source`` is a path or a binary file object. Cells are kept as the
+    exact strings found in the file so callers can store them verbatim;
+    convert numeric columns with :meth:`Schema.numbers`. The schema
+    actually used is left in ``report.schema``.
+
+    Columns are named as :class:`csv.DictReader` names them: a name that
+    appears twice keeps the cells of its last column, in the place of its
+    first. Lines with more fields than the header are skipped and reported;
+    the cells missing from a short line read as ``''`` (DictReader gave
+    ``None``), as pandas can't tell them from empty cells.
+    """
+    report = report if report is not None else ParseReport()
+    head = _head(source)
+    schema = (schema or Schema()).sniff(head)
+    report.schema = schema
+    text = None
+    if not isinstance(source, (str, os.PathLike)) and codecs.lookup(schema.encoding).name != 'utf-8':
+        # pandas reads file objects other than its own as UTF-8 whatever the
+        # encoding; decode them here (and leave the caller's file open).
+        source = text = io.TextIOWrapper(source, encoding=schema.encoding, newline='')
+    try:
+        yield from _read_batches(source, head, schema, report, batch_rows)
+    finally:
+        if text is not None:
+            text.detach()
+
+
+def _header(head, schema):
+    """The column names in the first line of ``head``, as pandas names them."""
+    try:
+        return list(pd.read_csv(io.BytesIO(head), nrows=0, encoding=schema.encoding,
+                                sep=schema.delimiter, encoding_errors='replace').columns)
+    except pd.errors.EmptyDataError:
+        return None
+
+
+def _read_batches(source, head, schema, report, batch_rows):
+    header = _header(head, schema)
+    if header is None:
+        return
+    # The header line is read as the first row (and dropped): pandas won't
+    # take names that are longer than it. No index column is ever inferred.
+    reader = pd.read_csv(source, header=None, names=header + [OVERFLOW], index_col=False,
+                         dtype=str, keep_default_na=False, na_filter=False,
+                         chunksize=batch_rows, encoding=schema.encoding, sep=schema.delimiter,
+                         on_bad_lines='warn')
+    rows = 0
+    first = True
+    _install_warning_capture()
+    with reader:
+        while True:
+            # Only while this reader parses: the caller may read another
+            # CSV on this thread between batches.
+            _capture.lines = caught = []
+            try:
+                batch = next(reader, None)
+            finally:
+                _capture.lines = None
+            for line in caught:
+                if line.startswith('Skipping line'):
+                    # pandas counts the overflow column as expected.
+                    line = EXPECTED_FIELDS.sub(f'expected {len(header)} fields', line)
+                    report.add_skipped_line(line)
+            if batch is None:
+                return
+            start = 1 if first else 0
+            if first:
+                # pandas renames repeated and blank names; use the header
+                # line's own.
+                names = batch.iloc[0, :-1].tolist()
+                last = {name: position for position, name in enumerate(names)}
+                columns = list(dict.fromkeys(names))
+                keep = [last[name] for name in columns]
+            overflow = batch[OVERFLOW].to_numpy()[start:] != ''
+            batch = batch.iloc[start:, keep]
+            batch.columns = columns
+            if overflow.any():
+                for position in np.flatnonzero(overflow):
+                    report.add_skipped_line(f'Skipping row {rows + position + 1}: '
+                                            f'expected {len(header)} fields, saw more')
+                batch = batch[~overflow]
+            if first:
+                schema = report.schema = schema.resolve_columns(batch.columns, batch)
+                first = False
+            report.row_offset = rows
+            rows += len(batch)
+            yield batch
@@ -0,0 +1,113 @@
+"""JSON rendering and parsing for large payloads.
+
+``FastJSONRenderer`` writes stored rows (a ``RowWindow`` or ``RowStream``,
+as returned for ``raw_data``) straight from their columns, without
+building a dict per row, and encodes everything else with orjson when it
+is installed. Views
+opt in through ``REST_FRAMEWORK['FAST_JSON_VIEWS']``; see
+:class:`FastJSONMixin`. The same encoders back the streaming responses
+of ``history/<id>/?stream=json|ndjson``.
+"""
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .storage import JSONRows
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Same JSON as ``JSONRenderer`` (compact, UTF-8), produced faster."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output is for people reading it; leave it to DRF.
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return b''.join(self.iter_json(data))
+
+    def iter_json(self, data):
+        """Yield ``data`` as JSON in chunks.
+
+        Rows are streamed wherever ``JSONRows`` are a dict value, which is
+        how serializers return them; anything else is encoded in one go.
+        """
+        if isinstance(data, JSONRows):
+            yield from data.iter_json()
+        elif isinstance(data, dict):
+            yield b'{'
+            for i, (key, value) in enumerate(data.items()):
+                yield (b',' if i else b'') + self.dumps(str(key)) + b':'
+                yield from self.iter_json(value)
+            yield b'}'
+        else:
+            yield self.dumps(data)
+
+    def dumps(self, value):
+        if orjson is not None:
+            # Dates and times go through DRF's encoder, which writes UTC as
+            # 'Z' and keeps milliseconds only.
+            content = orjson.dumps(value, default=self.encoder_class().default,
+                                   option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        else:
+            content = json.dumps(value, cls=self.encoder_class, ensure_ascii=False,
+                                 allow_nan=False, separators=(',', ':')).encode()
+        # Same escaping as JSONRenderer, for JSON embedded in <script> tags.
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def iter_ndjson(data, rows_key='raw_data'):
+    """Yield ``data`` as newline-delimited JSON.
+
+    The first line holds every field except ``rows_key``; each following
+    line is one row.
+    """
+    renderer = FastJSONRenderer()
+    rows = data.get(rows_key)
+    yield renderer.dumps({key: value for key, value in data.items() if key != rows_key}) + b'\n'
+    if isinstance(rows, JSONRows):
+        yield from rows.iter_ndjson()
+    else:
+        for row in rows or ():
+            yield renderer.dumps(row) + b'\n'
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` backed by orjson when it is installed."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+def fast_json_enabled(view):
+    return type(view).__name__ in settings.REST_FRAMEWORK.get('FAST_JSON_VIEWS', ())
+
+
+class FastJSONMixin:
+    """Swap in the fast JSON renderer and parser for views listed by class
+    name in ``REST_FRAMEWORK['FAST_JSON_VIEWS']``."""
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if fast_json_enabled(self):
+            renderers = [FastJSONRenderer() if type(r) is JSONRenderer else r for r in renderers]
+        return renderers
+
+    def get_parsers(self):
+        parsers = super().get_parsers()
+        if fast_json_enabled(self):
+            parsers = [FastJSONParser() if type(p) is JSONParser else p for p in parsers]
+        return parsers
@@ -1,6 +1,10 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import UploadHistory
+from rest_framework.reverse import reverse
+from .models import UploadHistory, UploadJob
+from .thumbnails import chart_token
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class UserSerializer(serializers.ModelSerializer):
@@ -25,10 +29,74 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
-class UploadHistorySerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """Field names from ``?fields=a,b``, or ``None`` when not given."""
+    fields = request.query_params.get('fields') if request is not None else None
+    return {name for name in fields.split(',') if name} if fields else None
+
+class FieldSelectionMixin:
+    """Limits the output to ``?fields=`` when serializing for a request."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get('request'))
+        if wanted is None:
+            return
+        unknown = wanted - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
+
+class UploadHistorySerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    raw_data = serializers.SerializerMethodField()
+    # Computed at ingest, so dashboards don't need raw_data (null for
+    # uploads stored before statistics were kept).
+    statistics = serializers.SerializerMethodField()
+    type_statistics = serializers.SerializerMethodField()
+
     class Meta:
         model = UploadHistory
-        fields = '__all__'
+        exclude = ('raw_columns', 'column_stats', 'type_stats', 'content_hash')
+
+    def get_raw_data(self, obj):
+        if self.context.get('stream_rows'):
+            # A streamed response reads the rows as it sends them.
+            return obj.row_stream()
+        # Decoded only when rendered; FastJSONRenderer writes it column-wise.
+        return obj.row_window()
+
+    def get_statistics(self, obj):
+        summary = obj.running_summary()
+        return summary.statistics() if summary is not None else None
+
+    def get_type_statistics(self, obj):
+        summary = obj.running_summary()
+        return summary.type_statistics() if summary is not None else None
+
+class UploadHistorySummarySerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    """History entry without its rows, for listing uploads."""
+    # A cached image of the type distribution (null with no types); the
+    # URL is signed, so it loads without the Authorization header.
+    thumbnail_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadHistory
+        fields = UploadHistory.SUMMARY_FIELDS + ('thumbnail_url',)
+
+    def get_thumbnail_url(self, obj):
+        if not obj.type_distribution:
+            return None
+        url = reverse('history-chart', kwargs={'pk': obj.pk, 'chart': 'types', 'image_format': 'png'},
+                      request=self.context.get('request'))
+        return f"{url}?{urlencode({'size': 'thumb', 'token': chart_token(obj, 'types')})}"
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    history_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ('id', 'status', 'file_name', 'bytes_total', 'bytes_done', 'rows_done',
+                  'error', 'history_id', 'created_time', 'updated_time')
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -0,0 +1,221 @@
+"""Mergeable streaming statistics for numeric columns.
+
+Both classes summarise a stream of float arrays in a fixed amount of
+space and can be merged, so the statistics of an upload are built batch
+by batch at ingest time and updated in place when rows are appended.
+Like :mod:`api.ingest`, this module doesn't touch Django.
+"""
+import base64
+import math
+
+import numpy as np
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+HISTOGRAM_BINS = 20
+
+
+class Moments:
+    """Count, sum, extremes and sum of squared deviations of a stream.
+
+    Batches are combined with Chan et al.'s pairwise update, which keeps
+    the variance accurate where summing squares would cancel.
+    """
+
+    def __init__(self, count=0, total=0.0, minimum=math.inf, maximum=-math.inf, m2=0.0):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+        self.m2 = m2
+
+    def add(self, values):
+        if len(values):
+            mean = float(values.mean())
+            self.merge(Moments(len(values), float(values.sum()), float(values.min()),
+                               float(values.max()), float(((values - mean) ** 2).sum())))
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if self.count:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / (self.count + other.count)
+        else:
+            self.m2 = other.m2
+        self.count += other.count
+        self.total += other.total
+        if other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if other.maximum > self.maximum:
+            self.maximum = other.maximum
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def std(self):
+        """Sample standard deviation (0 for fewer than two values)."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0
+
+    def describe(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.minimum if self.count else None,
+            'max': self.maximum if self.count else None,
+        }
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.minimum if self.count else None,
+            'max': self.maximum if self.count else None,
+            'm2': self.m2,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        moments = cls(data['count'], data['sum'])
+        if moments.count:
+            moments.minimum, moments.maximum, moments.m2 = data['min'], data['max'], data['m2']
+        return moments
+
+
+def grouped_moments(values, codes, keys):
+    """``{key: Moments}`` of ``values`` grouped by ``codes``, which index
+    ``keys`` (as returned by ``pandas.factorize``; -1 marks a missing key)."""
+    if (codes < 0).any():
+        values, codes = values[codes >= 0], codes[codes >= 0]
+    if not len(values):
+        return {}
+    size = len(keys)
+    counts = np.bincount(codes, minlength=size)
+    totals = np.bincount(codes, values, minlength=size)
+    means = totals / np.maximum(counts, 1)
+    m2s = np.bincount(codes, (values - means[codes]) ** 2, minlength=size)
+    # Sorted by group, each group's extremes are one reduceat away.
+    ordered = values[np.argsort(codes, kind='stable')]
+    present = np.flatnonzero(counts)
+    starts = (np.cumsum(counts) - counts)[present]
+    minimums, maximums = np.minimum.reduceat(ordered, starts), np.maximum.reduceat(ordered, starts)
+    return {
+        str(keys[i]): Moments(int(counts[i]), float(totals[i]), float(minimums[j]),
+                              float(maximums[j]), float(m2s[i]))
+        for j, i in enumerate(present)
+    }
+
+
+class TDigest:
+    """A merging t-digest (Dunning) for approximate quantiles.
+
+    Values are kept as weighted centroids: narrow near the extremes and
+    wider around the median, at most about ``compression`` of them. The
+    merge step is vectorized -- each sorted point goes to the integer
+    bucket of the k1 scale function at its quantile -- so a batch costs
+    one sort rather than a Python loop over its values.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, values):
+        """Add a batch: it is digested on its own, then merged in."""
+        if len(values):
+            values = np.sort(np.asarray(values, dtype=np.float64))
+            starts = self._buckets((np.arange(len(values)) + 0.5) / len(values))
+            weights = np.diff(np.r_[starts, len(values)])
+            self._merge(np.add.reduceat(values, starts) / weights, weights.astype(np.float64),
+                        float(values[0]), float(values[-1]))
+
+    def merge(self, other):
+        if len(other.weights):
+            self._merge(other.means, other.weights, other.minimum, other.maximum)
+
+    @classmethod
+    def combine(cls, digests):
+        """One digest of all of ``digests``, compressed in a single pass."""
+        combined = cls()
+        digests = [digest for digest in digests if len(digest.weights)]
+        if digests:
+            combined._merge(np.concatenate([digest.means for digest in digests]),
+                            np.concatenate([digest.weights for digest in digests]),
+                            min(digest.minimum for digest in digests),
+                            max(digest.maximum for digest in digests))
+        return combined
+
+    def _buckets(self, q):
+        """Start of each run of sorted points that share a k1 bucket."""
+        k = np.floor(self.compression * (np.arcsin(2 * q - 1) / np.pi + 0.5))
+        return np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+
+    def _merge(self, means, weights, minimum, maximum):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+        cumulative = np.cumsum(weights)
+        starts = self._buckets((cumulative - weights / 2) / cumulative[-1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def _curve(self):
+        """Quantile at each centroid, with the extremes pinned to 0 and 1."""
+        cumulative = np.cumsum(self.weights)
+        midpoints = (cumulative - self.weights / 2) / cumulative[-1]
+        return np.r_[0.0, midpoints, 1.0], np.r_[self.minimum, self.means, self.maximum]
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return None
+        quantiles, values = self._curve()
+        return float(np.interp(q, quantiles, values))
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        """Counts in ``bins`` equal-width bins from the minimum to the maximum.
+
+        Exact while every centroid holds one value, as for small uploads;
+        otherwise read off the digest's interpolated CDF.
+        """
+        if not len(self.weights):
+            return None
+        if (self.weights == 1).all():
+            counts, edges = np.histogram(self.means, bins=bins, range=(self.minimum, self.maximum))
+            return {'edges': edges.tolist(), 'counts': counts.tolist()}
+        edges = np.histogram_bin_edges(self.means, bins=bins, range=(self.minimum, self.maximum))
+        quantiles, values = self._curve()
+        cumulative = np.round(np.interp(edges, values, quantiles) * self.weights.sum())
+        return {'edges': edges.tolist(), 'counts': np.diff(cumulative).astype(int).tolist()}
+
+    def to_dict(self):
+        # Packed float64s: far quicker to load from JSON than lists of numbers.
+        return {'means': _pack(self.means), 'weights': _pack(self.weights)}
+
+    @classmethod
+    def from_dict(cls, data, minimum=None, maximum=None):
+        digest = cls()
+        digest.means = _unpack(data['means'])
+        digest.weights = _unpack(data['weights'])
+        if len(digest.weights):
+            digest.minimum = minimum if minimum is not None else float(digest.means[0])
+            digest.maximum = maximum if maximum is not None else float(digest.means[-1])
+        return digest
+
+
+def _pack(array):
+    return base64.b64encode(array.astype('<f8').tobytes()).decode('ascii')
+
+
+def _unpack(data):
+    if isinstance(data, list):  # as first stored
+        return np.asarray(data, dtype=np.float64)
+    return np.frombuffer(base64.b64decode(data), dtype='<f8')
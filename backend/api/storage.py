@@ -0,0 +1,473 @@
+"""Compact columnar storage for uploaded CSV rows.
+
+A dataset is stored column by column in a compressed ``.npz`` archive:
+numeric columns as float64 arrays, every other column
+dictionary-encoded as int32 codes plus a table of distinct strings.
+Numeric columns are only used when every cell formats back to exactly the
+string that was uploaded, so rows rebuilt from storage are identical to
+the ones parsed from the CSV.
+"""
+import io
+import json
+from json.encoder import encode_basestring
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+FLOAT = 'float'
+COMPACT = 'compact'
+STRING = 'str'
+
+NUMERIC_KINDS = (COMPACT, FLOAT)
+
+# Rows decoded or JSON-encoded per step when a whole window is walked
+CHUNK_ROWS = 10_000
+
+
+def _format(values, kind):
+    """Format floats the way they were uploaded.
+
+    ``float`` is Python's shortest repr (``120.0``); ``compact`` writes
+    integral values without the trailing ``.0`` (``120``).
+    """
+    text = values.astype(str)
+    if kind == COMPACT:
+        with np.errstate(invalid='ignore'):
+            integral = (values == np.trunc(values)) & (np.abs(values) < 1e16)
+            text = np.where(integral, values.astype(np.int64).astype(str), text)
+    return text
+
+
+def json_string(value):
+    """A string as a JSON literal, escaped the way DRF's JSONRenderer does."""
+    text = encode_basestring(value)
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def _as_numeric(strings, kinds):
+    """Return ``(kind, values)`` for the first kind the strings round-trip through."""
+    try:
+        values = np.asarray(strings, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    strings = strings.astype(str)
+    for kind in kinds:
+        if np.array_equal(_format(values, kind), strings):
+            return kind, values
+    return None
+
+
+class _Column:
+    """Accumulates one column batch by batch, degrading to strings if needed."""
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.parts = []
+        self.dictionary = {}
+
+    def add(self, strings):
+        if self.kind != STRING:
+            kinds = NUMERIC_KINDS if self.kind is None else (self.kind,)
+            numeric = _as_numeric(strings, kinds)
+            if numeric is not None:
+                self.kind = numeric[0]
+                self.parts.append(numeric[1])
+                return
+            self._degrade()
+        self.parts.append(self._encode(strings))
+
+    def _degrade(self):
+        parts, kind = self.parts, self.kind
+        self.kind, self.parts = STRING, []
+        for part in parts:
+            self.parts.append(self._encode(_format(part, kind).astype(object)))
+
+    def _encode(self, strings):
+        codes, uniques = pd.factorize(strings)
+        mapping = [self.dictionary.setdefault(value, len(self.dictionary)) for value in uniques]
+        # factorize marks missing (None) cells with -1, which maps to -1 too.
+        return np.array(mapping + [-1], dtype=np.int32)[codes]
+
+    def add_numbers(self, values, integral=False):
+        """Add a batch that is numeric already (from a typed upload). It is
+        stored as it is and formats as ``compact`` when the column is integral."""
+        if self.kind is None:
+            self.kind = COMPACT if integral else FLOAT
+        if self.kind == STRING:
+            self.parts.append(self._encode(_format(values, FLOAT).astype(object)))
+        else:
+            self.parts.append(values)
+
+    def finish(self):
+        kind = self.kind or STRING
+        dtype = np.int32 if kind == STRING else np.float64
+        data = np.concatenate(self.parts).astype(dtype) if self.parts else np.empty(0, dtype)
+        return kind, data, np.array(list(self.dictionary), dtype=str)
+
+
+class ColumnarWriter:
+    """Collects parsed batches (DataFrames of strings) and encodes them.
+
+    Numeric columns of typed batches (from Parquet or Arrow uploads) are
+    stored without going through strings.
+
+    Numeric columns named in ``index_columns`` (see :meth:`to_bytes`) also
+    get a stored sort order, so rows can be served sorted by them without
+    sorting per request.
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.row_count = 0
+
+    def add_batch(self, frame):
+        if self.columns is None:
+            self.columns = [_Column(name) for name in frame.columns]
+        for column in self.columns:
+            values = frame[column.name]
+            if values.dtype.kind in 'iuf':
+                column.add_numbers(values.to_numpy(dtype=np.float64), integral=values.dtype.kind != 'f')
+            elif values.dtype != object:
+                column.add(values.astype(str).to_numpy(dtype=object))
+            else:
+                column.add(values.to_numpy(dtype=object))
+        self.row_count += len(frame)
+
+    def to_bytes(self, index_columns=()):
+        index_columns = set(index_columns)
+        arrays = {}
+        meta = {'version': FORMAT_VERSION, 'rows': self.row_count, 'columns': []}
+        for index, column in enumerate(self.columns or []):
+            kind, data, dictionary = column.finish()
+            meta['columns'].append({'name': column.name, 'kind': kind})
+            arrays[f'c{index}'] = data
+            if kind == STRING:
+                arrays[f'd{index}'] = dictionary
+            elif column.name in index_columns:
+                arrays[f'o{index}'] = np.argsort(data, kind='stable').astype(np.int32)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, meta=np.array(json.dumps(meta)), **arrays)
+        return buffer.getvalue()
+
+
+class StoredDataset:
+    """Read access to an encoded dataset; columns are decompressed on demand."""
+
+    def __init__(self, blob):
+        self._archive = np.load(io.BytesIO(bytes(blob)), allow_pickle=False)
+        self._arrays = {}
+        meta = json.loads(self._archive['meta'].item())
+        self.row_count = meta['rows']
+        self.columns = [column['name'] for column in meta['columns']]
+        self._kinds = [column['kind'] for column in meta['columns']]
+
+    @classmethod
+    def concat(cls, datasets):
+        """One dataset with the rows of ``datasets`` (which share columns), in order.
+
+        Numeric columns of one kind are concatenated as they are; any other
+        column is merged into a single dictionary, remapping codes rather
+        than decoding rows.
+        """
+        if len(datasets) == 1:
+            return datasets[0]
+        combined = cls.__new__(cls)
+        combined._archive = None
+        combined._arrays = {}
+        combined.row_count = sum(dataset.row_count for dataset in datasets)
+        combined.columns = list(datasets[0].columns)
+        combined._kinds = []
+        for index, name in enumerate(combined.columns):
+            kinds = {dataset._kinds[dataset._index(name)] for dataset in datasets}
+            kind = kinds.pop() if len(kinds) == 1 else STRING
+            if kind != STRING:
+                combined._arrays[f'c{index}'] = np.concatenate([dataset.values(name) for dataset in datasets])
+            else:
+                dictionary = {}
+                parts = []
+                for dataset in datasets:
+                    codes, uniques = dataset._codes(name)
+                    mapping = [dictionary.setdefault(value, len(dictionary)) for value in uniques.tolist()]
+                    parts.append(np.array(mapping + [-1], dtype=np.int32)[codes])
+                combined._arrays[f'c{index}'] = np.concatenate(parts)
+                combined._arrays[f'd{index}'] = np.array(list(dictionary), dtype=str)
+            combined._kinds.append(kind)
+        return combined
+
+    def _array(self, key):
+        if key not in self._arrays:
+            self._arrays[key] = self._archive[key]
+        return self._arrays[key]
+
+    def _has(self, key):
+        return key in self._arrays or (self._archive is not None and key in self._archive.files)
+
+    def _codes(self, name):
+        """The column dictionary-encoded: ``(codes, distinct strings)``."""
+        index = self._index(name)
+        kind, data = self._kinds[index], self._array(f'c{index}')
+        if kind == STRING:
+            return data, self._array(f'd{index}')
+        return pd.factorize(_format(data, kind))
+
+    def _index(self, name):
+        try:
+            return self.columns.index(name)
+        except ValueError:
+            raise KeyError(name) from None
+
+    def is_numeric(self, name):
+        return self._kinds[self._index(name)] != STRING
+
+    def values(self, name):
+        """The column as a typed array (codes for dictionary-encoded columns)."""
+        return self._array(f'c{self._index(name)}')
+
+    def dictionary(self, name):
+        """The distinct strings of a dictionary-encoded column, which its
+        codes index (-1 marks a missing cell)."""
+        return self._array(f'd{self._index(name)}')
+
+    def strings(self, name, rows=None):
+        """The column (or the given row positions of it) as uploaded strings."""
+        index = self._index(name)
+        kind, data = self._kinds[index], self._array(f'c{index}')
+        if rows is not None:
+            data = data[rows]
+        if kind != STRING:
+            return _format(data, kind).tolist()
+        # Code -1 (a missing cell) picks the trailing None.
+        return np.append(self._array(f'd{index}').astype(object), None)[data].tolist()
+
+    def json_values(self, name, rows=None):
+        """The column (or the given rows of it) as JSON literals, e.g. ``"120"``.
+
+        Each distinct string is escaped once; numbers never need escaping.
+        """
+        index = self._index(name)
+        data = self._array(f'c{index}')
+        return self._json_literals(index, data[rows] if rows is not None else data)
+
+    def _json_literals(self, index, data):
+        """Column ``index``'s stored ``data`` (numbers or codes) as JSON literals."""
+        kind = self._kinds[index]
+        if kind != STRING:
+            return ('"' + _format(data, kind).astype(object)) + '"'
+        dictionary = self._array(f'd{index}')
+        if len(dictionary) > len(data):
+            # Mostly distinct values (names, ids): escape just these rows
+            # rather than keeping every literal of the column in memory.
+            literals = np.array(list(map(json_string, dictionary[np.maximum(data, 0)].tolist())),
+                                dtype=object)
+            literals[data < 0] = 'null'
+            return literals
+        key = f'j{index}'
+        if key not in self._arrays:
+            literals = list(map(json_string, dictionary.tolist()))
+            # Code -1 (a missing cell) picks the trailing null.
+            self._arrays[key] = np.array(literals + ['null'], dtype=object)
+        return self._arrays[key][data]
+
+    def _column_chunks(self, index, chunk_rows):
+        """Yield column ``index``'s stored data ``chunk_rows`` at a time,
+        decompressing the archive member only as far as it has been read."""
+        key = f'c{index}'
+        if key in self._arrays or self._archive is None:
+            data = self._array(key)
+            for start in range(0, self.row_count, chunk_rows):
+                yield data[start:start + chunk_rows]
+            return
+        with self._archive.zip.open(key + '.npy') as member:
+            version = np.lib.format.read_magic(member)
+            if version == (1, 0):
+                _, _, dtype = np.lib.format.read_array_header_1_0(member)
+            else:
+                _, _, dtype = np.lib.format.read_array_header_2_0(member)
+            for start in range(0, self.row_count, chunk_rows):
+                count = min(chunk_rows, self.row_count - start)
+                yield np.frombuffer(member.read(count * dtype.itemsize), dtype=dtype)
+
+    def iter_json_objects(self, names=None, chunk_rows=CHUNK_ROWS):
+        """Yield the rows in stored order, as lists of up to ``chunk_rows``
+        JSON object strings with the keys ``names`` (all columns by default).
+
+        Columns are read from the archive a chunk at a time, so only the
+        dictionaries of distinct strings are ever decompressed whole.
+        """
+        names = self.columns if names is None else names
+        if not names:
+            for start in range(0, self.row_count, chunk_rows):
+                yield ['{}'] * min(chunk_rows, self.row_count - start)
+            return
+        indexes = [self._index(name) for name in names]
+        keys = [('{' if i == 0 else ',') + json_string(name) + ':' for i, name in enumerate(names)]
+        for chunks in zip(*(self._column_chunks(index, chunk_rows) for index in indexes)):
+            objects = keys[0] + self._json_literals(indexes[0], chunks[0])
+            for key, index, data in zip(keys[1:], indexes[1:], chunks[1:]):
+                objects = objects + key + self._json_literals(index, data)
+            yield (objects + '}').tolist()
+
+    def sort_order(self, name, descending=False):
+        """Row positions ordered by a column, from the stored index if there is one."""
+        index = self._index(name)
+        key = f'o{index}'
+        if self._has(key):
+            order = self._array(key)
+        elif self._kinds[index] != STRING:
+            order = np.argsort(self._array(f'c{index}'), kind='stable')
+        else:
+            dictionary = self._array(f'd{index}')
+            try:
+                # Numbers that didn't round-trip (e.g. "5.20") still sort as numbers.
+                dictionary = dictionary.astype(np.float64)
+            except ValueError:
+                pass
+            ranks = np.append(np.argsort(np.argsort(dictionary, kind='stable')), -1)
+            order = np.argsort(ranks[self._array(f'c{index}')], kind='stable')
+        return order[::-1] if descending else order
+
+    def matches(self, name, value):
+        """Boolean mask of the rows whose ``name`` cell equals ``value``."""
+        index = self._index(name)
+        data = self._array(f'c{index}')
+        if self._kinds[index] != STRING:
+            return data == float(value)
+        dictionary = self._array(f'd{index}')
+        codes = np.flatnonzero(dictionary == value)
+        return data == codes[0] if len(codes) else np.zeros(len(data), dtype=bool)
+
+    def take(self, rows):
+        """Rebuild only the rows at the given positions."""
+        columns = [self.strings(name, rows) for name in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+    def to_rows(self):
+        columns = [self.strings(name) for name in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+    def window(self, sort=None, filters=()):
+        """A sliceable, lazily decoded view of the rows.
+
+        ``sort`` is a column name, prefixed with ``-`` for descending order;
+        ``filters`` is a sequence of ``(column, value)`` equality tests.
+        """
+        if sort:
+            order = self.sort_order(sort.lstrip('-'), descending=sort.startswith('-'))
+        else:
+            order = np.arange(self.row_count)
+        if filters:
+            mask = np.ones(self.row_count, dtype=bool)
+            for name, value in filters:
+                mask &= self.matches(name, value)
+            order = order[mask[order]]
+        return RowWindow(self, order)
+
+
+class JSONRows:
+    """Rows that can be written out as JSON a chunk at a time; subclasses
+    yield each chunk as a list of JSON object strings from ``json_chunks``."""
+
+    def json_chunks(self, chunk_rows=CHUNK_ROWS):
+        raise NotImplementedError
+
+    def iter_json(self, chunk_rows=CHUNK_ROWS):
+        """Yield the rows as one JSON array, in UTF-8 chunks."""
+        yield b'['
+        separator = ''
+        for objects in self.json_chunks(chunk_rows):
+            if objects:
+                yield (separator + ','.join(objects)).encode()
+                separator = ','
+        yield b']'
+
+    def iter_ndjson(self, chunk_rows=CHUNK_ROWS):
+        """Yield the rows as newline-delimited JSON, one object per line."""
+        for objects in self.json_chunks(chunk_rows):
+            if objects:
+                yield ('\n'.join(objects) + '\n').encode()
+
+
+class RowWindow(JSONRows):
+    """Sequence of rows at given positions; slicing decodes only the slice."""
+
+    def __init__(self, dataset, positions):
+        self.dataset = dataset
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.dataset.take(self.positions[item])
+        return self.dataset.take(self.positions[[item]])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), CHUNK_ROWS):
+            yield from self[start:start + CHUNK_ROWS]
+
+    def tolist(self):
+        # Lets DRF's JSON encoder serialize a window like a list.
+        return self.dataset.take(self.positions)
+
+    def json_objects(self, rows):
+        """The rows at the given positions as a list of JSON object strings.
+
+        Rows are assembled column by column from the stored arrays, so no
+        per-row dict is ever built.
+        """
+        names = self.dataset.columns
+        if not names:
+            return ['{}'] * len(rows)
+        keys = [('{' if i == 0 else ',') + json_string(name) + ':' for i, name in enumerate(names)]
+        objects = keys[0] + self.dataset.json_values(names[0], rows)
+        for key, name in zip(keys[1:], names[1:]):
+            objects = objects + key + self.dataset.json_values(name, rows)
+        return (objects + '}').tolist()
+
+    def json_chunks(self, chunk_rows=CHUNK_ROWS):
+        for start in range(0, len(self.positions), chunk_rows):
+            yield self.json_objects(self.positions[start:start + chunk_rows])
+
+
+class RowStream(JSONRows):
+    """The rows of an upload and its appended segments, in order, for a
+    streamed response.
+
+    ``blobs`` is an iterable of the stored archives, which are opened one
+    at a time as they are reached and read a chunk at a time (see
+    :meth:`StoredDataset.iter_json_objects`), so memory stays bounded
+    however many rows there are.
+    """
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def json_chunks(self, chunk_rows=CHUNK_ROWS):
+        names = None
+        for blob in self.blobs:
+            dataset = StoredDataset(blob)
+            if names is None:
+                names = dataset.columns
+            yield from dataset.iter_json_objects(names, chunk_rows)
+
+
+def encode_rows(rows, index_columns=()):
+    """Encode a legacy list of row dicts, or return ``None`` if that would be lossy.
+
+    Only rows that share one set of string keys and hold string (or null)
+    values can be rebuilt exactly from columnar storage. ``index_columns``
+    is passed on to :meth:`ColumnarWriter.to_bytes`.
+    """
+    names = list(rows[0]) if rows else []
+    for row in rows:
+        if list(row) != names or not all(isinstance(name, str) for name in names):
+            return None
+        if not all(value is None or isinstance(value, str) for value in row.values()):
+            return None
+    writer = ColumnarWriter()
+    writer.add_batch(pd.DataFrame.from_records(rows, columns=names))
+    return writer.to_bytes(index_columns)
@@ -1,3 +1,1018 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import statistics
+import struct
+import tempfile
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import jobs, renderers, thumbnails
+from .aggregation import BUCKETS, history_buckets, rebuild_rollups
+from .arrow import pa
+from .ingest import ingest_csv
+from .management.commands.bench_summary import per_row_summary, write_sample_csv
+from .models import UploadHistory, UploadJob
+from .parsing import ParseReport
+from .renderers import FastJSONRenderer
+from .sketches import Moments, TDigest
+from .storage import ColumnarWriter, encode_rows, StoredDataset
+from .thumbnails import chart_token, check_chart_token
+
+CSV = (b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+       b"P1,Pump,120,5.2,110\n"
+       b"V1,Valve,60.5,4.1,105\n"
+       b"P2,Pump,130,5.5,115.25\n")
+
+
+def csv_file(data=CSV, name='equipment.csv'):
+    return SimpleUploadedFile(name, data, content_type='text/csv')
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = User.objects.create_user('tester', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, data=CSV, name='equipment.csv'):
+        response = self.client.post('/api/upload/', {'file': csv_file(data, name)}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+
+class IngestTests(APITestCase):
+    def test_summary(self):
+        summary = ingest_csv(io.BytesIO(CSV)).as_model_fields()
+        self.assertEqual(summary['total_count'], 3)
+        self.assertAlmostEqual(summary['avg_flowrate'], (120 + 60.5 + 130) / 3)
+        self.assertAlmostEqual(summary['avg_pressure'], (5.2 + 4.1 + 5.5) / 3)
+        self.assertAlmostEqual(summary['avg_temperature'], (110 + 105 + 115.25) / 3)
+        self.assertEqual(summary['type_distribution'], {'Pump': 2, 'Valve': 1})
+
+    def test_concentration_stands_in_for_flowrate(self):
+        summary = ingest_csv(io.BytesIO(b"Type,Concentration\nPump,2\nPump,4\n")).as_model_fields()
+        self.assertEqual(summary['avg_flowrate'], 3)
+        self.assertEqual(summary['avg_pressure'], 0)
+
+    def test_upload_returns_rows_and_summary(self):
+        data = self.upload()
+        self.assertEqual(data['raw_data'], list(csv.DictReader(io.StringIO(CSV.decode()))))
+        self.assertEqual(data['summary']['total_count'], 3)
+        history = UploadHistory.objects.get(pk=data['history_id'])
+        self.assertEqual(history.user, self.user)
+        self.assertAlmostEqual(history.avg_flowrate, (120 + 60.5 + 130) / 3)
+        self.assertEqual(history.type_distribution, {'Pump': 2, 'Valve': 1})
+
+    def test_empty_csv_is_rejected(self):
+        response = self.client.post('/api/upload/', {'file': csv_file(b"Type,Flowrate\n")},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadHistory.objects.exists())
+
+
+class SummaryEngineTests(TestCase):
+    def assert_summaries_equal(self, expected, actual):
+        self.assertEqual(actual['total_count'], expected['total_count'])
+        for field in ('avg_flowrate', 'avg_pressure', 'avg_temperature'):
+            self.assertAlmostEqual(actual[field], expected[field], places=9, msg=field)
+        self.assertEqual(actual['type_distribution'], expected['type_distribution'])
+
+    def test_vectorized_engine_matches_the_per_row_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sample.csv')
+            write_sample_csv(path, 1000)
+            expected = per_row_summary(path)
+            with open(path, 'rb') as f:
+                # Several batches, the last one partial.
+                self.assert_summaries_equal(expected, ingest_csv(f, batch_rows=300).as_model_fields())
+
+
+class StorageTests(APITestCase):
+    def test_round_trip_keeps_cells_as_uploaded(self):
+        batches = [
+            pd.DataFrame({'Name': ['a', 'b', None], 'Flowrate': ['1', '2.50', '007'],
+                          'Pressure': ['1.5', '-2', '3e2'], 'Blank': [None, None, None]}),
+            pd.DataFrame({'Name': ['a', '', 'c'], 'Flowrate': ['4', '', 'n/a'],
+                          'Pressure': ['0.25', '7', '1e-3'], 'Blank': [None, None, None]}),
+        ]
+        writer = ColumnarWriter()
+        for batch in batches:
+            writer.add_batch(batch)
+        dataset = StoredDataset(writer.to_bytes())
+
+        expected = pd.concat(batches, ignore_index=True)
+        self.assertEqual(dataset.row_count, 6)
+        self.assertEqual(dataset.columns, ['Name', 'Flowrate', 'Pressure', 'Blank'])
+        for name in dataset.columns:
+            self.assertEqual(list(dataset.strings(name)), expected[name].tolist(), name)
+        self.assertEqual(dataset.to_rows(), expected.to_dict('records'))
+
+    def test_encode_rows(self):
+        rows = [{'Type': 'Pump', 'Flowrate': '1.0'}, {'Type': None, 'Flowrate': '2'}]
+        self.assertEqual(StoredDataset(encode_rows(rows)).to_rows(), rows)
+        # Rows that can't be rebuilt exactly are left alone.
+        self.assertIsNone(encode_rows([{'Type': 'Pump'}, {'Kind': 'Pump'}]))
+        self.assertIsNone(encode_rows([{'Flowrate': 1.5}]))
+
+    def test_detail_returns_the_uploaded_rows(self):
+        history_id = self.upload()['history_id']
+        response = self.client.get(f'/api/history/{history_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['raw_data'], list(csv.DictReader(io.StringIO(CSV.decode()))))
+
+    def test_rows_match_dict_reader(self):
+        data = ("Equipment Name,Type,Flowrate,Type,,Pressure,Temperature\n"
+                "P1,Pump,120,Centrifugal,x,5.2,110\n"
+                "V1,Valve,,,,4.1,\n"
+                "P2,Pump,130\n")
+        history_id = self.upload(data.encode())['history_id']
+        rows = self.client.get(f'/api/history/{history_id}/').json()['raw_data']
+        expected = list(csv.DictReader(io.StringIO(data)))
+        self.assertEqual([list(row) for row in rows], [list(row) for row in expected])
+        self.assertEqual(rows[0]['Type'], 'Centrifugal')
+        # Cells missing from a short line read as empty, not None.
+        self.assertEqual(rows, [{name: value or '' for name, value in row.items()} for row in expected])
+
+
+class HistoryListTests(APITestCase):
+    def upload_several(self, count):
+        return [self.upload(CSV + f"X{i},Pump,{i},1,1\n".encode(), f'{i}.csv')['history_id']
+                for i in range(count)]
+
+    def test_list_is_unpaginated_and_has_no_rows(self):
+        ids = self.upload_several(3)
+        response = self.client.get('/api/history/')
+        self.assertEqual(response.status_code, 200)
+        entries = response.json()
+        self.assertEqual([entry['id'] for entry in entries], ids[::-1])
+        self.assertTrue(all('raw_data' not in entry for entry in entries))
+        self.assertEqual(entries[0]['total_count'], 4)
+
+    def test_cursor_pages(self):
+        ids = self.upload_several(5)
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_authenticate(other)
+        self.upload()
+        self.client.force_authenticate(self.user)
+
+        seen, url, params = [], '/api/history/', {'page_size': 2}
+        while url:
+            page = self.client.get(url, params).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [entry['id'] for entry in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(seen, ids[::-1])
+
+
+class QueryPlanTests(APITestCase):
+    def test_list_query_uses_the_user_index(self):
+        self.upload()
+        plan = UploadHistory.objects.filter(user=self.user).summaries().explain()
+        self.assertIn('history_user_', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class RowsTests(APITestCase):
+    def test_rows_are_paged_sorted_and_filtered(self):
+        history_id = self.upload()['history_id']
+        url = f'/api/history/{history_id}/rows/'
+
+        page = self.client.get(url, {'sort': '-Flowrate'}).json()
+        self.assertEqual(page['count'], 3)
+        self.assertEqual([row['Equipment Name'] for row in page['results']], ['P2', 'P1', 'V1'])
+        self.assertEqual(page['results'][0], {'Equipment Name': 'P2', 'Type': 'Pump', 'Flowrate': '130',
+                                              'Pressure': '5.5', 'Temperature': '115.25'})
+
+        page = self.client.get(url, {'offset': 1, 'limit': 1}).json()
+        self.assertEqual([row['Equipment Name'] for row in page['results']], ['V1'])
+        self.assertIsNotNone(page['next'])
+
+        page = self.client.get(url, {'filter': 'Type:Pump', 'sort': 'Temperature'}).json()
+        self.assertEqual([row['Equipment Name'] for row in page['results']], ['P1', 'P2'])
+
+        self.assertEqual(self.client.get(url, {'sort': 'Nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'filter': 'Type'}).status_code, 400)
+
+    def test_index_columns_get_a_stored_sort_order(self):
+        writer = ColumnarWriter()
+        writer.add_batch(pd.DataFrame({'Name': ['a', 'b', 'c'], 'Pressure (kPa)': ['3', '1', '2']}))
+        blob = writer.to_bytes(['Pressure (kPa)'])
+        files = np.load(io.BytesIO(blob)).files
+        self.assertIn('o1', files)
+        self.assertNotIn('o0', files)
+        dataset = StoredDataset(blob)
+        self.assertEqual(list(dataset.sort_order('Pressure (kPa)')), [1, 2, 0])
+        self.assertEqual(list(dataset.sort_order('Name', descending=True)), [2, 1, 0])
+        self.assertEqual(dataset.take([2, 0]),
+                         [{'Name': 'c', 'Pressure (kPa)': '2'}, {'Name': 'a', 'Pressure (kPa)': '3'}])
+
+    def test_aliased_headers_are_indexed(self):
+        data = self.upload(b"Type,Flow Rate (m3/h),Pressure (kPa)\nPump,3,250\nValve,1,900\n")
+        history_id = data['history_id']
+        files = np.load(io.BytesIO(UploadHistory.objects.get(pk=history_id).raw_columns)).files
+        self.assertIn('o1', files)
+        self.assertIn('o2', files)
+        page = self.client.get(f'/api/history/{history_id}/rows/', {'sort': '-Pressure (kPa)'}).json()
+        self.assertEqual([row['Type'] for row in page['results']], ['Valve', 'Pump'])
+
+
+class ConditionalGetTests(APITestCase):
+    def test_list_revalidates(self):
+        self.upload()
+        response = self.client.get('/api/history/')
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+        self.assertEqual(self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.upload(CSV + b"V2,Valve,70,4.0,100\n", 'other.csv')
+        response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_detail_and_rows_revalidate_without_reading_rows(self):
+        history_id = self.upload()['history_id']
+        for url in (f'/api/history/{history_id}/', f'/api/history/{history_id}/rows/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_other_users_uploads_are_not_found(self):
+        history_id = self.upload()['history_id']
+        self.client.force_authenticate(User.objects.create_user('other', password='secret'))
+        self.assertEqual(self.client.get(f'/api/history/{history_id}/').status_code, 404)
+
+
+class ResponseCacheTests(APITestCase):
+    def test_repeated_requests_are_served_from_the_cache(self):
+        history_id = self.upload()['history_id']
+        for url in ('/api/history/', f'/api/history/{history_id}/', f'/api/history/{history_id}/rows/'):
+            first = self.client.get(url)
+            # Only the ETag query runs; the rows aren't read again.
+            with self.assertNumQueries(1):
+                second = self.client.get(url)
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.content, first.content)
+
+    def test_upload_invalidates_cached_responses(self):
+        history_id = self.upload()['history_id']
+        url = f'/api/history/{history_id}/'
+        self.client.get(url)
+        self.upload(CSV + b"V2,Valve,70,4.0,100\n", 'other.csv')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertGreater(len(queries), 1)
+
+    def test_hosts_are_cached_apart(self):
+        self.upload()
+        urls = [self.client.get('/api/history/', HTTP_HOST=host).json()[0]['thumbnail_url']
+                for host in ('testserver', 'example.com')]
+        self.assertTrue(urls[0].startswith('http://testserver/'))
+        self.assertTrue(urls[1].startswith('http://example.com/'))
+
+
+class UploadJobTests(TransactionTestCase):
+    # The job runs on the real worker thread, which needs committed rows.
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = User.objects.create_user('tester', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, data):
+        response = self.client.post('/api/upload/?async=1', {'file': csv_file(data)}, format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response['Location'], response.json()['status_url'])
+        return response.json()['status_url']
+
+    def wait(self, status_url):
+        deadline = time.monotonic() + 30
+        while True:
+            job = self.client.get(status_url).json()
+            if job['status'] in (UploadJob.DONE, UploadJob.FAILED) or time.monotonic() > deadline:
+                return job
+            time.sleep(0.05)
+
+    def test_job_runs_to_completion(self):
+        job = self.wait(self.submit(CSV))
+        self.assertEqual(job['status'], UploadJob.DONE, job)
+        self.assertEqual(job['rows_done'], 3)
+        self.assertEqual(job['bytes_done'], len(CSV))
+        self.assertEqual(job['file_name'], 'equipment.csv')
+        history = UploadHistory.objects.get(pk=job['history_id'])
+        self.assertEqual(history.user, self.user)
+        self.assertEqual(history.total_count, 3)
+
+    def test_failed_job_reports_the_error(self):
+        with self.assertLogs('api.jobs', 'INFO'):
+            job = self.wait(self.submit(b"Type,Flowrate\n"))
+        self.assertEqual(job['status'], UploadJob.FAILED, job)
+        self.assertEqual(job['error'], 'Empty CSV')
+        self.assertIsNone(job['history_id'])
+        self.assertFalse(UploadHistory.objects.exists())
+
+    def test_unexpected_errors_fail_the_job(self):
+        job = UploadJob.objects.create(user=self.user, file_name='gone.csv')
+        with self.assertLogs('api.jobs', 'ERROR'):
+            jobs.run_upload_job(job.pk, os.path.join(tempfile.gettempdir(), 'no-such-upload.csv'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.FAILED)
+        self.assertIn('no-such-upload.csv', job.error)
+
+    def test_spool_file_keeps_the_suffix(self):
+        with mock.patch.object(jobs.tempfile, 'NamedTemporaryFile',
+                               wraps=tempfile.NamedTemporaryFile) as spool:
+            response = self.client.post('/api/upload/?async=1', {'file': csv_file(name='plant.txt')},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(spool.call_args.kwargs['suffix'], '.txt')
+        self.assertEqual(self.wait(response['Location'])['status'], UploadJob.DONE)
+
+    def test_stale_jobs_are_failed(self):
+        stale = UploadJob.objects.create(user=self.user, status=UploadJob.RUNNING)
+        queued = UploadJob.objects.create(user=self.user)
+        UploadJob.objects.filter(pk__in=[stale.pk, queued.pk]).update(
+            updated_time=timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_STALE_AFTER + 1))
+        fresh = UploadJob.objects.create(user=self.user, status=UploadJob.RUNNING)
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertEqual(jobs.fail_stale_jobs(), 2)
+        statuses = dict(UploadJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {stale.pk: UploadJob.FAILED, queued.pk: UploadJob.FAILED,
+                                    fresh.pk: UploadJob.RUNNING})
+
+
+class BatchUploadTests(APITestCase):
+    def post(self, *files):
+        return self.client.post('/api/upload/', {'file': list(files)}, format='multipart')
+
+    def test_several_files(self):
+        response = self.post(csv_file(name='a.csv'), csv_file(b"Type,Flowrate\n", 'empty.csv'))
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['message'], '1 of 2 files uploaded successfully')
+        first, second = data['uploads']
+        self.assertEqual(first['file'], 'a.csv')
+        self.assertEqual(first['summary']['total_count'], 3)
+        self.assertEqual(UploadHistory.objects.get(pk=first['history_id']).total_count, 3)
+        self.assertEqual(second, {'file': 'empty.csv', 'error': 'Empty CSV'})
+
+    def test_zip_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('a.csv', CSV)
+            archive.writestr('plant/b.csv', CSV + b"V2,Valve,70,4.0,100\n")
+            archive.writestr('__MACOSX/plant/._b.csv', b'resource fork')
+            archive.writestr('notes.txt', b'not a CSV')
+        upload = SimpleUploadedFile('plant.zip', buffer.getvalue(), content_type='application/zip')
+        response = self.post(upload)
+        self.assertEqual(response.status_code, 200, response.content)
+        uploads = response.json()['uploads']
+        self.assertEqual([upload['file'] for upload in uploads],
+                         ['plant.zip/a.csv', 'plant.zip/plant/b.csv'])
+        self.assertEqual([upload['summary']['total_count'] for upload in uploads], [3, 4])
+        self.assertEqual(UploadHistory.objects.filter(user=self.user).count(), 2)
+
+    def test_rejected_batches(self):
+        response = self.post(csv_file(b"Type\n", 'a.csv'), csv_file(b"Type,Flowrate\n", 'b.csv'))
+        self.assertEqual(response.status_code, 400)
+        with override_settings(UPLOAD_BATCH_MAX_FILES=1):
+            response = self.post(csv_file(name='a.csv'), csv_file(name='b.csv'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 1 files', response.json()['error'])
+        self.assertFalse(UploadHistory.objects.exists())
+
+    def zip_file(self, *names):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name in names:
+                archive.writestr(name, CSV)
+        return SimpleUploadedFile('plant.zip', buffer.getvalue(), content_type='application/zip')
+
+    def test_zip_limits_are_checked_before_extracting(self):
+        archives = [self.zip_file('a.csv', 'b.csv', 'c.csv') for _ in range(2)]
+        with mock.patch.object(zipfile.ZipFile, 'open', side_effect=AssertionError('read')):
+            with override_settings(UPLOAD_BATCH_MAX_FILES=2):
+                response = self.post(archives[0])
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('at most 2 files', response.json()['error'])
+            with override_settings(UPLOAD_BATCH_MAX_BYTES=2 * len(CSV)):
+                response = self.post(archives[1])
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(f'at most {2 * len(CSV)} bytes', response.json()['error'])
+        self.assertFalse(UploadHistory.objects.exists())
+
+    def test_zip_entries_are_spooled_and_removed(self):
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(UPLOAD_SPOOL_DIR=spool_dir):
+            response = self.post(self.zip_file('a.csv', 'b.csv'))
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(os.listdir(spool_dir), [])
+        # Both entries are the same file, so it is stored once.
+        self.assertEqual([upload['duplicate'] for upload in response.json()['uploads']], [False, True])
+        self.assertEqual(UploadHistory.objects.count(), 1)
+
+
+class FastJSONRendererTests(APITestCase):
+    ROWS = [
+        {'Name': 'Pompe "A"\\1', 'Type': 'Pump', 'Flowrate': '120', 'Note': 'line\u2028break'},
+        {'Name': 'Vanne à bille', 'Type': None, 'Flowrate': '60.50', 'Note': ''},
+        {'Name': '</script>', 'Type': 'Pump', 'Flowrate': '1e3', 'Note': '\u2029\t\n'},
+    ]
+
+    def test_same_bytes_as_json_renderer(self):
+        dataset = StoredDataset(encode_rows(self.ROWS))
+        uploaded = datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc)
+        data = {'id': 7, 'raw_data': dataset.window(), 'avg': 1 / 3, 'none': None,
+                'nested': {'types': {'Pump': 2}, 'list': [1, 'two', None]},
+                'times': [uploaded, uploaded.date(), uploaded.time(), uploaded.replace(microsecond=0)]}
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_views_render_the_same_bytes(self):
+        history_id = self.upload(
+            "Name,Type,Flowrate,Note\n"
+            "\"Pompe \"\"A\"\"\\1\",Pump,120,line\u2028break\n"
+            "Vanne à bille,,60.50,\n".encode())['history_id']
+        urls = ('/api/history/', f'/api/history/{history_id}/', f'/api/history/{history_id}/rows/')
+        fast = [self.client.get(url).content for url in urls]
+        for cache in caches.all():
+            cache.clear()
+        with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, FAST_JSON_VIEWS=())):
+            slow = [self.client.get(url).content for url in urls]
+        self.assertEqual(fast, slow)
+
+
+class StreamingDetailTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Enough rows to be sent in several chunks.
+        lines = [f"E{i},{'Pump' if i % 3 else 'Valve'},{i % 97}.5,{i % 13},{100 + i % 7}"
+                 for i in range(25_000)]
+        self.history_id = self.upload(
+            ("Equipment Name,Type,Flowrate,Pressure,Temperature\n" + "\n".join(lines) + "\n").encode(),
+            'large.csv')['history_id']
+        self.url = f'/api/history/{self.history_id}/'
+
+    def stream(self, kind):
+        response = self.client.get(self.url, {'stream': kind})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_json_stream_matches_the_regular_response(self):
+        regular = self.client.get(self.url).content
+        response, content = self.stream('json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(content, regular)
+
+    def test_ndjson_framing(self):
+        regular = self.client.get(self.url).json()
+        response, content = self.stream('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(content.endswith(b'\n'))
+        lines = content.split(b'\n')[:-1]
+        self.assertEqual(len(lines), 25_001)
+        rows = regular.pop('raw_data')
+        self.assertEqual(json.loads(lines[0]), regular)
+        self.assertEqual([json.loads(line) for line in lines[1:]], rows)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url, {'stream': 'xml'}).status_code, 400)
+
+    def test_appended_segments_are_streamed_a_chunk_at_a_time(self):
+        response = self.client.post(f'{self.url}append/', {'file': csv_file()}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        regular = self.client.get(self.url).json()
+
+        loaded = []
+        load = StoredDataset._array
+
+        def array(dataset, key):
+            loaded.append(key)
+            return load(dataset, key)
+
+        with mock.patch.object(StoredDataset, 'concat', side_effect=AssertionError), \
+                mock.patch.object(StoredDataset, '_array', array):
+            _, content = self.stream('ndjson')
+        # Only the dictionaries of distinct strings are read whole.
+        self.assertTrue(loaded)
+        self.assertTrue(all(key.startswith('d') for key in loaded), loaded)
+        lines = content.split(b'\n')[:-1]
+        self.assertEqual(len(lines), 1 + 25_003)
+        self.assertEqual([json.loads(line) for line in lines[1:]], regular['raw_data'])
+
+
+class ResponseShapingTests(APITestCase):
+    def post(self, params, data=CSV):
+        return self.client.post(f'/api/upload/?{params}', {'file': csv_file(data)}, format='multipart')
+
+    def test_upload_include_and_preview(self):
+        data = self.post('include=summary').json()
+        self.assertNotIn('raw_data', data)
+        self.assertNotIn('raw_data', data['summary'])
+        self.assertEqual(data['summary']['total_count'], 3)
+
+        data = self.post('preview=2', CSV + b"V2,Valve,70,4.0,100\n").json()
+        self.assertEqual(data['raw_data'], list(csv.DictReader(io.StringIO(CSV.decode())))[:2])
+        self.assertEqual(data['summary']['total_count'], 4)
+
+        self.assertEqual(self.post('include=everything').status_code, 400)
+        self.assertEqual(self.post('preview=some').status_code, 400)
+
+    def test_history_fields(self):
+        history_id = self.upload()['history_id']
+        entries = self.client.get('/api/history/', {'fields': 'id,total_count'}).json()
+        self.assertEqual(entries, [{'id': history_id, 'total_count': 3}])
+
+        detail = self.client.get(f'/api/history/{history_id}/', {'fields': 'id,avg_pressure'}).json()
+        self.assertEqual(set(detail), {'id', 'avg_pressure'})
+
+        for url in ('/api/history/', f'/api/history/{history_id}/'):
+            response = self.client.get(url, {'fields': 'id,nope'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('nope', response.json()['fields'])
+
+
+class AppendTests(APITestCase):
+    def append(self, history_id, data):
+        return self.client.post(f'/api/history/{history_id}/append/', {'file': csv_file(data)},
+                                format='multipart')
+
+    def test_append_adds_rows_and_updates_summary(self):
+        history_id = self.upload()['history_id']
+        before = self.client.get(f'/api/history/{history_id}/')
+        self.assertEqual(len(before.json()['raw_data']), 3)
+
+        response = self.append(history_id, b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+                                           b"H1,Heat Exchanger,10,1.0,100\n")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['appended_count'], 1)
+        self.assertEqual(response.json()['summary']['total_count'], 4)
+
+        history = UploadHistory.objects.get(pk=history_id)
+        self.assertEqual(history.total_count, 4)
+        self.assertAlmostEqual(history.avg_flowrate, (120 + 60.5 + 130 + 10) / 4)
+        self.assertAlmostEqual(history.avg_temperature, (110 + 105 + 115.25 + 100) / 4)
+        self.assertEqual(history.type_distribution, {'Pump': 2, 'Valve': 1, 'Heat Exchanger': 1})
+
+        # Cached and conditional responses see the new rows.
+        detail = self.client.get(f'/api/history/{history_id}/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.json()['raw_data'][-1]['Equipment Name'], 'H1')
+        rows = self.client.get(f'/api/history/{history_id}/rows/', {'sort': 'Flowrate'}).json()
+        self.assertEqual(rows['count'], 4)
+        self.assertEqual([row['Equipment Name'] for row in rows['results']], ['H1', 'V1', 'P1', 'P2'])
+
+    def test_append_rejects_other_columns(self):
+        history_id = self.upload()['history_id']
+        response = self.append(history_id, b"Type,Flowrate\nPump,1\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadHistory.objects.get(pk=history_id).total_count, 3)
+
+
+class DeduplicationTests(APITestCase):
+    def test_same_file_is_not_stored_twice(self):
+        first = self.upload()
+        self.assertFalse(first['duplicate'])
+        second = self.upload(name='renamed.csv')
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(second['history_id'], first['history_id'])
+        self.assertEqual(UploadHistory.objects.count(), 1)
+        # A different file is a new upload, and so is the same file from someone else.
+        self.assertFalse(self.upload(CSV + b"V2,Valve,70,4.0,100\n")['duplicate'])
+        self.client.force_authenticate(User.objects.create_user('other', password='secret'))
+        self.assertFalse(self.upload()['duplicate'])
+        self.assertEqual(UploadHistory.objects.count(), 3)
+
+    def test_batch_stores_identical_files_once(self):
+        history_id = self.upload()['history_id']
+        other = CSV + b"V2,Valve,70,4.0,100\n"
+        files = [csv_file(name='a.csv'), csv_file(other, 'b.csv'), csv_file(other, 'c.csv')]
+        response = self.client.post('/api/upload/', {'file': files}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        a, b, c = response.json()['uploads']
+        self.assertEqual((a['history_id'], a['duplicate']), (history_id, True))
+        self.assertFalse(b['duplicate'])
+        self.assertEqual((c['history_id'], c['duplicate']), (b['history_id'], True))
+        self.assertEqual(UploadHistory.objects.count(), 2)
+
+    def test_appending_clears_the_content_hash(self):
+        history_id = self.upload()['history_id']
+        self.client.post(f'/api/history/{history_id}/append/',
+                         {'file': csv_file(CSV.split(b'\n', 1)[0] + b"\nH1,Heater,10,1.0,100\n")},
+                         format='multipart')
+        # The upload no longer matches the original file.
+        self.assertFalse(self.upload()['duplicate'])
+
+
+class StatisticsTests(APITestCase):
+    def test_moments_merge_batch_by_batch(self):
+        values = np.random.default_rng(0).normal(100, 15, 10_000)
+        moments = Moments()
+        for batch in np.array_split(values, 7):
+            part = Moments()
+            part.add(batch)
+            moments.merge(part)
+        self.assertEqual(moments.count, len(values))
+        self.assertAlmostEqual(moments.mean, values.mean(), places=9)
+        self.assertAlmostEqual(moments.std, values.std(ddof=1), places=9)
+        self.assertEqual((moments.minimum, moments.maximum), (values.min(), values.max()))
+        self.assertEqual(Moments.from_dict(moments.to_dict()).describe(), moments.describe())
+
+    def test_digest_quantiles(self):
+        values = np.random.default_rng(1).lognormal(3, 0.5, 200_000)
+        digest = TDigest()
+        for batch in np.array_split(values, 4):
+            digest.add(batch)
+        spread = values.max() - values.min()
+        for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+            self.assertAlmostEqual(digest.quantile(q), np.quantile(values, q), delta=0.005 * spread)
+        self.assertLessEqual(len(digest.weights), 2 * digest.compression)
+        self.assertEqual(sum(digest.histogram()['counts']), len(values))
+
+    def test_detail_statistics(self):
+        history_id = self.upload()['history_id']
+        detail = self.client.get(f'/api/history/{history_id}/').json()
+        flowrate = detail['statistics']['flowrate']
+        self.assertEqual(flowrate['count'], 3)
+        self.assertAlmostEqual(flowrate['mean'], (120 + 60.5 + 130) / 3)
+        self.assertAlmostEqual(flowrate['std'], statistics.stdev([120, 60.5, 130]))
+        self.assertEqual((flowrate['min'], flowrate['max']), (60.5, 130))
+        quantiles = list(flowrate['quantiles'].values())
+        self.assertEqual(list(flowrate['quantiles']), ['p5', 'p25', 'p50', 'p75', 'p95'])
+        self.assertEqual(quantiles, sorted(quantiles))
+        self.assertTrue(60.5 <= quantiles[0] and quantiles[-1] <= 130)
+        self.assertEqual(sum(flowrate['histogram']['counts']), 3)
+        self.assertEqual(detail['type_statistics']['Pump']['flowrate']['mean'], 125)
+
+        # Appended rows are merged into the stored statistics.
+        self.client.post(f'/api/history/{history_id}/append/',
+                         {'file': csv_file(CSV.split(b'\n', 1)[0] + b"\nH1,Heater,200,1.0,100\n")},
+                         format='multipart')
+        detail = self.client.get(f'/api/history/{history_id}/').json()
+        self.assertEqual(detail['statistics']['flowrate']['count'], 4)
+        self.assertEqual(detail['statistics']['flowrate']['max'], 200)
+        self.assertEqual(detail['type_statistics']['Heater']['pressure']['count'], 1)
+
+    def test_non_finite_values(self):
+        data = CSV + b"I1,Pump,inf,1e400,-Infinity\n"
+        response = self.upload(data)
+        self.assertEqual(response['diagnostics']['bad_values'],
+                         {'Flowrate': 1, 'Pressure': 1, 'Temperature': 1})
+        self.assertEqual(response['summary']['total_count'], 4)
+        self.assertAlmostEqual(response['summary']['avg_flowrate'], (120 + 60.5 + 130) / 3)
+        detail = self.client.get(f"/api/history/{response['history_id']}/").json()
+        self.assertEqual(detail['statistics']['pressure']['count'], 3)
+        self.assertEqual(detail['statistics']['temperature']['min'], 105)
+
+
+class AggregateTests(APITestCase):
+    # Missing cells make the per-field value counts differ from the row counts.
+    FILES = [
+        CSV,
+        b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+        b"C1,Compressor,,9.5,80\nC2,Compressor,40,,\n",
+        b"Type,Flowrate,Pressure\nValve,15,2\nValve,25,3\nPump,35,4\n",
+    ]
+
+    def assert_buckets_equal(self, expected, actual):
+        self.assertEqual(len(actual), len(expected))
+        for want, got in zip(expected, actual):
+            self.assertEqual(got.keys(), want.keys())
+            for name, value in want.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(got[name], value, msg=name)
+                else:
+                    self.assertEqual(got[name], value, name)
+
+    def assert_rollups_match_live(self):
+        for bucket in BUCKETS:
+            for window in (1, 3):
+                with override_settings(HISTORY_ROLLUPS=False):
+                    live = history_buckets(self.user, bucket, window=window)
+                rolled_up = history_buckets(self.user, bucket, window=window)
+                self.assert_buckets_equal(live, rolled_up)
+
+    def test_rollups_match_live_aggregate(self):
+        ids = [self.upload(data, f'{i}.csv')['history_id'] for i, data in enumerate(self.FILES)]
+        self.client.post(f'/api/history/{ids[1]}/append/',
+                         {'file': csv_file(b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+                                           b"C3,Compressor,50,8.5,\n")},
+                         format='multipart')
+        self.assert_rollups_match_live()
+
+        day = history_buckets(self.user, 'day')[0]
+        self.assertEqual(day['uploads'], 3)
+        self.assertEqual(day['total_count'], 9)
+        # Averaged over the values present, not over the rows.
+        self.assertAlmostEqual(day['avg_flowrate'], (120 + 60.5 + 130 + 40 + 50 + 15 + 25 + 35) / 8)
+        self.assertAlmostEqual(day['avg_temperature'], (110 + 105 + 115.25 + 80) / 4)
+        self.assertEqual(day['type_distribution'], {'Pump': 3, 'Valve': 3, 'Compressor': 3})
+
+    def test_rebuilt_rollups_match_live_aggregate(self):
+        for i, data in enumerate(self.FILES * 2):
+            # One more row, to make each file distinct.
+            name = [] if data.startswith(b'Type') else [f'X{i}']
+            width = data.split(b'\n', 1)[0].count(b',') + 1
+            row = name + ['Pump'] + [str(i)] * (width - len(name) - 1)
+            self.upload(data + ','.join(row).encode() + b'\n', f'{i}.csv')
+        # Spread the uploads over several hours, days and weeks.
+        for i, history in enumerate(UploadHistory.objects.order_by('id')):
+            UploadHistory.objects.filter(pk=history.pk).update(
+                upload_time=history.upload_time - timedelta(days=3 * i, hours=i))
+        rebuild_rollups()
+        self.assertEqual(len(history_buckets(self.user, 'day')), 6)
+        self.assert_rollups_match_live()
+
+        response = self.client.get('/api/history/aggregate/', {'bucket': 'week', 'window': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(result['uploads'] for result in response.json()['results']), 6)
+        self.assertEqual(self.client.get('/api/history/aggregate/', {'bucket': 'year'}).status_code, 400)
+
+
+class CombineTests(APITestCase):
+    OTHER = (b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+             b"C1,Compressor,45,9.5,80\nV2,Valve,70,4,100\nC2,Compressor,40,7,90\n")
+
+    def test_combined_summary_matches_one_upload_of_all_rows(self):
+        ids = [self.upload()['history_id'], self.upload(self.OTHER, 'other.csv')['history_id']]
+        response = self.client.get('/api/history/combine/', {'ids': f'{ids[1]},{ids[0]}'})
+        self.assertEqual(response.status_code, 200)
+        combined = response.json()
+        self.assertEqual(combined['history_ids'], ids)
+
+        whole = self.upload(CSV + self.OTHER.split(b'\n', 1)[1], 'all.csv')['history_id']
+        expected = self.client.get(f'/api/history/{whole}/').json()
+        self.assertEqual(combined['total_count'], 6)
+        self.assertEqual(combined['type_distribution'], {'Pump': 2, 'Valve': 2, 'Compressor': 2})
+        for field in ('flowrate', 'pressure', 'temperature'):
+            self.assertAlmostEqual(combined[f'avg_{field}'], expected[f'avg_{field}'])
+            for name in ('count', 'mean', 'std', 'min', 'max'):
+                self.assertAlmostEqual(combined['statistics'][field][name],
+                                       expected['statistics'][field][name], msg=f'{field} {name}')
+        self.assertAlmostEqual(combined['type_statistics']['Valve']['flowrate']['mean'], (60.5 + 70) / 2)
+
+    def test_invalid_and_unknown_ids(self):
+        history_id = self.upload()['history_id']
+        self.assertEqual(self.client.get('/api/history/combine/', {'ids': '1,x'}).status_code, 400)
+        response = self.client.get('/api/history/combine/', {'ids': f'{history_id},{history_id + 1}'})
+        self.assertEqual(response.status_code, 404)
+        self.client.force_authenticate(User.objects.create_user('other', password='secret'))
+        self.assertEqual(self.client.get('/api/history/combine/', {'ids': history_id}).status_code, 404)
+
+
+class ParserDiagnosticsTests(APITestCase):
+    def parse(self, data):
+        report = ParseReport()
+        summary = ingest_csv(io.BytesIO(data), report=report)
+        return summary, report.as_dict()
+
+    def test_malformed_lines_and_cells_are_reported(self):
+        summary, report = self.parse(
+            b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+            b"P1,Pump,120,5.2,110\n"
+            b"BAD,Pump,1,2,3,4,5\n"
+            b"V1,Valve,abc,4.1,\n"
+            b"P2,Pump,130\n")
+        self.assertEqual(summary.total_count, 3)
+        self.assertEqual(report['skipped_lines'], 1)
+        self.assertEqual(report['bad_values'], {'Flowrate': 1})
+        self.assertEqual(report['missing_values'], {'Pressure': 1, 'Temperature': 2})
+        self.assertEqual(report['samples'], [
+            {'message': 'Skipping line 3: expected 5 fields, saw 7'},
+            {'row': 2, 'column': 'Flowrate', 'value': 'abc'},
+        ])
+
+    def test_over_long_line_at_the_start_of_a_batch_is_skipped(self):
+        report = ParseReport()
+        data = b"Type,Flowrate\nPump,1\nPump,2,extra\nPump,3\n"
+        summary = ingest_csv(io.BytesIO(data), report=report, batch_rows=1)
+        self.assertEqual(report.skipped_lines, 1)
+        self.assertEqual(report.samples, [{'message': 'Skipping row 2: expected 2 fields, saw more'}])
+        self.assertEqual(summary.total_count, 2)
+        self.assertEqual(summary.as_model_fields()['avg_flowrate'], 2)
+
+    def test_readers_on_other_threads_keep_their_own_skipped_lines(self):
+        def parse(bad_every):
+            lines = [f'Pump,{i}' + (',extra' if i % bad_every == 0 else '') for i in range(1, 200)]
+            report = ParseReport()
+            data = ('Type,Flowrate\n' + '\n'.join(lines) + '\n').encode()
+            ingest_csv(io.BytesIO(data), report=report, batch_rows=7)
+            return report.skipped_lines
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            counts = list(pool.map(parse, [3, 5, 7, 11] * 10))
+        self.assertEqual(counts, [199 // 3, 199 // 5, 199 // 7, 199 // 11] * 10)
+
+    def test_utf8_bom_semicolons_and_decimal_commas(self):
+        summary, report = self.parse(
+            b'\xef\xbb\xbf' + "Equipment Name;Type;Flowrate;Pressure;Temperature\n"
+                              "P1;Pump;120,5;5,2;110\nV1;Valve;60;4,1;105\n".encode())
+        self.assertEqual(report['schema']['encoding'], 'utf-8')
+        self.assertEqual(report['schema']['delimiter'], ';')
+        self.assertEqual(report['schema']['decimal'], ',')
+        self.assertEqual(report['skipped_lines'], 0)
+        self.assertEqual(report['bad_values'], {})
+        self.assertAlmostEqual(summary.as_model_fields()['avg_flowrate'], 90.25)
+
+    def test_latin1_file(self):
+        summary, report = self.parse(
+            "Équipement,Type,Flowrate,Pressure,Temperature\n"
+            "Vanne à bille,Vanne,60,4.1,105\nPompe,Pompe,120,5.2,110\n".encode('latin-1'))
+        self.assertEqual(report['schema']['encoding'], 'latin-1')
+        self.assertEqual(report['bad_values'], {})
+        self.assertEqual(summary.as_model_fields()['type_distribution'], {'Vanne': 1, 'Pompe': 1})
+
+    def test_latin1_rows_are_stored_decoded(self):
+        writer = ColumnarWriter()
+        ingest_csv(io.BytesIO("Name,Type\nVanne à bille,Vanne\n".encode('latin-1')),
+                   on_batch=writer.add_batch)
+        self.assertEqual(StoredDataset(writer.to_bytes()).to_rows(),
+                         [{'Name': 'Vanne à bille', 'Type': 'Vanne'}])
+
+    def test_header_aliases_and_units(self):
+        summary, report = self.parse(b"Category,Flow Rate [L/min],Pressure (kPa),Temp (degF)\n"
+                                     b"Pump,100,250,212\nPump,200,150,32\n")
+        self.assertEqual(report['schema']['columns'], {
+            'type': 'Category', 'flowrate': 'Flow Rate [L/min]',
+            'pressure': 'Pressure (kPa)', 'temperature': 'Temp (degF)'})
+        fields = summary.as_model_fields()
+        self.assertAlmostEqual(fields['avg_flowrate'], 150 * 0.06)
+        self.assertAlmostEqual(fields['avg_pressure'], 2)
+        self.assertAlmostEqual(fields['avg_temperature'], 50)
+        self.assertEqual(fields['type_distribution'], {'Pump': 2})
+
+    def test_upload_with_a_schema(self):
+        def post(schema):
+            file = csv_file(b"Kind,Rate,P\nPump,2,30\nPump,4,60\n")
+            data = {'file': file, 'schema': json.dumps(schema)}
+            return self.client.post('/api/upload/', data, format='multipart')
+
+        response = post({'columns': {'flowrate': 'Rate', 'pressure': 'P', 'type': 'Kind'},
+                         'units': {'pressure': 'psi'}})
+        self.assertEqual(response.status_code, 200, response.content)
+        history = UploadHistory.objects.get(pk=response.json()['history_id'])
+        self.assertEqual(history.avg_flowrate, 3)
+        self.assertAlmostEqual(history.avg_pressure, 45 * 0.0689475729)
+        self.assertEqual(history.diagnostics['schema']['units'], {'pressure': 'psi'})
+
+        for schema in ({'delimiter': ';;'}, {'units': {'pressure': 'furlongs'}}, {'sheet': 1},
+                       {'columns': 5}, {'units': ['psi']}, {'columns': {'flowrate': 3}}, []):
+            self.assertEqual(post(schema).status_code, 400, schema)
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class ArrowFormatTests(APITestCase):
+    def export(self, history_id, kind):
+        response = self.client.get(f'/api/history/{history_id}/export/{kind}/')
+        self.assertEqual(response.status_code, 200)
+        if kind == 'parquet':
+            return pa.parquet.read_table(io.BytesIO(response.content)), response.content
+        if kind == 'arrow':
+            return pa.ipc.open_file(response.content).read_all(), response.content
+        return pa.ipc.open_stream(response.content).read_all(), response.content
+
+    def test_parquet_upload(self):
+        table = pa.table({
+            'Type': pa.array(['Pump', 'Valve', 'Pump']).dictionary_encode(),
+            'Flowrate': pa.array([120.0, 60.5, 130.0]),
+            'Pressure': pa.array([5, 4, None], type=pa.int64()),
+        })
+        sink = io.BytesIO()
+        pa.parquet.write_table(table, sink)
+        response = self.client.post('/api/upload/', {'file': csv_file(sink.getvalue(), 'plant.parquet')},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['diagnostics']['format'], 'parquet')
+        history = UploadHistory.objects.get(pk=response.json()['history_id'])
+        self.assertEqual(history.total_count, 3)
+        self.assertAlmostEqual(history.avg_flowrate, (120 + 60.5 + 130) / 3)
+        self.assertEqual(history.avg_pressure, 4.5)
+        self.assertEqual(history.type_distribution, {'Pump': 2, 'Valve': 1})
+
+    def test_export_round_trip(self):
+        history_id = self.upload()['history_id']
+        for kind in ('parquet', 'arrow', 'arrows'):
+            table, content = self.export(history_id, kind)
+            self.assertEqual(table.column_names,
+                             ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature'])
+            self.assertEqual(table.column('Type').to_pylist(), ['Pump', 'Valve', 'Pump'])
+            self.assertEqual(table.column('Flowrate').to_pylist(), [120, 60.5, 130])
+            self.assertEqual(json.loads(table.schema.metadata[b'summary'])['total_count'], 3)
+
+        # Exports can be uploaded and appended again.
+        _, parquet = self.export(history_id, 'parquet')
+        summary = self.upload(parquet, 'export.parquet')['summary']
+        self.assertEqual(summary['avg_flowrate'], UploadHistory.objects.get(pk=history_id).avg_flowrate)
+        _, stream = self.export(history_id, 'arrows')
+        response = self.client.post(f'/api/history/{history_id}/append/',
+                                    {'file': csv_file(stream, 'export.arrows')}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(UploadHistory.objects.get(pk=history_id).total_count, 6)
+
+        self.assertEqual(self.client.get(f'/api/history/{history_id}/export/xlsx/').status_code, 404)
+
+
+class ChartTests(APITestCase):
+    def chart(self, history_id, name, **params):
+        return self.client.get(f'/api/history/{history_id}/charts/{name}', params)
+
+    def test_png_thumbnail_is_cached(self):
+        history_id = self.upload()['history_id']
+        response = self.chart(history_id, 'types.png', size='thumb')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(struct.unpack('>II', response.content[16:24]), (160, 160))
+
+        with mock.patch.object(thumbnails, 'get_render_pool') as pool:
+            again = self.chart(history_id, 'types.png', size='thumb')
+        pool.assert_not_called()
+        self.assertEqual(again.content, response.content)
+
+    def test_histogram_svg(self):
+        history_id = self.upload()['history_id']
+        response = self.chart(history_id, 'histogram.svg', field='pressure', size='medium')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+
+    def test_invalid_requests(self):
+        history_id = self.upload()['history_id']
+        self.assertEqual(self.chart(history_id, 'pie.png').status_code, 404)
+        self.assertEqual(self.chart(history_id, 'types.gif').status_code, 404)
+        self.assertEqual(self.chart(history_id, 'types.png', size='huge').status_code, 400)
+        self.assertEqual(self.chart(history_id, 'histogram.png').status_code, 400)
+        self.assertEqual(self.chart(history_id, 'histogram.png', field='Type').status_code, 400)
+        self.assertEqual(self.chart(history_id + 1, 'types.png').status_code, 404)
+
+    def test_thumbnail_url(self):
+        history_id = self.upload()['history_id']
+        url = self.client.get('/api/history/').json()[0]['thumbnail_url']
+        self.assertTrue(url.startswith(
+            f'http://testserver/api/history/{history_id}/charts/types.png?size=thumb&token='))
+
+        # The signed URL loads without a login, as an <img src> would.
+        anonymous = APIClient()
+        response = anonymous.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_upload_responses_have_absolute_thumbnail_urls(self):
+        single = self.client.post('/api/upload/?include=summary', {'file': csv_file()},
+                                  format='multipart').json()['summary']
+        files = [csv_file(name='a.csv'), csv_file(CSV + b"V2,Valve,70,4.0,100\n", 'b.csv')]
+        batch = self.client.post('/api/upload/', {'file': files}, format='multipart').json()['uploads']
+        for summary in [single] + [upload['summary'] for upload in batch]:
+            self.assertTrue(summary['thumbnail_url'].startswith('http://testserver/api/history/'),
+                            summary['thumbnail_url'])
+
+    def test_signed_url_denied(self):
+        history_id = self.upload()['history_id']
+        history = UploadHistory.objects.get(pk=history_id)
+        token = chart_token(history, 'types')
+        self.assertTrue(check_chart_token(token, history, 'types'))
+        self.assertFalse(check_chart_token(token, history, 'histogram'))
+
+        anonymous = APIClient()
+        url = f'/api/history/{history_id}/charts/types.png'
+        self.assertIn(anonymous.get(url).status_code, (401, 403))
+        self.assertIn(anonymous.get(url, {'token': token + 'x'}).status_code, (401, 403))
+        self.assertIn(anonymous.get(f'/api/history/{history_id}/charts/histogram.png',
+                                    {'field': 'pressure', 'token': token}).status_code, (401, 403))
+        self.assertEqual(anonymous.get(url, {'token': token}).status_code, 200)
+
+        # Appending rows changes last_modified, which retires the token.
+        response = self.client.post(f'/api/history/{history_id}/append/', {'file': csv_file()},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn(anonymous.get(url, {'token': token}).status_code, (401, 403))
@@ -0,0 +1,108 @@
+"""Chart images of uploads, rendered once and cached.
+
+Images are drawn by :mod:`api.charts` in a small pool of worker processes,
+so matplotlib never runs in (or holds the GIL of) a web worker, and kept
+in the ``CHART_CACHE`` cache. Keys name the upload, its ``last_modified``
+time and the chart parameters: appended rows produce new keys and stale
+images simply age out. Concurrent requests for an image that is still
+being drawn wait for the same render.
+
+Thumbnail URLs carry a signed ``?token=`` (see :func:`chart_token`) so
+they can be used as an ``<img src>``, which can't send the JWT.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signing import Signer
+from django.utils.crypto import constant_time_compare
+
+from .charts import chart_data, render_chart
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def get_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers import only api.charts (matplotlib, no Django).
+            _pool = ProcessPoolExecutor(max_workers=settings.CHART_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def discard_render_pool(pool):
+    """Replace a pool whose workers died; a broken pool rejects all new work."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def chart_cache():
+    return caches[settings.CHART_CACHE]
+
+
+def chart_key(history, chart, field, image_format, size):
+    return (f'chart:{history.pk}:{history.last_modified.timestamp()}:'
+            f'{chart}:{field or ""}:{size}.{image_format}')
+
+
+def chart_token(history, chart):
+    """A signature that grants access to ``history``'s ``chart`` without a
+    login. It names the upload's ``last_modified`` time, so it stops working
+    once rows are appended (or the upload is deleted)."""
+    value = f'{history.pk}:{history.last_modified.timestamp()}:{chart}'
+    return Signer(salt='api.thumbnails.chart_token').signature(value)
+
+
+def check_chart_token(token, history, chart):
+    return constant_time_compare(token, chart_token(history, chart))
+
+
+def chart_image(history, summary, chart, field=None, image_format='png', size='large'):
+    """The image bytes of ``history``'s chart, or ``None`` if there's nothing to draw.
+
+    ``summary`` is the upload as serialized (see :func:`api.charts.chart_data`);
+    it is only read on a cache miss, so it may be a callable returning it.
+    """
+    key = chart_key(history, chart, field, image_format, size)
+    image = chart_cache().get(key)
+    if image is not None:
+        return image
+
+    with _pending_lock:
+        future = _pending.get(key)
+    owner = future is None
+    if owner:
+        data = chart_data(chart, summary() if callable(summary) else summary, field)
+        if data is None:
+            return None
+        pool = get_render_pool()
+        with _pending_lock:
+            # Another request may have started the same render meanwhile.
+            future = _pending.get(key)
+            owner = future is None
+            if owner:
+                future = _pending[key] = pool.submit(render_chart, chart, data, image_format, size)
+    try:
+        image = future.result()
+    except BrokenProcessPool:
+        if owner:
+            discard_render_pool(pool)
+        raise
+    finally:
+        if owner:
+            with _pending_lock:
+                _pending.pop(key, None)
+    if owner:
+        chart_cache().set(key, image)
+    return image
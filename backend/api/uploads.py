@@ -0,0 +1,334 @@
+"""Turning uploaded CSV (or Parquet and Arrow, see :mod:`api.arrow`) files
+into ``UploadHistory`` rows.
+
+A single file is parsed in the request (or an upload job's) thread. A
+batch -- several ``file`` parts or a ZIP of CSVs -- is parsed in a pool of
+worker processes, one file per task, and the results are inserted with
+one ``bulk_create`` so a batch is stored all at once. Rows appended to an
+existing upload are stored as an ``UploadSegment`` and folded into its
+summary from the stored running sums.
+
+Files are hashed while they stream in (:class:`ContentHashUploadHandler`);
+a file a user has uploaded before is answered with the earlier upload
+instead of being parsed and stored again.
+
+How each file is read is inferred by :mod:`api.parsing` unless the client
+sends a schema; the schema used and any cells or lines that couldn't be
+read are stored as the upload's ``diagnostics``.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import posixpath
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+
+from .aggregation import add_to_rollups, add_totals, contribution, update_rollups
+from .arrow import UPLOAD_EXTENSIONS
+from .caching import invalidate_history_cache
+from .ingest import parse_upload, summarize_dataset
+from .models import UploadHistory, UploadSegment
+from .parsing import Schema
+from .storage import StoredDataset, encode_rows
+
+# ZIP entries are extracted this many bytes at a time
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class EmptyUploadError(ValueError):
+    """The uploaded CSV has no data rows."""
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """Passes uploaded files through untouched, hashing them on the way.
+
+    Must run before the handlers that store the file. ``digests`` maps each
+    field name to the SHA-256 hex digests of its files, in upload order.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests.setdefault(self.field_name, []).append(self.hasher.hexdigest())
+
+
+def content_key(digest, schema=None):
+    """The ``content_hash`` of a file's SHA-256 ``digest`` read with ``schema``.
+
+    A file sent with a schema may read differently, so it only duplicates
+    uploads of the same file with the same schema.
+    """
+    if not digest or schema is None:
+        return digest
+    return hashlib.sha256(f'{digest}:{json.dumps(schema, sort_keys=True)}'.encode()).hexdigest()
+
+
+def find_duplicate(user, content_hash):
+    """``user``'s earlier upload of the same content, or ``None``."""
+    if not content_hash:
+        return None
+    return UploadHistory.objects.filter(user=user, content_hash=content_hash).order_by('-id').first()
+
+
+def history_from_summary(user, summary, raw_columns, diagnostics, content_hash=''):
+    """An unsaved ``UploadHistory`` for a parsed file."""
+    if not summary.total_count:
+        raise EmptyUploadError('Empty CSV')
+    return UploadHistory(user=user, raw_columns=raw_columns, diagnostics=diagnostics,
+                         content_hash=content_hash or '', **summary.as_model_fields())
+
+
+def record_upload(user, file_obj, on_batch=None, content_hash='', schema=None):
+    """Ingest a CSV and store it as a new ``UploadHistory`` for ``user``.
+
+    ``on_batch`` is called after each parsed batch, e.g. to report progress;
+    ``schema`` is a client-supplied schema dict (see :mod:`api.parsing`).
+    """
+    history = history_from_summary(user, *parse_upload(file_obj, on_batch=on_batch, schema=schema),
+                                   content_hash=content_hash)
+    with transaction.atomic():
+        history.save()
+        add_to_rollups([history])
+    invalidate_history_cache(user)
+    return history
+
+
+def get_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers only import api.ingest (pandas/numpy, no Django),
+            # and spawning is safe from a server that already runs threads.
+            _pool = ProcessPoolExecutor(max_workers=settings.UPLOAD_BATCH_WORKERS or os.cpu_count(),
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def discard_process_pool(pool):
+    """Replace a pool whose workers died; a broken pool rejects all new work."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def is_batch(files):
+    """Whether an upload has to go through :func:`record_batch`."""
+    if len(files) > 1:
+        return True
+    is_zip = zipfile.is_zipfile(files[0])
+    files[0].seek(0)
+    return is_zip
+
+
+def is_batch_member(info):
+    """Whether a ZIP entry is one of the batch's files (not a folder or macOS metadata)."""
+    name = posixpath.basename(info.filename)
+    if info.is_dir() or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+        return False
+    return name.lower().endswith(('.csv',) + UPLOAD_EXTENSIONS)
+
+
+def spool_member(archive, info, spool_dir):
+    """Copy a ZIP entry to a file in ``spool_dir`` a chunk at a time.
+
+    Returns ``(path, SHA-256 hex digest)``. An entry that inflates past the
+    size its header declares is rejected as soon as it does.
+    """
+    hasher = hashlib.sha256()
+    left = info.file_size
+    with archive.open(info) as member, tempfile.NamedTemporaryFile(
+            prefix='batch-', suffix=posixpath.splitext(info.filename)[1], dir=spool_dir,
+            delete=False) as spool:
+        while chunk := member.read(min(SPOOL_CHUNK_BYTES, left + 1)):
+            left -= len(chunk)
+            if left < 0:
+                raise ValueError(f'{info.filename} is larger than its archive entry says')
+            hasher.update(chunk)
+            spool.write(chunk)
+    return spool.name, hasher.hexdigest()
+
+
+def batch_sources(files, spool_dir, schema=None):
+    """``(name, source, content_hash)`` for each file in the uploads, expanding ZIPs
+    (of CSV, Parquet or Arrow files).
+
+    Sources are paths or bytes, which are cheap to hand to a worker process.
+    A ZIP's file count and uncompressed size are checked against
+    ``UPLOAD_BATCH_MAX_FILES`` and ``UPLOAD_BATCH_MAX_BYTES`` from its
+    directory before anything is extracted; its files are then spooled
+    to ``spool_dir``, which the caller removes once the batch is stored.
+    """
+    sources = []
+    total_bytes = 0
+
+    def admit(count, size):
+        nonlocal total_bytes
+        total_bytes += size
+        if len(sources) + count > settings.UPLOAD_BATCH_MAX_FILES:
+            raise ValueError(f'A batch can hold at most {settings.UPLOAD_BATCH_MAX_FILES} files')
+        if total_bytes > settings.UPLOAD_BATCH_MAX_BYTES:
+            raise ValueError(f'A batch can hold at most {settings.UPLOAD_BATCH_MAX_BYTES} bytes')
+
+    for uploaded in files:
+        if zipfile.is_zipfile(uploaded):
+            uploaded.seek(0)
+            try:
+                with zipfile.ZipFile(uploaded) as archive:
+                    members = [info for info in archive.infolist() if is_batch_member(info)]
+                    admit(len(members), sum(info.file_size for info in members))
+                    for info in members:
+                        path, digest = spool_member(archive, info, spool_dir)
+                        sources.append((f'{uploaded.name}/{info.filename}', path,
+                                        content_key(digest, schema)))
+            except zipfile.BadZipFile as e:
+                # e.g. an entry whose data doesn't match its header
+                raise ValueError(f'{uploaded.name}: {e}') from e
+        else:
+            admit(1, uploaded.size or 0)
+            uploaded.seek(0)
+            content_hash = getattr(uploaded, 'content_hash', '')
+            if hasattr(uploaded, 'temporary_file_path'):
+                sources.append((uploaded.name, uploaded.temporary_file_path(), content_hash))
+            else:
+                sources.append((uploaded.name, uploaded.read(), content_hash))
+    if not sources:
+        raise ValueError('No CSV, Parquet or Arrow files found in upload')
+    return sources
+
+
+def record_batch(user, sources, schema=None):
+    """Parse ``sources`` in parallel, all with ``schema``, and store every file that parsed.
+
+    Returns one ``(name, history, error, duplicate)`` per source, in order.
+    Exactly one of ``history`` and ``error`` is set; ``duplicate`` marks
+    files whose content was already uploaded (earlier or in this batch),
+    which are parsed and stored only once.
+    """
+    hashes = {content_hash for _, _, content_hash in sources if content_hash}
+    earlier = (UploadHistory.objects.filter(user=user, content_hash__in=hashes)
+               .only(*UploadHistory.SUMMARY_FIELDS, 'content_hash').order_by('id'))
+    known = {history.content_hash: (history, None) for history in earlier}
+
+    pool = get_process_pool()
+    futures = {}
+    for name, source, content_hash in sources:
+        if content_hash not in known and (not content_hash or content_hash not in futures):
+            futures[content_hash or name] = pool.submit(parse_upload, source, schema=schema)
+
+    parsed = {}
+    for key, future in futures.items():
+        content_hash = key if key in hashes else ''
+        try:
+            parsed[key] = (history_from_summary(user, *future.result(), content_hash=content_hash), None)
+        except BrokenProcessPool:
+            discard_process_pool(pool)
+            parsed[key] = (None, 'Upload worker stopped unexpectedly')
+        except Exception as e:
+            parsed[key] = (None, str(e))
+
+    histories = [history for history, _ in parsed.values() if history is not None]
+    if histories:
+        with transaction.atomic():
+            UploadHistory.objects.bulk_create(histories)
+            add_to_rollups(histories)
+        invalidate_history_cache(user)
+
+    results, seen = [], set()
+    for name, _, content_hash in sources:
+        if content_hash in known:
+            results.append((name, *known[content_hash], True))
+        else:
+            key = content_hash or name
+            results.append((name, *parsed[key], key in seen))
+            seen.add(key)
+    return results
+
+
+def stored_schema(history):
+    """The columns, units and decimal mark ``history``'s rows were read with."""
+    schema = (history.diagnostics or {}).get('schema')
+    if not schema:
+        return None
+    return {key: schema[key] for key in ('decimal', 'columns', 'units')}
+
+
+def running_summary(history):
+    """The mergeable aggregates behind ``history``'s summary fields."""
+    summary = history.running_summary()
+    if summary is None:
+        # Stored before the statistics were kept: summarise the stored rows again.
+        schema = stored_schema(history)
+        summary = summarize_dataset(history.stored_dataset(),
+                                    Schema.from_dict(schema) if schema else None)
+    return summary
+
+
+def append_upload(history, file_obj):
+    """Append the rows of a CSV to ``history`` and update its summary.
+
+    The new rows are stored as an ``UploadSegment``; the rows already
+    stored are neither decoded nor rewritten. They are read with the
+    upload's column mapping and units. Returns the segment and the
+    diagnostics of the appended file.
+    """
+    added, raw_columns, diagnostics = parse_upload(file_obj, schema=stored_schema(history))
+    if not added.total_count:
+        raise EmptyUploadError('Empty CSV')
+    columns = StoredDataset(raw_columns).columns
+
+    with transaction.atomic():
+        history = UploadHistory.objects.select_for_update().get(pk=history.pk)
+        # The content no longer matches the file that was first uploaded.
+        history.content_hash = ''
+        update_fields = ['last_modified', 'content_hash']
+        if history.raw_columns is None:
+            # A legacy upload: pack its rows once so segments can follow them.
+            rows = history.raw_data or []
+            names = list(rows[0]) if rows and isinstance(rows[0], dict) else []
+            packed = encode_rows(rows, Schema.for_columns(names).field_columns())
+            if packed is None:
+                raise ValueError('Rows cannot be appended to this upload')
+            history.raw_columns, history.raw_data = packed, None
+            update_fields += ['raw_columns', 'raw_data']
+        expected = StoredDataset(history.raw_columns).columns
+        if columns != expected:
+            raise ValueError(f"Columns {columns} don't match the upload's columns {expected}")
+
+        summary = running_summary(history)
+        summary.merge(added)
+        removed = contribution(history, -1)
+        for name, value in summary.as_model_fields().items():
+            setattr(history, name, value)
+            update_fields.append(name)
+        history.save(update_fields=update_fields)
+        segment = UploadSegment.objects.create(history=history, raw_columns=raw_columns,
+                                               row_count=added.total_count)
+        if history.user_id is not None:
+            # The upload stays in its buckets; only its totals change.
+            add_totals(removed, contribution(history))
+            update_rollups(history.user_id, history.upload_time, removed)
+    invalidate_history_cache(history.user)
+    return segment, diagnostics
@@ -8,7 +8,14 @@ from .views import (
     UserProfileView, 
     CSVUploadView, 
     HistoryListView,
-    HistoryDetailView
+    HistoryAggregateView,
+    HistoryCombineView,
+    HistoryDetailView,
+    HistoryRowsView,
+    HistoryExportView,
+    HistoryChartView,
+    HistoryAppendView,
+    UploadJobView
 )
 
 urlpatterns = [
@@ -20,6 +27,14 @@ urlpatterns = [
 
     # App routes
     path('upload/', CSVUploadView.as_view(), name='csv-upload'),
+    path('jobs/<int:pk>/', UploadJobView.as_view(), name='upload-job'),
     path('history/', HistoryListView.as_view(), name='history-list'),
+    path('history/aggregate/', HistoryAggregateView.as_view(), name='history-aggregate'),
+    path('history/combine/', HistoryCombineView.as_view(), name='history-combine'),
     path('history/<int:pk>/', HistoryDetailView.as_view(), name='history-detail'),
+    path('history/<int:pk>/rows/', HistoryRowsView.as_view(), name='history-rows'),
+    path('history/<int:pk>/append/', HistoryAppendView.as_view(), name='history-append'),
+    path('history/<int:pk>/export/<str:kind>/', HistoryExportView.as_view(), name='history-export'),
+    path('history/<int:pk>/charts/<slug:chart>.<slug:image_format>', HistoryChartView.as_view(),
+         name='history-chart'),
 ]
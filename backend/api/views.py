@@ -1,13 +1,48 @@
-import csv
-import io
-import statistics
+import json
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth.models import User
-from .serializers import UserSerializer, RegisterSerializer, UploadHistorySerializer, MyTokenObtainPairSerializer
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .serializers import (
+    UserSerializer,
+    RegisterSerializer,
+    UploadHistorySerializer,
+    UploadHistorySummarySerializer,
+    UploadJobSerializer,
+    MyTokenObtainPairSerializer,
+    requested_fields
+)
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .models import UploadHistory
+from .aggregation import BUCKETS, combine_histories, history_buckets
+from .arrow import CONTENT_TYPES, EXTENSIONS, ArrowUnavailableError, export_dataset
+from .charts import CHARTS, FORMATS, SIZES, TYPES
+from .models import HistoryRollup, UploadHistory, UploadJob
+from .caching import (
+    CacheControlMixin,
+    ResponseCacheMixin,
+    history_detail_condition,
+    history_detail_etag,
+    history_list_condition,
+    history_list_etag
+)
+from .pagination import HistoryCursorPagination, HistoryRowsPagination
+from .parsing import FIELDS, Schema
+from .thumbnails import chart_image, check_chart_token
+from .renderers import FastJSONMixin, FastJSONRenderer, iter_ndjson
+from .jobs import submit_upload
+from .uploads import (
+    ContentHashUploadHandler, append_upload, batch_sources, content_key, find_duplicate, is_batch,
+    record_batch, record_upload,
+)
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
@@ -26,85 +61,426 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
-class HistoryListView(generics.ListAPIView):
-    serializer_class = UploadHistorySerializer
+@history_list_condition
+class HistoryListView(FastJSONMixin, CacheControlMixin, ResponseCacheMixin, generics.ListAPIView):
+    serializer_class = UploadHistorySummarySerializer
+    etag_func = history_list_etag
     permission_classes = (permissions.IsAuthenticated,)
-    pagination_class = None
+    pagination_class = HistoryCursorPagination
 
     def get_queryset(self):
-        return UploadHistory.objects.filter(user=self.request.user)
+        return UploadHistory.objects.filter(user=self.request.user).summaries()
 
-class HistoryDetailView(generics.RetrieveAPIView):
+@history_detail_condition
+class HistoryDetailView(FastJSONMixin, CacheControlMixin, ResponseCacheMixin, generics.RetrieveAPIView):
     serializer_class = UploadHistorySerializer
+    etag_func = history_detail_etag
+    permission_classes = (permissions.IsAuthenticated,)
+    stream_formats = {
+        'json': ('application/json', lambda data: FastJSONRenderer().iter_json(data)),
+        'ndjson': ('application/x-ndjson', iter_ndjson),
+    }
+
+    def get_queryset(self):
+        queryset = UploadHistory.objects.filter(user=self.request.user)
+        fields = requested_fields(self.request)
+        if fields is not None and 'raw_data' not in fields:
+            queryset = queryset.defer('raw_data', 'raw_columns')
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """``?stream=json`` streams the usual document; ``?stream=ndjson``
+        sends the summary on the first line and then one row per line."""
+        stream = request.query_params.get('stream')
+        if not stream:
+            return super().retrieve(request, *args, **kwargs)
+        if stream not in self.stream_formats:
+            return Response({'error': f"Unknown stream format '{stream}'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        content_type, encode = self.stream_formats[stream]
+        context = {**self.get_serializer_context(), 'stream_rows': True}
+        data = self.get_serializer(self.get_object(), context=context).data
+        # Rows are decoded and sent a chunk at a time as the client reads.
+        return StreamingHttpResponse(encode(data), content_type=content_type)
+
+def parse_moment(value):
+    """A date or datetime query parameter as an aware datetime, or ``None``."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+@history_list_condition
+class HistoryAggregateView(FastJSONMixin, CacheControlMixin, ResponseCacheMixin, generics.ListAPIView):
+    """Trends across the user's uploads: ``?bucket=hour|day|week&window=&start=&end=``.
+
+    Each bucket has its upload and row counts, each field's average over
+    the values it had, the same averages rolled over the last ``window``
+    buckets, and the merged type distribution.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    etag_func = history_list_etag
+    max_window = 366
+
+    def list(self, request, *args, **kwargs):
+        bucket = request.query_params.get('bucket', HistoryRollup.DAY)
+        if bucket not in BUCKETS:
+            return Response({'error': f"bucket must be one of {', '.join(BUCKETS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        window = request.query_params.get('window', '1')
+        if not window.isdigit() or not 1 <= int(window) <= self.max_window:
+            return Response({'error': f'window must be a number of buckets from 1 to {self.max_window}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        bounds = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            if value is not None:
+                bounds[name] = parse_moment(value)
+                if bounds[name] is None:
+                    return Response({'error': f'{name} must be an ISO 8601 date or datetime'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+        results = history_buckets(request.user, bucket, window=int(window), **bounds)
+        for result in results:
+            # As DRF's DateTimeField writes them, without its per-value timezone work.
+            period = result['period'].isoformat()
+            result['period'] = period[:-6] + 'Z' if period.endswith('+00:00') else period
+        return Response({'bucket': bucket, 'window': int(window), 'results': results})
+
+@history_list_condition
+class HistoryCombineView(FastJSONMixin, CacheControlMixin, ResponseCacheMixin, generics.ListAPIView):
+    """Several uploads summarised as one: ``?ids=1,2,3``.
+
+    Built from the stored summaries and statistics only; no rows are read.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    etag_func = history_list_etag
+    max_uploads = 1000
+
+    def list(self, request, *args, **kwargs):
+        ids = request.query_params.get('ids', '').split(',')
+        if not all(pk.isdigit() for pk in ids):
+            return Response({'error': 'ids must be a comma-separated list of upload ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ids = sorted({int(pk) for pk in ids})
+        if len(ids) > self.max_uploads:
+            return Response({'error': f'At most {self.max_uploads} uploads can be combined'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        histories = list(UploadHistory.objects.filter(user=request.user, pk__in=ids)
+                         .only(*UploadHistory.SUMMARY_FIELDS, 'column_stats', 'type_stats'))
+        missing = set(ids) - {history.pk for history in histories}
+        if missing:
+            return Response({'error': f"Uploads not found: {', '.join(map(str, sorted(missing)))}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response({'history_ids': ids, **combine_histories(histories)})
+
+@history_detail_condition
+class HistoryRowsView(FastJSONMixin, CacheControlMixin, ResponseCacheMixin, generics.RetrieveAPIView):
+    """Serve a window of an upload's rows: ``?offset=&limit=&sort=&filter=``.
+
+    ``sort`` names a column (``-Pressure`` for descending) and ``filter``
+    takes ``Column:value`` and may be repeated. Only the requested window
+    is rebuilt from storage.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = HistoryRowsPagination
+    etag_func = history_detail_etag
+
+    def get_queryset(self):
+        return UploadHistory.objects.filter(user=self.request.user).only('id', 'raw_data', 'raw_columns')
+
+    def retrieve(self, request, *args, **kwargs):
+        history = self.get_object()
+        sort = request.query_params.get('sort')
+        filters = []
+        for param in request.query_params.getlist('filter'):
+            name, sep, value = param.partition(':')
+            if not sep:
+                return Response({'error': f"Invalid filter '{param}', expected Column:value"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            filters.append((name, value))
+
+        dataset = history.stored_dataset()
+        if dataset is None:
+            if sort or filters:
+                return Response({'error': 'Sorting and filtering are not available for this upload'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = history.raw_data
+        else:
+            try:
+                rows = dataset.window(sort=sort, filters=filters)
+            except KeyError as e:
+                return Response({'error': f'Unknown column {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(page)
+
+@history_detail_condition
+class HistoryExportView(CacheControlMixin, generics.RetrieveAPIView):
+    """The stored rows as Parquet (``export/parquet/``), an Arrow IPC file
+    (``export/arrow/``) or an Arrow IPC stream (``export/arrows/``), for
+    notebooks and bulk clients. The summary is kept in the schema metadata."""
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
         return UploadHistory.objects.filter(user=self.request.user)
 
-class CSVUploadView(APIView):
+    def retrieve(self, request, *args, kind=None, **kwargs):
+        if kind not in CONTENT_TYPES:
+            return Response({'error': f"Unknown export format '{kind}', expected one of "
+                                      f"{', '.join(CONTENT_TYPES)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        history = self.get_object()
+        dataset = history.stored_dataset()
+        if dataset is None:
+            return Response({'error': 'This upload cannot be exported'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            summary = UploadHistorySummarySerializer(history, context={'request': request}).data
+            content = export_dataset(dataset, kind, summary)
+        except ArrowUnavailableError as e:
+            return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        response = HttpResponse(content, content_type=CONTENT_TYPES[kind])
+        response['Content-Disposition'] = f'attachment; filename="history-{history.pk}{EXTENSIONS[kind]}"'
+        return response
+
+class SignedChartURL(permissions.BasePermission):
+    """Lets the ``?token=`` of a thumbnail URL stand in for a login (see
+    :func:`api.thumbnails.chart_token`)."""
+
+    def has_permission(self, request, view):
+        return 'token' in request.query_params
+
+    def has_object_permission(self, request, view, obj):
+        return check_chart_token(request.query_params['token'], obj, view.kwargs['chart'])
+
+@history_detail_condition
+class HistoryChartView(CacheControlMixin, generics.RetrieveAPIView):
+    """An upload's charts as images: ``charts/types.png`` (the type
+    distribution) or ``charts/histogram.svg?field=pressure``, with
+    ``?size=thumb|medium|large``. Each image is drawn once per state of
+    the upload and then served from the chart cache."""
+    permission_classes = (permissions.IsAuthenticated | SignedChartURL,)
+
+    def get_queryset(self):
+        # The summary fields are only loaded when the image isn't cached.
+        queryset = UploadHistory.objects.only('id', 'user', 'last_modified')
+        if not self.request.user.is_authenticated:
+            # A signed URL; SignedChartURL checks it against the upload.
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    def retrieve(self, request, *args, chart=None, image_format=None, **kwargs):
+        if chart not in CHARTS or image_format not in FORMATS:
+            return Response({'error': f"Unknown chart '{chart}.{image_format}'"},
+                            status=status.HTTP_404_NOT_FOUND)
+        size = request.query_params.get('size', 'large')
+        if size not in SIZES:
+            return Response({'error': f"size must be one of {', '.join(SIZES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        field = request.query_params.get('field') if chart != TYPES else None
+        if chart != TYPES and field not in FIELDS:
+            return Response({'error': f"field must be one of {', '.join(FIELDS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        history = self.get_object()
+
+        def summary():
+            if chart == TYPES:
+                return {'type_distribution': history.type_distribution}
+            running = history.running_summary()
+            return {'statistics': running.statistics() if running is not None else None}
+
+        try:
+            image = chart_image(history, summary, chart, field, image_format, size)
+        except BrokenProcessPool:
+            return Response({'error': 'Chart renderer stopped unexpectedly'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if image is None:
+            return Response({'error': 'Nothing to chart for this upload'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(image, content_type=FORMATS[image_format])
+
+class HistoryAppendView(generics.GenericAPIView):
+    """Append the rows of another CSV (same columns) to an existing upload."""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return UploadHistory.objects.filter(user=self.request.user).only('id', 'user', 'diagnostics')
+
+    def post(self, request, *args, **kwargs):
+        history = self.get_object()
+        if 'file' not in request.FILES:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            segment, diagnostics = append_upload(history, request.FILES['file'])
+        except ArrowUnavailableError as e:
+            return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': 'Rows appended successfully',
+            'appended_count': segment.row_count,
+            'summary': UploadHistorySummarySerializer(segment.history, context={'request': request}).data,
+            'history_id': segment.history_id,
+            'diagnostics': diagnostics
+        })
+
+class CSVUploadView(FastJSONMixin, APIView):
+    """Upload one CSV, several, or ZIP archives of them. Parquet and Arrow
+    IPC files are accepted anywhere a CSV is when pyarrow is installed.
+
+    A single file's rows are echoed back as ``raw_data`` unless the client
+    asks for ``?include=summary`` (no rows) or ``?preview=N`` (the first N).
+    ``?async=1`` queues a single file as an upload job instead. A file the
+    user has uploaded before is not stored again: the response describes
+    the earlier upload and says ``"duplicate": true``.
+
+    An optional ``schema`` form field (JSON, see :mod:`api.parsing`) fixes
+    the encoding, delimiter, decimal mark, column mapping or units instead
+    of inferring them. ``diagnostics`` reports the schema used and the
+    cells or lines that couldn't be read.
+    """
     permission_classes = (permissions.IsAuthenticated,)
 
     def post(self, request, format=None):
+        # Hash the files as they are read, before anything parses the body.
+        hasher = ContentHashUploadHandler(request)
+        request.upload_handlers.insert(0, hasher)
         if 'file' not in request.FILES:
             return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_obj = request.FILES['file']
-        
+        include = request.query_params.get('include')
+        preview = request.query_params.get('preview')
+        if include not in (None, 'summary', 'raw_data'):
+            return Response({'error': "include must be 'summary' or 'raw_data'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if preview is not None:
+            if not preview.isdigit():
+                return Response({'error': 'preview must be a number of rows'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            preview = min(int(preview), HistoryRowsPagination.max_limit)
+
+        schema = request.data.get('schema') or None
+        if schema is not None:
+            try:
+                schema = json.loads(schema)
+            except (TypeError, ValueError):
+                return Response({'error': 'Invalid schema: expected a JSON object'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                Schema.from_dict(schema)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        files = request.FILES.getlist('file')
+        for uploaded, digest in zip(files, hasher.digests.get('file', [])):
+            uploaded.content_hash = content_key(digest, schema)
         try:
-            decoded_file = file_obj.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-            
-            data = []
-            pressures = []
-            temperatures = []
-            flowrates = []
-            
-            for row in reader:
-                data.append(row)
-                if 'Pressure' in row:
-                    pressures.append(float(row['Pressure']))
-                if 'Temperature' in row:
-                    temperatures.append(float(row['Temperature']))
-                # Check for Flowrate first, then fallback to Concentration
-                if 'Flowrate' in row:
-                    flowrates.append(float(row['Flowrate']))
-                elif 'Concentration' in row:
-                    flowrates.append(float(row['Concentration']))
-            
-            if not data:
-                return Response({'error': 'Empty CSV'}, status=status.HTTP_400_BAD_REQUEST)
+            batch = is_batch(files)
+        except OSError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if batch:
+            return self.post_batch(request, files, schema)
+
+        file_obj = files[0]
+        content_hash = getattr(file_obj, 'content_hash', '')
+
+        if request.query_params.get('async') in ('1', 'true'):
+            job = submit_upload(request.user, file_obj, content_hash=content_hash, schema=schema)
+            status_url = reverse('upload-job', args=[job.pk], request=request)
+            return Response({
+                'job_id': job.pk,
+                'status': job.status,
+                'status_url': status_url
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+        try:
+            history = find_duplicate(request.user, content_hash)
+            duplicate = history is not None
+            if not duplicate:
+                history = record_upload(request.user, file_obj, content_hash=content_hash,
+                                        schema=schema)
+
+            if include == 'summary' or preview is not None:
+                # The rows are stored; send at most a preview of them back.
+                response = {
+                    'message': 'File uploaded successfully',
+                    'summary': UploadHistorySummarySerializer(history, context={'request': request}).data,
+                    'history_id': history.id,
+                    'duplicate': duplicate,
+                    'diagnostics': history.diagnostics
+                }
+                if preview is not None and include != 'summary':
+                    response['raw_data'] = history.row_window()[:preview]
+                return Response(response)
 
-            avg_pressure = statistics.mean(pressures) if pressures else 0
-            avg_temperature = statistics.mean(temperatures) if temperatures else 0
-            avg_flowrate = statistics.mean(flowrates) if flowrates else 0
-            
-            # Calculate type distribution
-            type_counts = {}
-            for row in data:
-                if 'Type' in row:
-                    equip_type = row['Type']
-                    type_counts[equip_type] = type_counts.get(equip_type, 0) + 1
-
-            # Create history entry
-            history = UploadHistory.objects.create(
-                user=request.user,
-                total_count=len(data),
-                avg_flowrate=avg_flowrate,
-                avg_pressure=avg_pressure,
-                avg_temperature=avg_temperature,
-                type_distribution=type_counts,
-                raw_data=data
-            )
-            
             serializer = UploadHistorySerializer(history)
+            summary_data = serializer.data
             
             return Response({
                 'message': 'File uploaded successfully',
-                'raw_data': data,
-                'summary': serializer.data,
-                'history_id': history.id
+                'raw_data': summary_data['raw_data'],
+                'summary': summary_data,
+                'history_id': history.id,
+                'duplicate': duplicate,
+                'diagnostics': history.diagnostics
             })
 
+        except ArrowUnavailableError as e:
+            return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def post_batch(self, request, files, schema=None):
+        """Several ``file`` parts and/or ZIP archives of CSVs in one request."""
+        if request.query_params.get('async') in ('1', 'true'):
+            return Response({'error': 'Batch uploads cannot be processed asynchronously'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Files extracted from ZIPs wait here until the batch is stored.
+        with tempfile.TemporaryDirectory(prefix='batch-', dir=settings.UPLOAD_SPOOL_DIR) as spool_dir:
+            try:
+                sources = batch_sources(files, spool_dir, schema)
+            except (ValueError, OSError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            results = record_batch(request.user, sources, schema)
+
+        uploads = []
+        for name, history, error, duplicate in results:
+            if history is None:
+                uploads.append({'file': name, 'error': error})
+            else:
+                uploads.append({
+                    'file': name,
+                    'history_id': history.id,
+                    'summary': UploadHistorySummarySerializer(history, context={'request': request}).data,
+                    'duplicate': duplicate,
+                    'diagnostics': history.diagnostics
+                })
+
+        stored = sum('history_id' in upload for upload in uploads)
+        duplicates = sum(upload.get('duplicate', False) for upload in uploads)
+        message = f'{stored} of {len(uploads)} files uploaded successfully'
+        if duplicates:
+            message += f' ({duplicates} already uploaded)'
+        return Response({
+            'message': message,
+            'uploads': uploads
+        }, status=status.HTTP_200_OK if stored else status.HTTP_400_BAD_REQUEST)
+
+class UploadJobView(CacheControlMixin, generics.RetrieveAPIView):
+    """Progress of an ``upload/?async=1`` upload; ``history_id`` is set once it is done."""
+    serializer_class = UploadJobSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return UploadJob.objects.filter(user=self.request.user)
@@ -55,6 +55,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     # CORS middleware should be as high as possible
     'corsheaders.middleware.CorsMiddleware',
+    # Compress API responses for clients that accept gzip
+    "django.middleware.gzip.GZipMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -112,6 +114,59 @@ DATABASES = {
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Rendered history responses, per user (see api/caching.py)
+    "history": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "history-responses",
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 128},
+    },
+    # Chart images and thumbnails (see api/thumbnails.py)
+    "charts": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "chart-images",
+        "TIMEOUT": 86400,
+        "OPTIONS": {"MAX_ENTRIES": 2048},
+    },
+}
+
+HISTORY_RESPONSE_CACHE = "history"
+# Larger responses are rendered per request rather than cached
+HISTORY_RESPONSE_CACHE_MAX_BYTES = 1024 * 1024
+
+
+# Background uploads (see api/jobs.py)
+
+UPLOAD_JOB_WORKERS = int(os.environ.get('UPLOAD_JOB_WORKERS', 2))
+# Queued or running jobs without an update for this long are marked failed
+# when a process starts (their process must have stopped)
+UPLOAD_JOB_STALE_AFTER = int(os.environ.get('UPLOAD_JOB_STALE_AFTER', 15 * 60))
+# Where queued uploads wait to be parsed; None uses the system temp directory
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+# Batch uploads (several files or a ZIP) are parsed in worker processes;
+# None starts one per CPU
+UPLOAD_BATCH_WORKERS = int(os.environ['UPLOAD_BATCH_WORKERS']) if os.environ.get('UPLOAD_BATCH_WORKERS') else None
+UPLOAD_BATCH_MAX_FILES = 100
+# Total size of a batch's files, counting ZIP entries uncompressed
+UPLOAD_BATCH_MAX_BYTES = int(os.environ.get('UPLOAD_BATCH_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Chart images are drawn by this many worker processes (see api/thumbnails.py)
+CHART_CACHE = "charts"
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', 2))
+
+# Keep per-hour/day/week totals of each user's uploads (api.aggregation),
+# so history/aggregate/ reads a few rollup rows instead of grouping uploads
+HISTORY_ROLLUPS = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -163,7 +218,16 @@ CORS_ALLOWED_ORIGINS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # Views (by class name) that render with api.renderers.FastJSONRenderer
+    'FAST_JSON_VIEWS': (
+        'CSVUploadView',
+        'HistoryListView',
+        'HistoryDetailView',
+        'HistoryRowsView',
+        'HistoryAggregateView',
+        'HistoryCombineView',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -0,0 +1,110 @@
+"""Latency benchmark for the desktop API client.
+
+Starts a local stand-in for the backend (history list and detail
+endpoints, gzip when accepted) and compares a fresh connection per call,
+which is what module-level ``requests.get`` does, with the pooled
+``APIManager`` session. ``--connect-delay`` adds a pause to every new
+connection to stand in for the TCP+TLS handshake to the real host.
+
+    python bench_latency.py --requests 200 --connect-delay 0.05
+"""
+import argparse
+import gzip
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import main
+
+
+def make_payload(rows):
+    return json.dumps({
+        'id': 1,
+        'total_count': rows,
+        'raw_data': [{'Equipment Name': f'EQ-{i}', 'Type': 'Pump', 'Flowrate': '120',
+                      'Pressure': '5.2', 'Temperature': '110'} for i in range(rows)],
+    }).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Like gunicorn: without TCP_NODELAY, keep-alive replies stall on delayed ACKs.
+    disable_nagle_algorithm = True
+    payloads = {}
+
+    def do_GET(self):
+        body = self.payloads.get(self.path.split('?')[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connect_delay = 0.0
+
+    def finish_request(self, request, client_address):
+        # Runs once per TCP connection, not per request.
+        time.sleep(self.connect_delay)
+        super().finish_request(request, client_address)
+
+
+def measure(label, call, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(f"{label:38s} median {statistics.median(samples):7.2f} ms   "
+          f"p95 {samples[int(len(samples) * 0.95) - 1]:7.2f} ms   total {sum(samples) / 1000:6.2f} s")
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=2000, help="rows in the detail payload")
+    parser.add_argument('--connect-delay', type=float, default=0.02,
+                        help="seconds added to every new connection")
+    args = parser.parse_args()
+
+    StandInHandler.payloads = {
+        '/api/history/': json.dumps([{'id': i, 'upload_time': '2025-01-01T00:00:00Z', 'total_count': 10}
+                                     for i in range(50)]).encode(),
+        '/api/history/1/': make_payload(args.rows),
+    }
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    server.connect_delay = args.connect_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    main.API_BASE_URL = f'http://127.0.0.1:{server.server_address[1]}/api'
+    print(f"Stand-in server at {main.API_BASE_URL}, connect delay {args.connect_delay * 1000:.0f} ms, "
+          f"{args.requests} requests each\n")
+
+    manager = main.APIManager()
+    for path, name in (('history/', 'history list'), ('history/1/', f'history detail ({args.rows} rows)')):
+        url = f"{main.API_BASE_URL}/{path}"
+        measure(f"{name}, new connection", lambda: requests.get(url, headers={'Connection': 'close'}).json(),
+                args.requests)
+        manager.session.get(url).json()  # warm the pool
+        measure(f"{name}, pooled session", lambda: manager.session.get(url, timeout=manager.timeout).json(),
+                args.requests)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main_benchmark()
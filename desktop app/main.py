@@ -1,11 +1,24 @@
 import sys
+import io
+import os
+import json
+import re
+import time
+import uuid
+import zlib
+import sqlite3
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QFileDialog, 
-                             QTableWidget, QTableWidgetItem, QTabWidget, 
+                             QTableView, QTabWidget, 
                              QMessageBox, QGroupBox, QHeaderView, QLineEdit,
                              QStackedWidget, QFormLayout, QListWidget, QListWidgetItem)
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import (Qt, QAbstractTableModel, QModelIndex, QVariant, QObject,
+                          QRunnable, QThreadPool, pyqtSignal)
 from PyQt5.QtGui import QFont
 
 # Matplotlib imports for PyQt5
@@ -15,6 +28,17 @@ from matplotlib.figure import Figure
 # --- Configuration ---
 API_BASE_URL = "https://chemicalrg-d7cjcxaaa6a7a4he.southeastasia-01.azurewebsites.net/api"
 
+# (connect, read) timeouts in seconds; uploads wait longer for the analysis.
+REQUEST_TIMEOUT = (5, 60)
+UPLOAD_TIMEOUT = (5, 300)
+# Idempotent requests are retried on connection errors and 502/503/504.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+# Downloaded history summaries, datasets and row pages are kept here, least recently used evicted first.
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".chemical_visualizer", "history_cache.sqlite3")
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 STYLESHEET = """
     QWidget {
         background-color: #f5f6fa;
@@ -67,14 +91,181 @@ STYLESHEET = """
     }
 """
 
+class Cancelled(Exception):
+    """Raised inside a background call once its task has been cancelled."""
+
+class MultipartFileBody:
+    """A multipart/form-data body for one file that is streamed while it is sent.
+
+    ``requests`` reads it in blocks, which lets us report upload progress and
+    abort mid-way instead of building the whole body in memory first.
+    """
+    def __init__(self, field, file_path, progress=None, is_cancelled=None):
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path)
+        head = (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: text/csv\r\n\r\n').encode()
+        tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self.file = open(file_path, 'rb')
+        self.parts = [io.BytesIO(head), self.file, io.BytesIO(tail)]
+        self.total = len(head) + os.path.getsize(file_path) + len(tail)
+        self.sent = 0
+        self.progress = progress
+        self.is_cancelled = is_cancelled
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size=-1):
+        if self.is_cancelled and self.is_cancelled():
+            raise Cancelled()
+        chunk = b''
+        while self.parts and (size < 0 or len(chunk) < size):
+            piece = self.parts[0].read(-1 if size < 0 else size - len(chunk))
+            if not piece:
+                self.parts.pop(0)
+                continue
+            chunk += piece
+        self.sent += len(chunk)
+        if self.progress:
+            self.progress(self.sent, self.total)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+class HistoryCache:
+    """On-disk LRU cache of history responses (summaries, datasets and row pages).
+
+    Entries live in a small SQLite database as zlib-compressed JSON together
+    with the ETag they were served with and how long they may be used
+    without asking the server again. When the total size goes over
+    ``max_bytes`` the least recently opened entries are dropped.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared by the worker threads; every access holds self.lock.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                fresh_until REAL NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.db.commit()
+
+    def get(self, key):
+        """Return ``(etag, fresh, data)`` for a cached entry, or ``None``."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, fresh_until, body FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        etag, fresh_until, body = row
+        return etag, fresh_until > now, json.loads(zlib.decompress(body))
+
+    def put(self, key, etag, body, max_age=0):
+        """Store a raw JSON response body."""
+        compressed = zlib.compress(body, 6)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, etag, fresh_until, body, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, now + max_age, compressed, len(compressed), now))
+            self.evict()
+            self.db.commit()
+
+    def touch(self, key, max_age=0):
+        """Mark an entry as confirmed current by the server."""
+        with self.lock:
+            self.db.execute("UPDATE entries SET fresh_until = ? WHERE key = ?", (time.time() + max_age, key))
+            self.db.commit()
+
+    def evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+def max_age(response):
+    """Seconds a response may be reused without revalidation (Cache-Control)."""
+    cache_control = response.headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    return int(match.group(1)) if match else 0
+
+# What the dashboard needs to show an upload without its rows
+SUMMARY_FIELDS = ('id', 'total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature',
+                  'type_distribution')
+
 class APIManager:
-    """Handles API requests and stores the authentication token."""
-    def __init__(self):
+    """Handles API requests and stores the authentication token.
+
+    All calls share one ``requests.Session``, so connections to the server
+    are pooled and kept alive instead of paying a TCP+TLS handshake each
+    time. Responses are requested compressed (gzip/deflate, plus br when a
+    brotli package is installed) and decoded transparently.
+    """
+    def __init__(self, timeout=REQUEST_TIMEOUT, upload_timeout=UPLOAD_TIMEOUT,
+                 retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
         self.token = None
         self.user_data = None
+        self.username = None
+        self.cache = None
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.session = self.create_session(retries, backoff)
+
+    @staticmethod
+    def create_session(retries, backoff):
+        session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+            raise_on_status=False
+        )
+        # Enough connections for every worker thread in the task pool.
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=QThreadPool.globalInstance().maxThreadCount(),
+                              max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        return session
 
     def set_token(self, token):
         self.token = token
+        if token is None:
+            self.username = None
+
+    def get_cache(self):
+        if self.cache is None:
+            try:
+                self.cache = HistoryCache()
+            except (OSError, sqlite3.Error):
+                # No writable cache location: just always download.
+                self.cache = False
+        return self.cache or None
 
     def get_headers(self):
         if self.token:
@@ -83,13 +274,14 @@ class APIManager:
 
     def login(self, username, password):
         try:
-            response = requests.post(f"{API_BASE_URL}/login/", data={
+            response = self.session.post(f"{API_BASE_URL}/login/", data={
                 'username': username, 
                 'password': password
-            })
+            }, timeout=self.timeout)
             if response.status_code == 200:
                 data = response.json()
                 self.token = data.get('access')
+                self.username = username
                 return True, "Login Successful"
             else:
                 return False, response.json().get('detail', 'Login Failed')
@@ -98,11 +290,11 @@ class APIManager:
 
     def register(self, username, email, password):
         try:
-            response = requests.post(f"{API_BASE_URL}/register/", data={
+            response = self.session.post(f"{API_BASE_URL}/register/", data={
                 'username': username,
                 'email': email,
                 'password': password
-            })
+            }, timeout=self.timeout)
             if response.status_code == 201:
                 return True, "Registration Successful"
             else:
@@ -110,27 +302,37 @@ class APIManager:
         except Exception as e:
             return False, str(e)
 
-    def upload_file(self, file_path):
+    def upload_file(self, file_path, progress=None, is_cancelled=None):
+        body = None
         try:
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(
-                    f"{API_BASE_URL}/upload/", 
-                    files=files, 
-                    headers=self.get_headers()
-                )
+            body = MultipartFileBody('file', file_path, progress, is_cancelled)
+            headers = dict(self.get_headers(), **{'Content-Type': body.content_type})
+            # Rows are paged in from history/<id>/rows/ when they are viewed.
+            response = self.session.post(
+                f"{API_BASE_URL}/upload/", 
+                params={'include': 'summary'},
+                data=body, 
+                headers=headers,
+                timeout=self.upload_timeout
+            )
             if response.status_code == 200:
                 return True, response.json()
             else:
                 return False, response.text
+        except Cancelled:
+            raise
         except Exception as e:
             return False, str(e)
+        finally:
+            if body is not None:
+                body.close()
 
     def get_history(self):
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{API_BASE_URL}/history/", 
-                headers=self.get_headers()
+                headers=self.get_headers(),
+                timeout=self.timeout
             )
             if response.status_code == 200:
                 return True, response.json()
@@ -139,22 +341,209 @@ class APIManager:
         except Exception as e:
             return False, str(e)
             
-    def get_history_detail(self, history_id):
+    def read_ndjson(self, response, progress=None, is_cancelled=None, rows_key='raw_data'):
+        """Read a ``?stream=ndjson`` history response as it arrives.
+
+        The first line is the upload's summary and every later line one
+        row, so rows are parsed while the rest is still downloading and
+        progress is reported in rows against ``total_count``.
+        """
+        data, rows = None, []
+        for line in response.iter_lines(chunk_size=64 * 1024):
+            if is_cancelled and is_cancelled():
+                response.close()
+                raise Cancelled()
+            if not line:
+                continue
+            if data is None:
+                data = json.loads(line)
+                continue
+            rows.append(json.loads(line))
+            if progress and len(rows) % 1000 == 0:
+                progress(len(rows), max(data.get('total_count') or 0, len(rows)))
+        if data is None:
+            raise ValueError("Empty response from server")
+        data[rows_key] = rows
+        return data
+
+    def cached_get(self, key, url, params, read=None, **read_kwargs):
+        """GET a JSON response, served from the local cache while it is still current.
+
+        A stale entry is revalidated with its ETag, and used as it is when
+        the server can't be reached. ``read`` parses a streamed response
+        as it arrives (e.g. ``read_ndjson``) instead of all at once.
+        """
+        cache = self.get_cache()
+        key = f"{API_BASE_URL}|{self.username}|{key}"
+        cached = cache.get(key) if cache else None
+        if cached and cached[1]:
+            return True, cached[2]
+
+        headers = self.get_headers()
+        if cached and cached[0]:
+            headers['If-None-Match'] = cached[0]
         try:
-            response = requests.get(
-                f"{API_BASE_URL}/history/{history_id}/", 
-                headers=self.get_headers()
-            )
+            response = self.session.get(url, params=params, headers=headers, stream=read is not None,
+                                        timeout=self.timeout)
+            if response.status_code == 304 and cached:
+                response.close()
+                cache.touch(key, max_age(response))
+                return True, cached[2]
             if response.status_code == 200:
-                return True, response.json()
+                if read is None:
+                    data, body = response.json(), response.content
+                else:
+                    data = read(response, **read_kwargs)
+                    body = json.dumps(data).encode()
+                if cache:
+                    cache.put(key, response.headers.get('ETag'), body, max_age(response))
+                return True, data
             else:
                 return False, response.text
+        except Cancelled:
+            raise
+        except requests.RequestException as e:
+            # Offline or server unreachable: fall back to the cached copy.
+            if cached:
+                return True, cached[2]
+            return False, str(e)
         except Exception as e:
             return False, str(e)
 
+    def get_history_rows(self, history_id, offset=0, limit=500):
+        """Fetch one page of an upload's rows (cached like the summary)."""
+        return self.cached_get(f"{history_id}|rows|{offset}|{limit}",
+                               f"{API_BASE_URL}/history/{history_id}/rows/",
+                               {'offset': offset, 'limit': limit})
+
+    def get_history_detail(self, history_id, fields=SUMMARY_FIELDS, progress=None, is_cancelled=None):
+        """Fetch an upload, by default without its rows.
+
+        With ``fields=None`` the whole dataset is downloaded as NDJSON and
+        its rows are parsed as they stream in.
+        """
+        url = f"{API_BASE_URL}/history/{history_id}/"
+        if fields:
+            return self.cached_get(f"{history_id}|" + ",".join(fields), url, {'fields': ",".join(fields)})
+        return self.cached_get(f"{history_id}|all", url, {'stream': 'ndjson'}, read=self.read_ndjson,
+                               progress=progress, is_cancelled=is_cancelled)
+
 # Global API Manager instance
 api_manager = APIManager()
 
+class TaskSignals(QObject):
+    progress = pyqtSignal(object, int, int)
+    finished = pyqtSignal(object, bool, object)
+
+class ApiTask(QRunnable):
+    """One APIManager call, run on a QThreadPool thread."""
+    def __init__(self, key, func, args, kwargs, with_progress=False):
+        super().__init__()
+        # The TaskManager owns the Python object; don't let Qt delete it.
+        self.setAutoDelete(False)
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.with_progress = with_progress
+        self.callbacks = []
+        self.signals = TaskSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def matches(self, func, args, kwargs):
+        return (self.func, self.args, self.kwargs) == (func, args, kwargs)
+
+    def report_progress(self, done, total):
+        self.signals.progress.emit(self, done, total)
+
+    def run(self):
+        if self.is_cancelled():
+            # Still report back, so the TaskManager lets go of the task.
+            self.signals.finished.emit(self, False, "Cancelled")
+            return
+        kwargs = dict(self.kwargs)
+        if self.with_progress:
+            kwargs.update(progress=self.report_progress, is_cancelled=self.is_cancelled)
+        try:
+            success, result = self.func(*self.args, **kwargs)
+        except Cancelled:
+            success, result = False, "Cancelled"
+        except Exception as e:
+            success, result = False, str(e)
+        self.signals.finished.emit(self, success, result)
+
+class TaskManager(QObject):
+    """Runs network calls off the GUI thread.
+
+    Tasks are keyed by what they are for ('history-list', 'upload', ...).
+    Submitting the same call again while it is running shares the running
+    request instead of queueing a duplicate; submitting a different call
+    under the same key cancels the older one. Callbacks always run on the
+    GUI thread and never fire for cancelled tasks.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self.tasks = {}
+        # Cancelled tasks that are still running; the pool points at them,
+        # so they are kept alive until their finished signal arrives.
+        self.cancelled = set()
+
+    def run(self, key, func, *args, on_done=None, on_progress=None, with_progress=False, **kwargs):
+        task = self.tasks.get(key)
+        if task is not None and task.matches(func, args, kwargs):
+            task.callbacks.append((on_done, on_progress))
+            return task
+        self.cancel(key)
+
+        task = ApiTask(key, func, args, kwargs, with_progress)
+        task.callbacks.append((on_done, on_progress))
+        task.signals.progress.connect(self._on_progress)
+        task.signals.finished.connect(self._on_finished)
+        self.tasks[key] = task
+        self.pool.start(task)
+        return task
+
+    def is_running(self, key):
+        return key in self.tasks
+
+    def cancel(self, key):
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+            if not self.pool.tryTake(task):
+                self.cancelled.add(task)
+
+    def cancel_all(self):
+        for key in list(self.tasks):
+            self.cancel(key)
+
+    def _on_progress(self, task, done, total):
+        if task.is_cancelled():
+            return
+        for _, on_progress in task.callbacks:
+            if on_progress:
+                on_progress(done, total)
+
+    def _on_finished(self, task, success, result):
+        self.cancelled.discard(task)
+        if self.tasks.get(task.key) is task:
+            del self.tasks[task.key]
+        if task.is_cancelled():
+            return
+        for on_done, _ in task.callbacks:
+            if on_done:
+                on_done(success, result)
+
+# Global Task Manager instance
+task_manager = TaskManager()
+
 class MplCanvas(FigureCanvas):
     """A simple class to display Matplotlib plots in PyQt."""
     def __init__(self, parent=None, width=5, height=4, dpi=100):
@@ -162,6 +551,113 @@ class MplCanvas(FigureCanvas):
         self.axes = self.fig.add_subplot(111)
         super(MplCanvas, self).__init__(self.fig)
 
+class RowTableModel(QAbstractTableModel):
+    """Table model that keeps rows as one list per column.
+
+    Qt only asks for the cells that are on screen, so nothing is allocated
+    per cell. When the model is bound to a history id instead of a list of
+    rows, uploads of up to ``STREAM_ROWS`` rows are downloaded whole in one
+    streamed request; the rows of larger ones are fetched in pages as the
+    view scrolls towards the end.
+    """
+    PAGE_SIZE = 500
+    STREAM_ROWS = 20000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = []
+        self.values = []
+        self.loaded = 0
+        self.total = 0
+        self.history_id = None
+        self.fetching = False
+
+    def set_rows(self, rows):
+        """Show an already downloaded list of row dicts."""
+        task_manager.cancel('table-rows')
+        self.fetching = False
+        self.beginResetModel()
+        self.history_id = None
+        self.columns = list(rows[0].keys()) if rows else []
+        self.values = [[row.get(name, "") for row in rows] for name in self.columns]
+        self.loaded = self.total = len(rows)
+        self.endResetModel()
+
+    def set_source(self, history_id, total):
+        """Fetch the rows of ``history_id`` from the server on demand."""
+        task_manager.cancel('table-rows')
+        self.fetching = False
+        self.beginResetModel()
+        self.history_id = history_id
+        self.columns, self.values = [], []
+        self.loaded, self.total = 0, total or 0
+        self.endResetModel()
+        if 0 < self.total <= self.STREAM_ROWS:
+            self.fetching = True
+            task_manager.run('table-rows', api_manager.get_history_detail, history_id, fields=None,
+                             with_progress=True, on_done=self.rows_loaded)
+        elif self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def append_page(self, rows):
+        if not rows:
+            self.total = self.loaded
+            return
+        if not self.columns:
+            self.beginResetModel()
+            self.columns = list(rows[0].keys())
+            self.values = [[] for _ in self.columns]
+            self.endResetModel()
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + len(rows) - 1)
+        for name, column in zip(self.columns, self.values):
+            column.extend(row.get(name, "") for row in rows)
+        self.loaded += len(rows)
+        self.endInsertRows()
+
+    def canFetchMore(self, parent):
+        return (not parent.isValid() and self.history_id is not None
+                and not self.fetching and self.loaded < self.total)
+
+    def fetchMore(self, parent):
+        self.fetching = True
+        task_manager.run('table-rows', api_manager.get_history_rows, self.history_id,
+                         offset=self.loaded, limit=self.PAGE_SIZE, on_done=self.page_loaded)
+
+    def page_loaded(self, success, data):
+        self.fetching = False
+        if success:
+            self.total = data.get('count', self.total)
+            self.append_page(data.get('results', []))
+        else:
+            # Stop asking until the source is reset.
+            self.total = self.loaded
+
+    def rows_loaded(self, success, data):
+        self.fetching = False
+        if success:
+            self.append_page(data.get('raw_data', []))
+        # Everything there is has been loaded.
+        self.total = self.loaded
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            value = self.values[index.column()][index.row()]
+            return "" if value is None else str(value)
+        return QVariant()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal:
+            return self.columns[section] if section < len(self.columns) else QVariant()
+        return str(section + 1)
+
 class LoginWindow(QWidget):
     def __init__(self, switch_callback):
         super().__init__()
@@ -223,7 +719,13 @@ class LoginWindow(QWidget):
             QMessageBox.warning(self, "Error", "Please fill in all fields")
             return
 
-        success, message = api_manager.login(username, password)
+        self.login_btn.setEnabled(False)
+        self.login_btn.setText("Logging in...")
+        task_manager.run('login', api_manager.login, username, password, on_done=self.on_login_done)
+
+    def on_login_done(self, success, message):
+        self.login_btn.setEnabled(True)
+        self.login_btn.setText("Login")
         if success:
             self.switch_callback("dashboard")
         else:
@@ -291,7 +793,12 @@ class RegisterWindow(QWidget):
             QMessageBox.warning(self, "Error", "Please fill in all fields")
             return
 
-        success, message = api_manager.register(username, email, password)
+        self.register_btn.setEnabled(False)
+        task_manager.run('register', api_manager.register, username, email, password,
+                         on_done=self.on_register_done)
+
+    def on_register_done(self, success, message):
+        self.register_btn.setEnabled(True)
         if success:
             QMessageBox.information(self, "Success", "Registration successful! Please login.")
             self.switch_callback("login")
@@ -362,6 +869,13 @@ class DashboardWindow(QWidget):
         self.upload_btn.clicked.connect(self.upload_file)
         left_panel.addWidget(self.upload_btn)
 
+        self.cancel_upload_btn = QPushButton("Cancel Upload")
+        self.cancel_upload_btn.setStyleSheet("background-color: #e74c3c; color: white;")
+        self.cancel_upload_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_upload_btn.clicked.connect(self.cancel_upload)
+        self.cancel_upload_btn.hide()
+        left_panel.addWidget(self.cancel_upload_btn)
+
         # Summary Group Box
         self.summary_group = QGroupBox("Analysis Summary")
         self.summary_layout = QVBoxLayout()
@@ -382,7 +896,7 @@ class DashboardWindow(QWidget):
         left_panel.addStretch()
         
         # RIGHT PANEL (Chart & Table)
-        right_panel = QTabWidget()
+        self.right_panel = right_panel = QTabWidget()
         
         # Chart Tab
         self.chart_tab = QWidget()
@@ -394,9 +908,18 @@ class DashboardWindow(QWidget):
         # Table Tab
         self.table_tab = QWidget()
         table_layout = QVBoxLayout(self.table_tab)
-        self.table = QTableWidget()
+        self.table_model = RowTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Fixed row heights so Qt never measures rows that are off screen.
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(24)
         table_layout.addWidget(self.table)
         right_panel.addTab(self.table_tab, "📋 Raw Data")
+        # Rows of the current upload, fetched once the Raw Data tab is opened
+        self.pending_rows = None
+        right_panel.currentChanged.connect(self.on_data_tab_change)
 
         layout.addLayout(left_panel, 1)
         layout.addWidget(right_panel, 3)
@@ -427,9 +950,12 @@ class DashboardWindow(QWidget):
             self.refresh_history()
 
     def refresh_history(self):
-        self.history_list.clear()
-        success, data = api_manager.get_history()
+        # Switching tabs quickly shares one in-flight request.
+        task_manager.run('history-list', api_manager.get_history, on_done=self.on_history_loaded)
+
+    def on_history_loaded(self, success, data):
         if success:
+            self.history_list.clear()
             for item in data:
                 label = f"ID: {item.get('id')} | Date: {item.get('upload_time')} | Items: {item.get('total_count')}"
                 list_item = QListWidgetItem(label)
@@ -446,22 +972,29 @@ class DashboardWindow(QWidget):
 
     def load_selected_history(self):
         if hasattr(self, 'selected_history_id'):
-            success, data = api_manager.get_history_detail(self.selected_history_id)
-            if success:
-                ui_data = {
-                    'summary': {
-                        'total_count': data.get('total_count'),
-                        'avg_flowrate': data.get('avg_flowrate'),
-                        'avg_pressure': data.get('avg_pressure'),
-                        'avg_temperature': data.get('avg_temperature'),
-                        'type_distribution': data.get('type_distribution')
-                    },
-                    'raw_data': data.get('raw_data')
-                }
-                self.update_ui(ui_data)
-                self.tabs.setCurrentIndex(0)
-            else:
-                QMessageBox.warning(self, "Error", "Failed to load details")
+            self.load_btn.setEnabled(False)
+            self.load_btn.setText("Loading...")
+            task_manager.run('history-detail', api_manager.get_history_detail, self.selected_history_id,
+                             on_done=self.on_detail_loaded)
+
+    def on_detail_loaded(self, success, data):
+        self.load_btn.setEnabled(True)
+        self.load_btn.setText("Load into Analysis View")
+        if success:
+            ui_data = {
+                'summary': {
+                    'total_count': data.get('total_count'),
+                    'avg_flowrate': data.get('avg_flowrate'),
+                    'avg_pressure': data.get('avg_pressure'),
+                    'avg_temperature': data.get('avg_temperature'),
+                    'type_distribution': data.get('type_distribution')
+                },
+                'history_id': data.get('id')
+            }
+            self.update_ui(ui_data)
+            self.tabs.setCurrentIndex(0)
+        else:
+            QMessageBox.warning(self, "Error", "Failed to load details")
 
     def upload_file(self):
         options = QFileDialog.Options()
@@ -470,17 +1003,32 @@ class DashboardWindow(QWidget):
         if file_path:
             self.upload_btn.setText("Uploading...")
             self.upload_btn.setEnabled(False)
-            
-            success, data = api_manager.upload_file(file_path)
-            
-            if success:
-                self.update_ui(data)
-                QMessageBox.information(self, "Success", "File analyzed successfully!")
-            else:
-                QMessageBox.critical(self, "Error", f"Upload failed: {data}")
-            
-            self.upload_btn.setText("📂 Upload CSV File")
-            self.upload_btn.setEnabled(True)
+            self.cancel_upload_btn.show()
+            task_manager.run('upload', api_manager.upload_file, file_path, with_progress=True,
+                             on_progress=self.on_upload_progress, on_done=self.on_upload_done)
+
+    def on_upload_progress(self, done, total):
+        if done < total:
+            self.upload_btn.setText(f"Uploading... {done * 100 // total}%")
+        else:
+            self.upload_btn.setText("Analyzing...")
+
+    def on_upload_done(self, success, data):
+        self.reset_upload_button()
+        if success:
+            self.update_ui(data)
+            QMessageBox.information(self, "Success", "File analyzed successfully!")
+        else:
+            QMessageBox.critical(self, "Error", f"Upload failed: {data}")
+
+    def cancel_upload(self):
+        task_manager.cancel('upload')
+        self.reset_upload_button()
+
+    def reset_upload_button(self):
+        self.upload_btn.setText("📂 Upload CSV File")
+        self.upload_btn.setEnabled(True)
+        self.cancel_upload_btn.hide()
 
     def update_ui(self, data):
         summary = data.get("summary", {})
@@ -504,21 +1052,28 @@ class DashboardWindow(QWidget):
             self.canvas.draw()
         
         # 3. Update Table
+        self.pending_rows = None
         if raw_data:
-            columns = list(raw_data[0].keys())
-            self.table.setColumnCount(len(columns))
-            self.table.setHorizontalHeaderLabels(columns)
-            self.table.setRowCount(len(raw_data))
-            
-            for row_idx, row_data in enumerate(raw_data):
-                for col_idx, header in enumerate(columns):
-                    item_val = str(row_data.get(header, ""))
-                    self.table.setItem(row_idx, col_idx, QTableWidgetItem(item_val))
-            
-            header = self.table.horizontalHeader()
-            header.setSectionResizeMode(QHeaderView.Stretch)
+            self.table_model.set_rows(raw_data)
+        elif data.get('history_id'):
+            # Rows were not sent along; page them in from the server once
+            # someone looks at them.
+            self.table_model.set_rows([])
+            self.pending_rows = (data['history_id'], summary.get('total_count'))
+            if self.right_panel.currentWidget() is self.table_tab:
+                self.load_pending_rows()
         else:
-            self.table.setRowCount(0)
+            self.table_model.set_rows([])
+
+    def on_data_tab_change(self, index):
+        if self.right_panel.widget(index) is self.table_tab:
+            self.load_pending_rows()
+
+    def load_pending_rows(self):
+        if self.pending_rows is not None:
+            history_id, total = self.pending_rows
+            self.pending_rows = None
+            self.table_model.set_source(history_id, total)
 
 class ChemicalApp(QMainWindow):
     def __init__(self):
@@ -554,6 +1109,7 @@ class ChemicalApp(QMainWindow):
             self.central_widget.setCurrentWidget(self.dashboard_screen)
 
     def logout(self):
+        task_manager.cancel_all()
         api_manager.set_token(None)
         self.switch_screen("login")
 
@@ -561,6 +1117,8 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     
+    app.aboutToQuit.connect(task_manager.cancel_all)
+
     window = ChemicalApp()
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file